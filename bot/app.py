@@ -1,38 +1,119 @@
 # Trust or Bust — English Game (app.py)
 # aiogram v3, утро/вечер, выбор уровня, «замена ключевого слова»,
 
-import os, csv, random, re
-from io import StringIO
-from dataclasses import dataclass, field
+import os, sys, time, random, asyncio
+from startup import PROFILE  # первым: отсчёт холодного старта
+from dataclasses import replace
+from datetime import date
 from typing import List, Dict, Optional
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery, FSInputFile, BufferedInputFile
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+PROFILE.mark("import aiogram")
+
+from assets import FileIdCache, asset_key, export_key
+from banks import WORD_BANK, STAGE1_EXAMPLES, ALT_OK, B1_ADJ
+from breaker import CircuitOpenError
+from bundle import load_bundle
+from content import ContentCache
+from distractors import swap_word_everywhere, swap_with_highlight
+from episodes import END, EpisodeLibrary, scene_path
+from export import CsvGzSpool
+from guard import setup_guard, with_step
+from leaderboard import GLOBAL, Leaderboard
+from metrics import REGISTRY
+from models import Example, WordCard, EveningItem, UserState, dump_state, load_state
+from observability import add_routes, handler_stats, instrument_bot, instrument_dispatcher, serve
+from sender import SendScheduler, setup_outbox, setup_sender
+from state import StateRegistry, make_backend
+PROFILE.mark("import game modules")
 
 try:
     from db import (
+        DATABASE_URL,
         ensure_user,
-        start_session,
+        begin_session,
         finish_session,
-        append_result,
+        db_status,
+        log_result,
+        get_user_stats,
+        RESULT_WRITER,
         get_pool,
+        current_pool,
+        query_stats,
+        listen,
+        ensure_schema,
+        warm_up,
+        refresh_leaderboard,
+        leaderboard_top,
+        leaderboard_rank,
+        pick_review_deck,
+        load_file_id,
+        save_file_id,
+        forget_file_id,
     )
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is missing")
+    DB_ENABLED = True
 except Exception:
     # fallback на случай локального запуска без БД
+    DB_ENABLED = False
     async def ensure_user(tg_id: int) -> int: return 0
-    async def start_session(user_id: int, level: str) -> int: return 0
+    async def begin_session(tg_id: int, level: str): return 0, 0
     async def finish_session(session_id: int, final_balance: int): pass
-    async def append_result(*args, **kwargs): pass
+    def log_result(*args, **kwargs): pass
+    async def get_user_stats(user_id: int) -> dict:
+        raise RuntimeError("DB is unavailable in fallback mode")
+    RESULT_WRITER = None
     async def get_pool():  # чтобы код не падал, если где-то вызовется
         raise RuntimeError("DB pool is unavailable in fallback mode")
+    def current_pool(): return None
+    listen = None
+    def query_stats(top: int = 10): return []
+    async def ensure_schema(): pass
+    async def warm_up(timeout: float = 10.0) -> dict: return {}
+    async def refresh_leaderboard(timeout=None) -> bool: return False
+    async def leaderboard_top(limit: int = 10) -> list: return []
+    async def leaderboard_rank(user_id: int) -> dict: return {}
+    async def pick_review_deck(*args, **kwargs) -> list: return []
+    load_file_id = save_file_id = forget_file_id = None  # file_id только в памяти процесса
+PROFILE.mark("import db")
 
 
 # ---------- CONFIG ----------
-BOT_TOKEN = os.environ.get("BOT_TOKEN", "").strip()
-if not BOT_TOKEN:
-    raise RuntimeError("BOT_TOKEN is missing")
+BOT_TOKEN = os.environ.get("BOT_TOKEN", "").strip()  # проверяется в main(), не на импорте
+
+# Доставка апдейтов: polling (по умолчанию) | webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling").strip().lower()
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "").strip()
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/tg/webhook").strip()
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "").strip() or None
+WEBHOOK_MAX_INFLIGHT = int(os.environ.get("WEBHOOK_MAX_INFLIGHT", "100"))
+PORT = int(os.environ.get("PORT", "8080"))
+# /metrics и /healthz в polling-режиме (в webhook-режиме — на том же сервере); 0 — выключить
+METRICS_PORT = int(os.environ.get("METRICS_PORT", str(PORT)))
+
+# Лимиты отправки (token bucket): сообщений/с на бота, на чат и burst чата
+TG_GLOBAL_RPS = float(os.environ.get("TG_GLOBAL_RPS", "25"))
+TG_CHAT_RPS = float(os.environ.get("TG_CHAT_RPS", "1"))
+TG_CHAT_BURST = float(os.environ.get("TG_CHAT_BURST", "3"))
+
+# Экспорт: строк за один fetch курсора и лимит на размер .csv.gz (у Bot API потолок 50 МБ)
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "500"))
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+# file_id загруженных файлов в памяти (LRU); остальные — в tg_file_ids
+FILE_ID_CACHE_SIZE = int(os.environ.get("FILE_ID_CACHE_SIZE", "5000"))
+
+CONTENT_REFRESH_SEC = float(os.environ.get("CONTENT_REFRESH_SEC", "600"))
+CONTENT_CACHE_MODE = os.environ.get("CONTENT_CACHE_MODE", "full").strip() or "full"  # full | ids
+CONTENT_BUNDLE_PATH = os.environ.get("CONTENT_BUNDLE_PATH", "content/bundle.bin").strip()
+DB_WARMUP_TIMEOUT = float(os.environ.get("DB_WARMUP_TIMEOUT", "10"))
+# /top: как часто пересчитывать представление leaderboard и сколько мест держать в памяти
+LEADERBOARD_REFRESH_SEC = float(os.environ.get("LEADERBOARD_REFRESH_SEC", "300"))
+LEADERBOARD_TOP_N = int(os.environ.get("LEADERBOARD_TOP_N", "10"))
 
 # BAD_DB_SHARE = 0.05  # ~ % берем из examples.kind='bad', остальное генерим подменой
 
@@ -48,140 +129,29 @@ GREEN = "🟢"
 ARROW = "➡️"
 DOC   = "📄"
 FLAG  = "🏁"
+BOOK  = "📖"
 
 # ---------- DATA ----------
-@dataclass
-class Example:
-    text: str
-    text_ru: str
-    uses: List[str]
-    is_correct: bool
-    employee_proposal: Optional[str] = None
-    employee_proposal_ru: Optional[str] = None
-    error_type: Optional[str] = None
-    error_highlight: List[str] = field(default_factory=list)
-    explanation: Optional[str] = None
-    correct_note: Optional[str] = None
-
-@dataclass
-class WordCard:
-    word: str
-    translation: str
-
-@dataclass
-class EveningItem:
-    example: Example
-    employee_card: bool  # True=считает верным, False=считает неверным
-
-@dataclass
-class UserState:
-    stage: str = "idle"
-    level: str = "A2"
-    pos: str = "adjectives"
-    balance: int = 0
-    session_id: int = 0
-    deck: List[WordCard] = field(default_factory=list)
-    word2id: Dict[str, int] = field(default_factory=dict)
-    morning_idx: int = 0
-    evening_idx: int = 0
-    evening_queue: List[EveningItem] = field(default_factory=list)
-    results: List[Dict] = field(default_factory=list)
-    study_bank: Dict[str, List[tuple]] = field(default_factory=dict)
-
-
-USERS: Dict[int, UserState] = {}
-
-# ---------- BANKS ----------
-A2_ADJ = [WordCard("big","большой"), WordCard("small","маленький"),
-          WordCard("easy","лёгкий"), WordCard("hard","трудный"),
-          WordCard("busy","занятой")]
-
-B1_ADJ = [
-    WordCard("reliable","надёжный"),
-    WordCard("efficient","эффективный"),
-    WordCard("flexible","гибкий"),
-    WordCard("confident","уверенный"),
-    WordCard("accurate","точный"),
-    WordCard("productive","продуктивный"),
-    WordCard("creative","креативный"),
-]
-
-B2_ADJ = [
-    WordCard("meticulous","дотошный"),
-    WordCard("versatile","разносторонний"),
-    WordCard("robust","надёжный/устойчивый"),
-    WordCard("scalable","масштабируемый"),
-    WordCard("redundant","избыточный"),
-]
-
-C1_ADJ = [
-    WordCard("meticulous","дотошный"),
-    WordCard("versatile","разносторонний"),
-    WordCard("robust","надёжный/устойчивый"),
-    WordCard("scalable","масштабируемый"),
-    WordCard("redundant","избыточный"),
-]
-
-C2_ADJ = [
-    WordCard("meticulous","дотошный"),
-    WordCard("versatile","разносторонний"),
-    WordCard("robust","надёжный/устойчивый"),
-    WordCard("scalable","масштабируемый"),
-    WordCard("redundant","избыточный"),
-]
-
-WORD_BANK: Dict[str, List[WordCard]] = {
-    "A2": A2_ADJ,   
-    "B1": B1_ADJ,
-    "B2": B2_ADJ,
-    "C1": C1_ADJ,
-    "C2": C2_ADJ,
-}
-
-# Утренние (один корректный пример на слово)
-STAGE1_EXAMPLES: Dict[str, Example] = {
-    "reliable":  Example("Our team is reliable and finishes tasks on time.",
-                         "Наша команда надёжная и завершает задачи вовремя.", ["reliable"], True),
-    "efficient": Example("This tool is efficient for our project.",
-                         "Этот инструмент эффективен для нашего проекта.", ["efficient"], True),
-    "flexible":  Example("We need a flexible plan for the week.",
-                         "Нам нужен гибкий план на неделю.", ["flexible"], True),
-    "confident": Example("She is confident about the interview.",
-                         "Она уверена насчёт собеседования.", ["confident"], True),
-    "accurate":  Example("We need accurate data for the report.",
-                         "Нам нужны точные данные для отчёта.", ["accurate"], True),
-    "productive":Example("A short break can make you more productive.",
-                         "Короткий перерыв может сделать вас более продуктивным.", ["productive"], True),
-    "creative":  Example("We need a creative idea for this ad.",
-                         "Нам нужна креативная идея для этой рекламы.", ["creative"], True),
-
-    "meticulous": Example("She is meticulous and checks every detail.",
-                          "Она дотошная и проверяет каждую деталь.", ["meticulous"], True),
-    "versatile":  Example("A versatile employee can do many different tasks.",
-                          "Разносторонний сотрудник может выполнять много разных задач.", ["versatile"], True),
-    "robust":     Example("The system is robust and works under heavy load.",
-                          "Система надёжная и работает под высокой нагрузкой.", ["robust"], True),
-    "scalable":   Example("Our product is scalable and can handle more users.",
-                          "Наш продукт масштабируемый и может выдерживать больше пользователей.", ["scalable"], True),
-    "redundant":  Example("This step is redundant in our process.",
-                          "Этот шаг избыточен в нашем процессе.", ["redundant"], True),
-}
-
-# Вечерние альтернативы (чтобы не повторять утренний пример)
-ALT_OK: Dict[str, List[Example]] = {
-    "reliable":  [Example("A reliable colleague keeps promises.", "Надёжный коллега держит обещания.", ["reliable"], True)],
-    "efficient": [Example("An efficient team saves time and budget.", "Эффективная команда экономит время и бюджет.", ["efficient"], True)],
-    "flexible":  [Example("Flexible policies help employees.", "Гибкие правила помогают сотрудникам.", ["flexible"], True)],
-    "confident": [Example("I feel confident after preparation.", "Я чувствую уверенность после подготовки.", ["confident"], True)],
-    "accurate":  [Example("Accurate numbers are important for decisions.", "Точные цифры важны для принятия решений.", ["accurate"], True)],
-    "productive":[Example("I had a productive day at work.", "У меня был продуктивный день на работе.", ["productive"], True)],
-    "creative":  [Example("She came up with a creative solution.", "Она придумала креативное решение.", ["creative"], True)],
-    "meticulous":[Example("He is meticulous and checks every line.", "Он дотошный и проверяет каждую строчку.", ["meticulous"], True)],
-    "versatile": [Example("A versatile tool is useful in many situations.", "Разносторонний инструмент полезен во многих ситуациях.", ["versatile"], True)],
-    "robust":    [Example("This app is robust and rarely crashes.", "Это приложение надёжно и редко падает.", ["robust"], True)],
-    "scalable":  [Example("The platform is scalable for future growth.", "Платформа масштабируема для будущего роста.", ["scalable"], True)],
-    "redundant": [Example("We removed redundant details from the report.", "Мы убрали избыточные детали из отчёта.", ["redundant"], True)],
-}
+# Example / WordCard / EveningItem / UserState — в models.py (их же сериализует хранилище состояний)
+
+# Состояния игроков: не больше STATE_MAX_USERS, простаивающие дольше STATE_TTL_SEC выселяются
+# Хранилище (STATE_BACKEND): memory | postgres (общее для реплик) | dbm (локальный файл)
+USERS: StateRegistry[UserState] = StateRegistry(
+    UserState,
+    max_size=int(os.environ.get("STATE_MAX_USERS", "10000")),
+    ttl_sec=float(os.environ.get("STATE_TTL_SEC", str(6 * 3600))),
+    backend=make_backend(
+        os.environ.get("STATE_BACKEND", "memory"),
+        pool_getter=get_pool,
+        path=os.environ.get("STATE_DBM_PATH", "game_state.dbm"),
+    ),
+    dumps=dump_state,
+    loads=load_state,
+    # dbm: в хранилище — на смене этапа, ходы внутри этапа сбрасываются раз в STATE_SWEEP_SEC;
+    # postgres (общий для реплик) — каждый ход
+    checkpoint=lambda s: (s.stage, s.level, s.day, s.episode),
+)
+STATE_SWEEP_SEC = 60
 
 def kb_intro():
     kb = InlineKeyboardBuilder()
@@ -195,43 +165,55 @@ def kb_process_only_choose_level():
     kb.adjust(1)
     return kb.as_markup()
 
-def kb_main_menu():
+def kb_main_menu(story: bool = False):
     kb = InlineKeyboardBuilder()
     kb.button(text=f"{START_EMOJI} К игре", callback_data="start_day")
+    if story:
+        kb.button(text=f"{BOOK} Сюжет", callback_data="story")
     kb.button(text=f"{MAG} Выбрать уровень", callback_data="choose_level")
     # kb.button(text=f"{EXPORT_EMOJI} Экспорт CSV", callback_data="export_csv")
     kb.adjust(1)
     return kb.as_markup()
 
+LEVELS = ["A2","B1","B2","C1","C2"]
+
 def kb_levels():
     kb = InlineKeyboardBuilder()
-    for lvl in ["A2","B1","B2","C1","C2"]:
+    for lvl in LEVELS:
         kb.button(text=lvl, callback_data=f"set_level:{lvl}")
     kb.adjust(4)
     return kb.as_markup()
 
-def kb_next(label=None, data="morning_next"):
+def issue_step(s: UserState) -> int:
+    """Новый шаг игры: кнопки предыдущих сообщений становятся устаревшими."""
+    s.step += 1
+    return s.step
+
+def kb_next(label=None, data="morning_next", step: int = 0):
     if label is None:
         label = f"{ARROW} К следующему слову"
     kb = InlineKeyboardBuilder()
-    kb.button(text=label, callback_data=data)
+    kb.button(text=label, callback_data=with_step(data, step))
     return kb.as_markup()
 
-def kb_believe():
+def kb_believe(step: int):
     kb = InlineKeyboardBuilder()
-    kb.button(text=f"{CHECK} Верю", callback_data="believe:True")
-    kb.button(text=f"{CROSS} Не верю", callback_data="believe:False")
+    kb.button(text=f"{CHECK} Верю", callback_data=with_step("believe:True", step))
+    kb.button(text=f"{CROSS} Не верю", callback_data=with_step("believe:False", step))
     kb.adjust(2)
     return kb.as_markup()
 
-def kb_after_employee():
+def kb_after_employee(step: int):
     kb = InlineKeyboardBuilder()
-    kb.button(text=f"{GREEN} Ты прав (–€50)", callback_data="dispute:concede")
-    kb.button(text=f"{MAG} Проверим в словаре", callback_data="dispute:check")
+    kb.button(text=f"{GREEN} Ты прав (–€50)", callback_data=with_step("dispute:concede", step))
+    kb.button(text=f"{MAG} Проверим в словаре", callback_data=with_step("dispute:check", step))
     kb.adjust(1)
     return kb.as_markup()
 
 def collect_examples_for_word(word: str) -> List[tuple]:
+    # учебные пары посчитаны при сборке бандла
+    if CONTENT.bundle is not None:
+        return CONTENT.bundle.study_bank.get(word) or []
     pairs: List[tuple] = []
     if word in STAGE1_EXAMPLES:
         e = STAGE1_EXAMPLES[word]
@@ -246,19 +228,6 @@ def collect_examples_for_word(word: str) -> List[tuple]:
             seen.add(key); uniq.append(key)
     return uniq
 
-def _preserve_case(src: str, repl: str) -> str:
-    if src.isupper():
-        return repl.upper()
-    if src and src[0].isupper():
-        return repl.capitalize()
-    return repl
-
-def swap_word_everywhere(text: str, target: str, replacement: str) -> str:
-    pattern = re.compile(rf"\b{re.escape(target)}\b", re.IGNORECASE)
-    def _f(m: re.Match) -> str:
-        return _preserve_case(m.group(0), replacement)
-    return pattern.sub(_f, text)
-
 def make_wrong_swapped_from_bank(base_word: str, deck_words: List[str], study_bank: Dict[str, List[tuple]]) -> Optional[Example]:
     pairs = study_bank.get(base_word) or []
     if not pairs:
@@ -268,7 +237,7 @@ def make_wrong_swapped_from_bank(base_word: str, deck_words: List[str], study_ba
     if not candidates:
         return None
     replacement = random.choice(candidates)
-    swapped = swap_word_everywhere(base_text, base_word, replacement)
+    swapped, highlight = swap_with_highlight(base_text, base_word, replacement)
     if swapped == base_text:
         return None
     return Example(
@@ -279,7 +248,7 @@ def make_wrong_swapped_from_bank(base_word: str, deck_words: List[str], study_ba
         employee_proposal=base_text,
         employee_proposal_ru=base_ru,
         error_type='semantic',
-        error_highlight=[replacement],
+        error_highlight=[highlight or replacement],
         explanation="Ключевое слово подменено на другое изучаемое слово."
     )
 
@@ -291,13 +260,16 @@ async def build_evening_queue(
     deck_words = [c.word for c in deck]
     queue: List[EveningItem] = []
 
+    # пулы для всей колоды одним заходом
+    pools = await db_pick_evening_pools_many([word2id.get(c.word, 0) for c in deck])
+
     for card in deck:
-        ok_pool, bad_pool = await db_pick_evening_pools(word2id.get(card.word, 0))
+        ok_pool, bad_pool = pools.get(word2id.get(card.word, 0), ([], []))
 
         # OK-кандидат (из БД если есть; иначе фолбэк)
         if ok_pool:
             src = random.choice(ok_pool)
-            base_ok = Example(src.text, src.text_ru, [card.word], True)
+            base_ok = replace(src, uses=[card.word])
         else:
             # фолбэк на хардкод
             base_ok = STAGE1_EXAMPLES.get(card.word)
@@ -307,8 +279,14 @@ async def build_evening_queue(
                     f"This is {card.word}.", f"Это {card.word}.", [card.word], True
                 )
 
-        # Генерация BAD
-        dyn_bad = make_wrong_swapped_from_bank(card.word, deck_words, study_bank)
+        # BAD: готовые варианты из БД (сгенерированы сидером); подмена на лету — только фолбэк
+        generated = [b for b in bad_pool if b.employee_proposal]
+        if generated:
+            deck_lower = {w.lower() for w in deck_words}
+            in_deck = [b for b in generated if b.error_highlight and b.error_highlight[0].lower() in deck_lower]
+            dyn_bad = replace(random.choice(in_deck or generated), uses=[card.word])
+        else:
+            dyn_bad = make_wrong_swapped_from_bank(card.word, deck_words, study_bank)
         # db_bad = None
         # if bad_pool:
         #     srcb = random.choice(bad_pool)
@@ -339,67 +317,95 @@ async def build_evening_queue(
 
 
 # --- DB helpers for content (NEW) ---
+# words/examples держим в памяти (см. content.py), в БД за контентом не ходим.
+# Бандл (scripts/build_bundle.py) — контент на старте и пока БД недоступна; грузится в main().
+CONTENT = ContentCache(
+    get_pool, listener=listen, refresh_sec=CONTENT_REFRESH_SEC, mode=CONTENT_CACHE_MODE
+)
 
-async def db_pick_deck(level: str, pos: str, k: int = 5):
-    """Выбрать k слов для колоды по level+pos."""
-    pool = await get_pool()
-    rows = await pool.fetch(
-        """
-        select id, word, translation
-        from words
-        where level = $1 and pos = $2
-        order by random()
-        limit $3
-        """,
-        level, pos, k
-    )
+LEADERBOARD = Leaderboard(
+    refresh_leaderboard, leaderboard_top, leaderboard_rank,
+    refresh_sec=LEADERBOARD_REFRESH_SEC, top_n=LEADERBOARD_TOP_N,
+)
+
+# новых слов-кандидатов на одно место в колоде (review_deck берёт из них ещё не виденные)
+REVIEW_CANDIDATES_PER_CARD = 8
+
+async def db_pick_deck(level: str, pos: str, k: int = 5, user_id: int = 0):
+    """
+    Выбрать k слов для колоды по level+pos.
+    Известному игроку — интервальное повторение (word_mastery): пора повторить → новые → скоро пора.
+    """
+    rows = []
+    if user_id and DB_ENABLED:
+        candidates = CONTENT.sample_ids(level, pos, k * REVIEW_CANDIDATES_PER_CARD)
+        if candidates:
+            try:
+                rows = await CONTENT.deck_rows(await pick_review_deck(user_id, level, pos, candidates, k))
+            except Exception as e:
+                print("review_deck DB ERROR:", repr(e))
+    if not rows and await CONTENT.ensure_loaded():
+        try:
+            rows = await CONTENT.pick_deck(level, pos, k)
+        except Exception as e:
+            print("pick_deck DB ERROR:", repr(e))
     # Вернём WordCard[] и map word->id
-    deck = [WordCard(r["word"], r["translation"]) for r in rows]
-    word2id = {r["word"]: r["id"] for r in rows}
+    deck = [WordCard(word, translation) for _, word, translation in rows]
+    word2id = {word: wid for wid, word, _ in rows}
     return deck, word2id
 
 async def db_pick_morning_example(word_id: int):
     """Корректный пример для утреннего этапа."""
-    pool = await get_pool()
-    row = await pool.fetchrow(
-        """
-        select en, ru
-        from examples
-        where word_id = $1 and kind in ('ok','alt_ok')
-        order by (case when kind='ok' then 0 else 1 end), random()
-        limit 1
-        """,
-        word_id
-    )
-    return (row["en"], row["ru"]) if row else None
+    if not await CONTENT.ensure_loaded():
+        return None
+    try:
+        return await CONTENT.pick_morning_example(word_id)
+    except Exception as e:
+        print("morning example DB ERROR:", repr(e))
+        return None
 
-async def db_pick_evening_pools(word_id: int):
+async def db_pick_evening_pools_many(word_ids: List[int]) -> Dict[int, tuple]:
     """
-    Вернём:
-      ok_pool: список корректных Example,
-      bad_pool: список ошибочных Example
-    Если bad_pool пуст — дальше используем твою подмену (swap_word_everywhere).
+    ok/bad пулы сразу для всей колоды: word_id -> (ok_pool, bad_pool).
+    Из кэша контента (в ids-режиме — один запрос на всю колоду).
     """
-    pool = await get_pool()
-    ok_rows = await pool.fetch(
-        """select en, ru from examples
-           where word_id=$1 and kind in ('ok','alt_ok')""",
-        word_id
-    )
-    bad_rows = await pool.fetch(
-        """select en, ru from examples
-           where word_id=$1 and kind='bad'""",
-        word_id
-    )
-    ok_pool = [Example(r["en"], r["ru"], uses=[], is_correct=True) for r in ok_rows]
-    bad_pool = [Example(r["en"], r["ru"], uses=[], is_correct=False) for r in bad_rows]
-    return ok_pool, bad_pool
+    ids = sorted({wid for wid in word_ids if wid})
+    raw: Dict[int, tuple] = {wid: ([], []) for wid in ids}
+    if ids and await CONTENT.ensure_loaded():
+        try:
+            raw = await CONTENT.evening_pools_many(ids)
+        except Exception as e:
+            print("evening pools DB ERROR:", repr(e))
+
+    pools: Dict[int, tuple] = {}
+    for wid, (ok_rows, bad_rows) in raw.items():
+        bad_pool, wrong_by_src = [], {}
+        for en, ru, repl, highlight, src_en, src_ru in bad_rows:
+            if repl and src_en:
+                bad_pool.append(Example(
+                    en, ru, uses=[], is_correct=False,
+                    employee_proposal=src_en, employee_proposal_ru=src_ru,
+                    error_type="semantic", error_highlight=[highlight or repl],
+                    explanation="Ключевое слово подменено на другое изучаемое слово."
+                ))
+                wrong_by_src.setdefault(src_en, []).append(en)
+            else:
+                bad_pool.append(Example(en, ru, uses=[], is_correct=False))
+        ok_pool = [
+            Example(en, ru, uses=[], is_correct=True, wrong_proposals=wrong_by_src.get(en, []))
+            for en, ru in ok_rows
+        ]
+        pools[wid] = (ok_pool, bad_pool)
+    return pools
 
 def make_employee_wrong_correction_from_correct(ex: Example, deck_words: List[str]) -> Optional[tuple]:
     """
     Из корректного примера делаем «ошибочную правку сотрудника» подменой ключевого слова
     на другое из сегодняшней колоды. Возвращает (wrong_text, same_ru) либо None.
     """
+    if ex.wrong_proposals:
+        # готовый вариант из БД, без подмены на лету
+        return random.choice(ex.wrong_proposals), ex.text_ru
     if not ex.uses:
         return None
     base_word = ex.uses[0]
@@ -414,8 +420,17 @@ def make_employee_wrong_correction_from_correct(ex: Example, deck_words: List[st
 
 
 # ---------- BOT ----------
-bot = Bot(BOT_TOKEN)
+bot: Optional[Bot] = None  # создаётся в main(): без токена модуль импортируется (бенчи, профиль)
 dp = Dispatcher()
+instrument_dispatcher(dp)
+async def current_step(uid: int) -> Optional[int]:
+    s = await USERS.fetch(uid)
+    return s.step if s is not None else None
+
+# апдейты игрока — по одному; дубли и нажатия на старые кнопки отбрасываются (см. guard.py);
+# состояние из общего хранилища читается один раз за апдейт — guard и хендлер видят одну копию
+GUARD = setup_guard(dp, current_step, scope=USERS.update_scope)
+setup_outbox(dp)  # ответы одного шага уходят одним сообщением (см. sender.py)
 
 @dp.message(CommandStart())
 async def on_start(m: Message):
@@ -426,7 +441,7 @@ async def on_start(m: Message):
         suffix = ""
     except Exception:
         suffix = ""
-    USERS[m.from_user.id] = UserState()
+    await USERS.save(m.from_user.id, UserState())
     intro = (
         "👔 Welcome to *Trust or Bust: English Game*!\n\n"
         "Вы владелец маленькой консалтинговой фирмы. Компания выходит на международный рынок и вы с сотрудниками "
@@ -434,10 +449,19 @@ async def on_start(m: Message):
         "Нажми «Какой процесс?».")
     await m.answer(intro + suffix, parse_mode="Markdown", reply_markup=kb_intro())
 
+async def on_lost_state(cb: CallbackQuery):
+    """Кнопка из старой игры, а состояние уже выселено (простой/рестарт)."""
+    await cb.answer()
+    await cb.message.answer(
+        "⏳ Игра прервана после долгого перерыва. Начнём новый день?",
+        reply_markup=kb_main_menu()
+    )
+
 @dp.callback_query(F.data == "show_process")
 async def show_process(cb: CallbackQuery):
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch_or_create(cb.from_user.id)
     s.stage = "process"
+    await USERS.save(cb.from_user.id, s)
     process_text = (
         "Сначала вы договариваетесь с коллегами о словах, затем проверяете друг друга.\n\n"
         "Сотрудник принесет предложения с этими словами. Ваша задача — решить, корректно ли предложение.\n\n"
@@ -457,8 +481,9 @@ async def choose_level(cb: CallbackQuery):
 @dp.callback_query(F.data.startswith("set_level:"))
 async def set_level(cb: CallbackQuery):
     level = cb.data.split(":",1)[1]
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch_or_create(cb.from_user.id)
     s.level = level
+    await USERS.save(cb.from_user.id, s)
     await cb.message.answer(
         f"✅ Уровень установлен: *{level}*\n\nТеперь можно перейти к игре:",
         parse_mode="Markdown",
@@ -496,37 +521,35 @@ async def send_next_morning(msg: Message, s: UserState):
         f"Пример:\n“{sample_ok.text}”\n_{sample_ok.text_ru}_"
     )
     label = "➡️ Перейти к проверке" if n == N else None
-    await msg.answer(text, parse_mode="Markdown", reply_markup=kb_next(label=label, data="morning_next"))
+    await msg.answer(text, parse_mode="Markdown", reply_markup=kb_next(label=label, data="morning_next", step=issue_step(s)))
+
+def word_id_of(s: UserState, ex: Example) -> Optional[int]:
+    """word_id слова, которое проверял пример (для word_mastery); None — слово не из БД."""
+    return s.word2id.get(ex.uses[0]) if ex.uses else None
 
 def collect_study_bank(deck: List[WordCard]) -> Dict[str, List[tuple]]:
-    bank: Dict[str, List[tuple]] = {}
-    for c in deck:
-        pairs = []
-        if c.word in STAGE1_EXAMPLES:
-            e = STAGE1_EXAMPLES[c.word]
-            pairs.append((e.text, e.text_ru))
-        for alt in ALT_OK.get(c.word, []):
-            pairs.append((alt.text, alt.text_ru))
-        # уникализируем
-        seen, uniq = set(), []
-        for t, r in pairs:
-            key = (t.strip(), r.strip())
-            if key not in seen:
-                seen.add(key); uniq.append(key)
-        bank[c.word] = uniq
-    return bank
+    return {c.word: collect_examples_for_word(c.word) for c in deck}
 
 @dp.callback_query(F.data == "start_day")
 async def start_day(cb: CallbackQuery):
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch_or_create(cb.from_user.id)
     s.stage = "morning"
-    s.balance = 0
+    s.balance, s.bonus = s.bonus, 0  # премия эпизода — стартовый капитал дня
     s.results.clear()
     s.morning_idx = 0
     s.evening_idx = 0
 
-    # Пытаемся набрать колоду из БД
-    s.deck, s.word2id = await db_pick_deck(s.level, s.pos, k=5)
+    # старт новой сессии в БД; при недоступной БД — локальная сессия из журнала (session_id < 0)
+    uid = 0
+    try:
+        uid, s.session_id = await begin_session(cb.from_user.id, s.level)
+    except Exception as e:
+        print("start_day DB ERROR:", repr(e))
+        await cb.message.answer(f"⚠️ start_day DB ERROR: {e!r}")
+        s.session_id = 0  # офлайн-режим
+
+    # Пытаемся набрать колоду из БД (с учётом того, что игрок уже знает)
+    s.deck, s.word2id = await db_pick_deck(s.level, s.pos, k=5, user_id=uid)
 
     # Фолбэк на хардкод-банк, если из БД ничего не пришло
     if not s.deck:
@@ -537,32 +560,28 @@ async def start_day(cb: CallbackQuery):
 
     s.study_bank = collect_study_bank(s.deck)
 
-    # старт новой сессии в БД
-    try:
-        uid = await ensure_user(cb.from_user.id)
-        s.session_id = await start_session(uid, s.level)
-    except Exception as e:
-        print("start_day DB ERROR:", repr(e))
-        await cb.message.answer(f"⚠️ start_day DB ERROR: {e!r}")
-        s.session_id = 0  # офлайн-режим
-
     await cb.message.answer("📘 Этап 1: Определимся со словами")
     await send_next_morning(cb.message, s)
+    await USERS.save(cb.from_user.id, s)
     await cb.answer()
 
 
 @dp.callback_query(F.data == "morning_next")
 async def on_morning_next(cb: CallbackQuery):
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch(cb.from_user.id)
+    if s is None:
+        await on_lost_state(cb); return
     if s.stage != "morning":
         await cb.answer("Сейчас не этап слов.", show_alert=True); return
     s.morning_idx += 1
     await send_next_morning(cb.message, s)
+    await USERS.save(cb.from_user.id, s)
     await cb.answer()
 
 async def send_next_evening(msg: Message, s: UserState):
     if s.evening_idx >= len(s.evening_queue):
         s.stage = "done"
+        s.day += 1
         correct = sum(1 for r in s.results if r["result"] == "match")
         disputes = sum(1 for r in s.results if str(r["result"]).startswith("dispute"))
         summary = f"""\n{FLAG} День завершён.
@@ -574,7 +593,8 @@ async def send_next_evening(msg: Message, s: UserState):
                 await finish_session(s.session_id, s.balance)
         except Exception:
             pass
-        await msg.answer(summary, reply_markup=kb_main_menu())
+        story = bool(s.episode) or bool(EPISODES.available(s.level, s.day, s.episodes_done, s.unlocked))
+        await msg.answer(summary, reply_markup=kb_main_menu(story=story))
         return
 
     item = s.evening_queue[s.evening_idx]
@@ -585,12 +605,14 @@ async def send_next_evening(msg: Message, s: UserState):
 _{ex.text_ru}_
 
 Веришь, что корректно?"""
-    await msg.answer(body, parse_mode="Markdown", reply_markup=kb_believe())
+    await msg.answer(body, parse_mode="Markdown", reply_markup=kb_believe(issue_step(s)))
 
 @dp.callback_query(F.data.startswith("believe:"))
 async def on_believe(cb: CallbackQuery):
     user_choice = cb.data.split(":")[1] == "True"
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch(cb.from_user.id)
+    if s is None:
+        await on_lost_state(cb); return
     if s.stage != "evening":
         await cb.answer("Сейчас не проверка.", show_alert=True); return
 
@@ -619,27 +641,25 @@ async def on_believe(cb: CallbackQuery):
             "result": "match",
             "delta": 0
         })
-        # лог в БД
-        try:
-            if s.session_id:
-                # баланс не меняется
-                await append_result(
-                    s.session_id,
-                    s.evening_idx,      # текущий индекс
-                    ex.text, ex.text_ru,
-                    truth,
-                    user_choice,
-                    employee_card,
-                    "match",
-                    0,
-                    s.balance
-                )
-        except Exception as e:
-            print("append_result ERROR:", repr(e))
-            await cb.message.answer(f"⚠️ append_result ERROR: {e!r}")
+        # лог в БД (write-behind, хендлер БД не ждёт)
+        if s.session_id:
+            # баланс не меняется
+            log_result(
+                s.session_id,
+                s.evening_idx,      # текущий индекс
+                ex.text, ex.text_ru,
+                truth,
+                user_choice,
+                employee_card,
+                "match",
+                0,
+                s.balance,
+                word_id=word_id_of(s, ex),
+            )
         await cb.message.answer("👍 Совпало. Идём дальше.")
         s.evening_idx += 1
         await send_next_evening(cb.message, s)
+        await USERS.save(cb.from_user.id, s)
         await cb.answer(); return
 
     # разногласие
@@ -669,10 +689,7 @@ async def on_believe(cb: CallbackQuery):
         if truth is True:
             # ЗАМЕНИ весь блок генерации wrong_text на:
             deck_words = [c.word for c in s.deck]
-            pair = make_employee_wrong_correction_from_correct(
-                Example(text=ex.text, text_ru=ex.text_ru, uses=ex.uses, is_correct=True),
-                deck_words
-            )
+            pair = make_employee_wrong_correction_from_correct(ex, deck_words)
             if pair:
                 proposal, proposal_ru = pair[0], pair[1]
         else:
@@ -701,7 +718,9 @@ _{proposal_ru or ''}_""", parse_mode="Markdown")
         "delta": None
     })
 
-    await cb.message.answer("Твой ход:", reply_markup=kb_after_employee())
+    step = issue_step(s)
+    await USERS.save(cb.from_user.id, s)
+    await cb.message.answer("Твой ход:", reply_markup=kb_after_employee(step))
     await cb.answer()
 
 def format_with_highlights(text: str, highlights: List[str]) -> str:
@@ -713,7 +732,9 @@ def format_with_highlights(text: str, highlights: List[str]) -> str:
 @dp.callback_query(F.data.startswith("dispute:"))
 async def on_dispute(cb: CallbackQuery):
     action = cb.data.split(":",1)[1]
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    s = await USERS.fetch(cb.from_user.id)
+    if s is None:
+        await on_lost_state(cb); return
     if s.stage != "evening":
         await cb.answer("Сейчас не спор.", show_alert=True); return
 
@@ -736,36 +757,28 @@ async def on_dispute(cb: CallbackQuery):
 
     if action == "concede":
         s.balance -= 50
-        try:
-            if s.session_id:
-                await append_result(
-                    s.session_id, s.evening_idx,
-                    ex.text, ex.text_ru, truth,
-                    your_choice, s.results[idx]["employee_card"],
-                    "dispute_concede",
-                    -50, s.balance
-                )
-        except Exception as e:
-            print("append_result ERROR:", repr(e))
-            await cb.message.answer(f"⚠️ append_result ERROR: {e!r}")
+        if s.session_id:
+            log_result(
+                s.session_id, s.evening_idx,
+                ex.text, ex.text_ru, truth,
+                your_choice, s.results[idx]["employee_card"],
+                "dispute_concede",
+                -50, s.balance, word_id=word_id_of(s, ex),
+            )
         s.results[idx]["result"] = "dispute_concede"
         s.results[idx]["delta"] = -50
         await cb.message.answer(f"{GREEN} «Ты прав». Вы платите сотруднику €50.")
     elif action == "check":
         if your_choice == truth:
             s.balance += 50
-            try:
-                if s.session_id:
-                    await append_result(
-                        s.session_id, s.evening_idx,
-                        ex.text, ex.text_ru, truth,
-                        your_choice, s.results[idx]["employee_card"],
-                        "dispute_check_win",
-                        +50, s.balance
-                        )
-            except Exception as e:
-                print("append_result ERROR:", repr(e))
-                await cb.message.answer(f"⚠️ append_result ERROR: {e!r}")
+            if s.session_id:
+                log_result(
+                    s.session_id, s.evening_idx,
+                    ex.text, ex.text_ru, truth,
+                    your_choice, s.results[idx]["employee_card"],
+                    "dispute_check_win",
+                    +50, s.balance, word_id=word_id_of(s, ex),
+                )
             s.results[idx]["result"] = "dispute_check_win"
             s.results[idx]["delta"] = +50
             await cb.message.answer(f"""{CHECK} Проверка: вы оказались правы. Сотрудник пристыжен.
@@ -774,18 +787,14 @@ async def on_dispute(cb: CallbackQuery):
 “{highlighted}”""", parse_mode="Markdown")
         else:
             s.balance -= 100
-            try:
-                if s.session_id:
-                    await append_result(
-                        s.session_id, s.evening_idx,
-                        ex.text, ex.text_ru, truth,
-                        your_choice, s.results[idx]["employee_card"],
-                        "dispute_check_lose",
-                        -100, s.balance
-                    )
-            except Exception as e:
-                print("append_result ERROR:", repr(e))
-                await cb.message.answer(f"⚠️ append_result ERROR: {e!r}")
+            if s.session_id:
+                log_result(
+                    s.session_id, s.evening_idx,
+                    ex.text, ex.text_ru, truth,
+                    your_choice, s.results[idx]["employee_card"],
+                    "dispute_check_lose",
+                    -100, s.balance, word_id=word_id_of(s, ex),
+                )
             s.results[idx]["result"] = "dispute_check_lose"
             s.results[idx]["delta"] = -100
             await cb.message.answer(f"""{CROSS} Проверка: вы оказались неправы. Сотрудник ликует.
@@ -797,68 +806,274 @@ async def on_dispute(cb: CallbackQuery):
 
     s.evening_idx += 1
     await send_next_evening(cb.message, s)
+    await USERS.save(cb.from_user.id, s)
     await cb.answer()
 
+# ---------- FILES ----------
+# Повторная отправка того же файла — по file_id, без заливки (см. assets.py)
+FILE_IDS = FileIdCache(load_file_id, save_file_id, forget_file_id, max_size=FILE_ID_CACHE_SIZE)
+
+async def send_document(msg: Message, path: str, filename: str, caption: Optional[str] = None):
+    return await FILE_IDS.send(
+        msg.answer_document, "document", export_key(path, msg.chat.id, filename),
+        lambda: FSInputFile(path, filename=filename), size=os.path.getsize(path), caption=caption,
+    )
+
+async def send_scene(msg: Message, uri: str, path, caption: Optional[str] = None, reply_markup=None):
+    return await FILE_IDS.send(
+        msg.answer_photo, "photo", asset_key(uri, str(path)),
+        lambda: FSInputFile(path), size=os.path.getsize(path), caption=caption, reply_markup=reply_markup,
+    )
+
+# ---------- EPISODES ----------
+# Курсор — (s.episode, s.beat); граф битов компилируется при первом запуске эпизода (см. episodes.py).
+EPISODES = EpisodeLibrary(LEVELS)
+
+def kb_beat_next(step: int):
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"{ARROW} Дальше", callback_data=with_step("ep_next", step))
+    return kb.as_markup()
+
+def kb_beat_quiz(step: int):
+    kb = InlineKeyboardBuilder()
+    kb.button(text=f"{CHECK} Верю", callback_data=with_step("ep_quiz:True", step))
+    kb.button(text=f"{CROSS} Не верю", callback_data=with_step("ep_quiz:False", step))
+    kb.adjust(2)
+    return kb.as_markup()
+
+def kb_beat_choice(options, step: int):
+    kb = InlineKeyboardBuilder()
+    for oid, label, _ in options:
+        kb.button(text=label, callback_data=with_step(f"ep_choice:{oid}", step))
+    kb.adjust(1)
+    return kb.as_markup()
+
+def episode_quiz(s: UserState, words) -> tuple:
+    """
+    (text, text_ru, truth, правильное слово) — детерминированно от (эпизод, бит, шаг):
+    при ответе тот же вопрос восстанавливается без хранения в состоянии.
+    """
+    rng = random.Random(f"{s.episode}:{s.beat}:{s.step}")
+    word = rng.choice(words)
+    pairs = collect_examples_for_word(word) or [(f"This is {word}.", f"Это {word}.")]
+    en, ru = rng.choice(pairs)
+    if rng.random() < 0.5:
+        wrong = swap_word_everywhere(en, word, rng.choice([w for w in words if w != word]))
+        if wrong != en:
+            return wrong, ru, False, word
+    return en, ru, True, word
+
+async def send_beat(msg: Message, s: UserState):
+    """Показать текущий бит; result применяется сразу и закрывает эпизод."""
+    beat = EPISODES.beat(s.episode, s.beat)
+    if beat is None:
+        s.episode, s.beat = "", 0
+        await msg.answer("Эпизод недоступен.", reply_markup=kb_main_menu())
+        return
+    if beat.kind == "msg":
+        text = f"*{beat.actor}:* {beat.text}" if beat.actor else beat.text
+        await msg.answer(text, parse_mode="Markdown", reply_markup=kb_beat_next(issue_step(s)))
+    elif beat.kind == "asset":
+        path = scene_path(beat.url)
+        step = issue_step(s)
+        if path is not None and beat.asset_kind == "photo":
+            await send_scene(msg, beat.url, path, caption=beat.text or None, reply_markup=kb_beat_next(step))
+        else:
+            # картинки сцены нет в content/scenes — хотя бы подпись
+            await msg.answer(f"🖼 {beat.text or beat.url.split('://')[-1].replace('_', ' ')}", reply_markup=kb_beat_next(step))
+    elif beat.kind == "quiz":
+        step = issue_step(s)
+        text, text_ru, _, _ = episode_quiz(s, beat.words)
+        await msg.answer(f"Верно ли?\n\n“{text}”\n_{text_ru}_", parse_mode="Markdown", reply_markup=kb_beat_quiz(step))
+    elif beat.kind == "choice":
+        await msg.answer(beat.text or "Что делаем?", reply_markup=kb_beat_choice(beat.options, issue_step(s)))
+    else:
+        s.bonus += beat.cash
+        s.unlocked.extend(e for e in beat.unlock if e not in s.unlocked)
+        s.episodes_done.append(s.episode)
+        s.episode, s.beat = "", 0
+        issue_step(s)
+        lines = [f"{FLAG} Эпизод пройден."]
+        if beat.cash:
+            lines.append(f"Премия €{beat.cash} — начнёшь с ней следующий день.")
+        more = EPISODES.available(s.level, s.day, s.episodes_done, s.unlocked)
+        if more:
+            lines.append(f"Открыт эпизод: «{more[0].title}»")
+        await msg.answer("\n".join(lines), reply_markup=kb_main_menu(story=bool(more)))
+
+async def advance_beat(msg: Message, s: UserState, option: Optional[str] = None):
+    nxt = EPISODES.beat(s.episode, s.beat).after(option)
+    if nxt == END:
+        # эпизод без result — просто закрываем
+        s.episodes_done.append(s.episode)
+        s.episode, s.beat = "", 0
+        await msg.answer(f"{FLAG} Эпизод пройден.", reply_markup=kb_main_menu())
+        return
+    s.beat = nxt
+    await send_beat(msg, s)
+
+async def start_story(msg: Message, uid: int):
+    s = await USERS.fetch_or_create(uid)
+    if s.stage in ("morning", "evening"):
+        await msg.answer("Сначала закончим рабочий день 🙂"); return
+    if not s.episode:
+        opened = EPISODES.available(s.level, s.day, s.episodes_done, s.unlocked)
+        if not opened:
+            await msg.answer(f"{BOOK} Новых эпизодов пока нет — сыграй ещё день.", reply_markup=kb_main_menu())
+            return
+        s.episode, s.beat = opened[0].id, 0
+        await msg.answer(f"{BOOK} *{EPISODES.get(s.episode).title}*", parse_mode="Markdown")
+    await send_beat(msg, s)
+    await USERS.save(uid, s)
+
+@dp.message(Command("story"))
+async def on_story(m: Message):
+    await start_story(m, m.from_user.id)
+
+@dp.callback_query(F.data == "story")
+async def on_story_button(cb: CallbackQuery):
+    await start_story(cb.message, cb.from_user.id)
+    await cb.answer()
+
+async def episode_state(cb: CallbackQuery, kind: str) -> Optional[UserState]:
+    s = await USERS.fetch(cb.from_user.id)
+    if s is None:
+        await on_lost_state(cb); return None
+    beat = EPISODES.beat(s.episode, s.beat) if s.episode else None
+    if beat is None or (beat.kind == "quiz") != (kind == "quiz") or (beat.kind == "choice") != (kind == "choice"):
+        await cb.answer("Это уже в прошлом.", show_alert=True); return None
+    return s
+
+@dp.callback_query(F.data == "ep_next")
+async def on_beat_next(cb: CallbackQuery):
+    s = await episode_state(cb, "next")
+    if s is None:
+        return
+    await advance_beat(cb.message, s)
+    await USERS.save(cb.from_user.id, s)
+    await cb.answer()
+
+@dp.callback_query(F.data.startswith("ep_quiz:"))
+async def on_beat_quiz(cb: CallbackQuery):
+    s = await episode_state(cb, "quiz")
+    if s is None:
+        return
+    choice = cb.data.split(":", 1)[1] == "True"
+    _, _, truth, word = episode_quiz(s, EPISODES.beat(s.episode, s.beat).words)
+    if choice == truth:
+        await cb.message.answer(f"{CHECK} Точно.")
+    else:
+        await cb.message.answer(f"{CROSS} Мимо: " + ("предложение было верным." if truth else f"там должно быть «{word}»."))
+    await advance_beat(cb.message, s)
+    await USERS.save(cb.from_user.id, s)
+    await cb.answer()
+
+@dp.callback_query(F.data.startswith("ep_choice:"))
+async def on_beat_choice(cb: CallbackQuery):
+    s = await episode_state(cb, "choice")
+    if s is None:
+        return
+    option = cb.data.split(":", 1)[1]
+    if EPISODES.beat(s.episode, s.beat).after(option) < END:
+        await cb.answer("Неизвестный вариант.", show_alert=True); return
+    await advance_beat(cb.message, s, option)
+    await USERS.save(cb.from_user.id, s)
+    await cb.answer()
+
+EXPORT_HEADER = ["id","user_id","level","item_index","sentence_en","sentence_ru",
+                 "truth","user_choice","employee_card","outcome","delta","balance_after","created_at"]
+
+def parse_export_range(args: Optional[str]):
+    """'/export [YYYY-MM-DD] [YYYY-MM-DD]' -> (date_from, date_to) включительно."""
+    parts = (args or "").split()
+    dates = [date.fromisoformat(p) for p in parts[:2]]
+    return (dates[0] if dates else None), (dates[1] if len(dates) > 1 else None)
+
+EXPORT_PAGE_SQL = """/* export_results */
+select
+  r.id, s.user_id, s.level, r.item_index,
+  r.sentence_en, r.sentence_ru,
+  r.truth, r.user_choice, r.employee_card, r.outcome,
+  r.delta, r.balance_after, r.created_at
+from results r
+join sessions s on s.id = r.session_id
+where s.user_id = $1
+  and ($2::date is null or r.created_at >= $2::date)
+  and ($3::date is null or r.created_at < $3::date + 1)
+  and r.id > $4
+order by r.id
+limit $5
+"""
+
+async def send_export(msg: Message, tg_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    s = await USERS.fetch(tg_id) or UserState()
+
+    # 1) Пытаемся выгрузить из БД всю историю пользователя — страницами по EXPORT_CHUNK_ROWS, сразу в gzip
+    with CsvGzSpool(EXPORT_HEADER, max_bytes=EXPORT_MAX_BYTES, prefix=f"results_{tg_id}_") as spool:
+        try:
+            if RESULT_WRITER:
+                await RESULT_WRITER.flush()  # дописать свежие ответы из очереди
+            uid = await ensure_user(tg_id)
+            pool = await get_pool()
+            # страницами по id: соединение держим только на время запроса страницы,
+            # запись в файл (локальный диск) — уже после возврата соединения в пул
+            last_id, full = 0, True
+            while full:
+                page = await pool.fetch(EXPORT_PAGE_SQL, uid, date_from, date_to, last_id, EXPORT_CHUNK_ROWS)
+                full = len(page) == EXPORT_CHUNK_ROWS
+                for r in page:
+                    if not spool.write([r[h] for h in EXPORT_HEADER]):
+                        full = False  # упёрлись в EXPORT_MAX_BYTES
+                        break
+                    last_id = r["id"]
+            path = spool.finish()
+        except Exception as e:
+            print("export DB ERROR:", repr(e))
+        else:
+            # ошибка отправки — не повод слать ещё и локальный экспорт: она уходит наверх
+            caption = f"📄 Экспорт из БД готов ({spool.rows} строк)."
+            if spool.truncated:
+                caption += " Файл обрезан по лимиту размера — уточните период: /export YYYY-MM-DD YYYY-MM-DD"
+            await send_document(msg, path, f"results_{tg_id}.csv.gz", caption=caption)
+            return
+
+    # 2) Fallback — выгрузка из оперативной памяти (текущая сессия)
+    with CsvGzSpool(["sentence","truth","your_choice","employee_card","result","delta","balance_after_row"],
+                    max_bytes=EXPORT_MAX_BYTES, prefix=f"results_{tg_id}_") as spool:
+        bal = 0
+        for r in s.results:
+            if isinstance(r.get("delta"), int):
+                bal += r["delta"]
+            spool.write([
+                r.get("text",""),
+                r.get("truth",""),
+                r.get("your_choice",""),
+                r.get("employee_card",""),
+                r.get("result",""),
+                r.get("delta",""),
+                bal
+            ])
+        path = spool.finish()
+        await send_document(msg, path, f"results_{tg_id}.csv.gz", caption="📄 Экспорт (локально) готов.")
+
 @dp.callback_query(F.data == "export_csv")
 async def export_csv(cb: CallbackQuery):
-    s = USERS.setdefault(cb.from_user.id, UserState())
+    await send_export(cb.message, cb.from_user.id)
+    await cb.answer()
 
-    # 1) Пытаемся выгрузить из БД всю историю пользователя
+@dp.message(Command("export"))
+async def on_export(m: Message, command: CommandObject):
     try:
-        uid = await ensure_user(cb.from_user.id)
-        pool = await get_pool()
-        rows = await pool.fetch(
-            """
-            select
-              r.id, s.user_id, s.level, r.item_index,
-              r.sentence_en, r.sentence_ru,
-              r.truth, r.user_choice, r.employee_card, r.outcome,
-              r.delta, r.balance_after, r.created_at
-            from results r
-            join sessions s on s.id = r.session_id
-            where s.user_id = $1
-            order by r.created_at
-            """,
-            uid
-        )
-        header = ["id","user_id","level","item_index","sentence_en","sentence_ru",
-                  "truth","user_choice","employee_card","outcome","delta","balance_after","created_at"]
-        sio = StringIO(); w = csv.writer(sio); w.writerow(header)
-        for r in rows:
-            w.writerow([r[h] for h in header])
-        data = sio.getvalue().encode("utf-8")
-        buf = BufferedInputFile(data, filename=f"results_{cb.from_user.id}.csv")
-        await cb.message.answer_document(buf, caption="📄 Экспорт из БД готов.")
-        await cb.answer()
+        date_from, date_to = parse_export_range(command.args)
+    except ValueError:
+        await m.answer("Формат: /export [YYYY-MM-DD] [YYYY-MM-DD]")
         return
-    except Exception as e:
-        print("export DB ERROR:", repr(e))
-
-        # 2) Fallback — твоя текущая выгрузка из оперативной памяти
-        filename = f"results_{cb.from_user.id}.csv"
-        with open(filename, "w", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            w.writerow(["sentence","truth","your_choice","employee_card","result","delta","balance_after_row"])
-            bal = 0
-            for r in s.results:
-                if isinstance(r.get("delta"), int):
-                    bal += r["delta"]
-                w.writerow([
-                    r.get("text",""),
-                    r.get("truth",""),
-                    r.get("your_choice",""),
-                    r.get("employee_card",""),
-                    r.get("result",""),
-                    r.get("delta",""),
-                    bal
-                ])
-        await cb.message.answer_document(FSInputFile(filename), caption="📄 Экспорт (локально) готов.")
-        await cb.answer()
+    await send_export(m, m.from_user.id, date_from, date_to)
 
 
 @dp.message(Command("stats"))
 async def on_stats(m: Message):
-    s = USERS.get(m.from_user.id, UserState())
+    s = await USERS.fetch(m.from_user.id) or UserState()
 
     # локальный fallback (на случай офлайна БД)
     local_total = sum(1 for r in s.results if r.get("result") in ("match","dispute_concede","dispute_check_win","dispute_check_lose"))
@@ -866,20 +1081,10 @@ async def on_stats(m: Message):
     local_acc = round((local_correct/local_total)*100,1) if local_total else 0.0
 
     try:
+        if RESULT_WRITER:
+            await RESULT_WRITER.flush()  # дописать свежие ответы из очереди
         uid = await ensure_user(m.from_user.id)
-        pool = await get_pool()
-        row = await pool.fetchrow(
-            """
-            select
-              count(*) as total,
-              count(*) filter (where r.truth = r.user_choice) as correct,
-              coalesce(sum(coalesce(r.delta,0)),0) as sum_delta
-            from results r
-            join sessions s on s.id = r.session_id
-            where s.user_id = $1
-            """,
-            uid
-        )
+        row = await get_user_stats(uid)
         total = row["total"] or 0
         correct = row["correct"] or 0
         acc = round((correct/total)*100,1) if total else 0.0
@@ -898,6 +1103,41 @@ async def on_stats(m: Message):
             f"Баланс (локально): €{s.balance}\n"
         )
 
+@dp.message(Command("top"))
+async def on_top(m: Message, command: CommandObject):
+    """/top — общий рейтинг и рейтинг своего уровня; /top B1 — только уровень."""
+    arg = (command.args or "").strip().upper()
+    if arg and arg not in LEVELS:
+        await m.answer("Формат: /top [A2|B1|B2|C1|C2]")
+        return
+    if not LEADERBOARD.loaded:
+        await m.answer("🏆 Рейтинг пока не готов — загляни чуть позже.")
+        return
+    s = await USERS.fetch(m.from_user.id) or UserState()
+    scopes = [arg] if arg else [GLOBAL, s.level]
+    try:
+        uid = await ensure_user(m.from_user.id)
+        mine = await LEADERBOARD.rank_of(uid)
+    except Exception as e:
+        print("top rank ERROR:", repr(e))
+        uid, mine = None, {}
+
+    age_min = int((time.time() - LEADERBOARD.refreshed_at) // 60)
+    lines = [f"🏆 Лучший баланс за игру (обновлено {age_min} мин назад)"]
+    for scope in scopes:
+        lines.append("")
+        lines.append("Все уровни:" if scope == GLOBAL else f"Уровень {scope}:")
+        rows = LEADERBOARD.top.get(scope) or []
+        if not rows:
+            lines.append("пока никого")
+        for r in rows:
+            me = " ← ты" if r["user_id"] == uid else ""
+            lines.append(f"{r['rnk']}. игрок #{r['user_id']} — €{r['best']}, игр: {r['games']}{me}")
+        own = mine.get(scope)
+        if own and all(r["user_id"] != uid for r in rows):
+            lines.append(f"…\nТы: {own['rnk']} из {own['players']} — €{own['best']}")
+    await m.answer("\n".join(lines))
+
 # Отладка
 
 @dp.message(Command("dbping"))
@@ -905,9 +1145,27 @@ async def dbping(m: Message):
     try:
         pool = await get_pool()
         row = await pool.fetchval("select 1")
-        await m.answer(f"DB ping: {row}")
+        backlog = RESULT_WRITER.backlog if RESULT_WRITER else 0
+        await m.answer(f"DB ping: {row}\nresults backlog: {backlog}\n" + _db_status_line())
+    except Exception as e:
+        await m.answer(f"DB ping ERROR: {e!r}\n" + _db_status_line())
+
+def _db_status_line() -> str:
+    return ", ".join(f"{k}: {v}" for k, v in db_status().items()) if DB_ENABLED else "db: fallback"
+
+@dp.message(Command("dbpool"))
+async def dbpool(m: Message):
+    """Пул и самые дорогие запросы — чтобы подбирать DB_POOL_MIN/MAX по данным."""
+    try:
+        pool = await get_pool()
+        lines = [f"{k}: {v}" for k, v in pool.stats().items()]
+        lines.append("")
+        lines.append("top queries (total ms / count / p95 ms):")
+        for q in query_stats(top=8):
+            lines.append(f"{q['total']*1000:.0f} / {q['count']} / {q['p95']*1000:.1f} — {q['query']}")
+        await m.answer("\n".join(lines))
     except Exception as e:
-        await m.answer(f"DB ping ERROR: {e!r}")
+        await m.answer(f"DB pool ERROR: {e!r}")
 
 @dp.message(Command("dbschema"))
 async def dbschema(m: Message):
@@ -976,11 +1234,138 @@ async def dbcount(m: Message):
         await m.answer(f"⚠️ dbcount ERROR: {e!r}")
 
 
+@dp.message(Command("perf"))
+async def perf(m: Message):
+    """Латентность хендлеров (мс): то же, что в /metrics, но прямо в чате."""
+    rows = handler_stats()
+    if not rows:
+        await m.answer("Пока нет данных."); return
+    lines = ["handler: count / err / p50 / p95 / p99 / max"]
+    for r in rows:
+        lines.append(f"{r['handler']}: {r['count']} / {r['errors']} / {r['p50']} / {r['p95']} / {r['p99']} / {r['max']}")
+    await m.answer("\n".join(lines))
+
+@dp.message(Command("statestats"))
+async def statestats(m: Message):
+    st = {**USERS.stats(), **{f"dropped_{k}": v for k, v in GUARD.dropped.items()}}
+    await m.answer(
+        "🧠 User states:\n" + "\n".join(f"{k}: {v}" for k, v in st.items())
+    )
+
+
 # ---------- RUN ----------
-async def main():
+RESULTS_BACKLOG = REGISTRY.gauge("results_backlog", "Results not yet written to the DB")
+USER_STATES = REGISTRY.gauge("user_states", "Game states held in memory")
+CONTENT_FROM_BUNDLE = REGISTRY.gauge("content_from_bundle", "1 if content is served from the bundle")
+
+def refresh_gauges() -> None:
+    pool = current_pool()
+    if pool is not None:
+        pool.stats()  # обновляет db_pool_size
+    RESULTS_BACKLOG.set(RESULT_WRITER.backlog if RESULT_WRITER else 0)
+    USER_STATES.set(len(USERS))
+    CONTENT_FROM_BUNDLE.set(1 if CONTENT.from_bundle else 0)
+
+HEALTH_DB_PING_SEC = 1.0  # меньше health_timeout (3 с): медленная БД — «unavailable» в ответе, а не 503
+
+async def _health_ping() -> None:
+    pool = await get_pool()
+    await pool.fetchval("/* healthz */ select 1")
+
+async def health() -> dict:
+    """
+    Для /healthz (liveness): бот жив, пока играет — и при лежащей БД (записи идут в журнал).
+    Состояние БД — в ответе: db ok | unavailable | circuit_open, цепь и глубина журнала (db_status).
+    """
+    out = {"content": "db" if CONTENT.loaded else ("bundle" if CONTENT.from_bundle else "none")}
+    if not DB_ENABLED:
+        out["db"] = "disabled"
+        return out
+    try:
+        # при разомкнутой цепи отказ мгновенный; после reset_sec этот пинг может стать пробным вызовом
+        await asyncio.wait_for(_health_ping(), HEALTH_DB_PING_SEC)
+        out["db"] = "ok"
+    except CircuitOpenError:
+        out["db"] = "circuit_open"
+    except Exception as e:
+        out["db"] = "unavailable"
+        out["db_error"] = repr(e)
+    out.update(db_status())
+    return out
+
+async def sweep_states():
+    while True:
+        await asyncio.sleep(STATE_SWEEP_SEC)
+        n = USERS.sweep()
+        if n:
+            print(f"states: evicted {n} idle")
+        await USERS.flush()  # ходы внутри этапа (и выселенные несохранёнными) — в хранилище
+
+async def main(profile_only: bool = False):
+    global bot
     print("Bot is running…")
-    await dp.start_polling(bot)
+    with PROFILE.phase("bot client"):
+        if not BOT_TOKEN:
+            raise RuntimeError("BOT_TOKEN is missing")
+        bot = Bot(BOT_TOKEN)
+        FILE_IDS.bot_id = bot.id  # из токена, без запроса к API
+        setup_sender(bot, SendScheduler(TG_GLOBAL_RPS, TG_CHAT_RPS, TG_CHAT_BURST))
+        instrument_bot(bot)  # последним: меряем сами вызовы API, без ожидания очереди
+    with PROFILE.phase("content bundle"):
+        CONTENT.bundle = load_bundle(CONTENT_BUNDLE_PATH)
+    with PROFILE.phase("episodes"):
+        # только заголовки и правила открытия; биты компилируются при первом запуске эпизода
+        EPISODES.load(CONTENT.bundle.episodes if CONTENT.bundle else {})
+    with PROFILE.phase("db warm-up"):
+        try:
+            print("DB warm-up:", await warm_up(DB_WARMUP_TIMEOUT))
+        except Exception as e:
+            print("DB warm-up ERROR:", repr(e))
+    with PROFILE.phase("ensure schema"):
+        try:
+            await ensure_schema()
+        except Exception as e:
+            print("ensure_schema ERROR:", repr(e))
+    with PROFILE.phase("content cache"):
+        await CONTENT.start()
+    if profile_only:
+        print(PROFILE.report())
+        await CONTENT.stop()
+        await bot.session.close()
+        return
+    print(f"startup: {PROFILE.total * 1000:.0f} ms")
+
+    if RESULT_WRITER:
+        RESULT_WRITER.start()
+    if DB_ENABLED:
+        await LEADERBOARD.start()
+    sweeper = asyncio.get_running_loop().create_task(sweep_states())
+    http = add_routes(web.Application(), health, before_scrape=refresh_gauges)
+    metrics_runner = None
+    try:
+        if BOT_MODE == "webhook":
+            from webhook import run_webhook
+            if not WEBHOOK_BASE_URL:
+                raise RuntimeError("WEBHOOK_BASE_URL is missing for BOT_MODE=webhook")
+            await run_webhook(
+                bot, dp, WEBHOOK_BASE_URL,
+                path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                port=PORT, max_inflight=WEBHOOK_MAX_INFLIGHT, app=http,
+            )
+        else:
+            if METRICS_PORT:
+                metrics_runner = await serve(http, port=METRICS_PORT)
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
+    finally:
+        sweeper.cancel()
+        await USERS.flush()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await CONTENT.stop()
+        await LEADERBOARD.stop()
+        if RESULT_WRITER:
+            await RESULT_WRITER.stop()
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    asyncio.run(main(profile_only="--profile-startup" in sys.argv))
@@ -0,0 +1,146 @@
+# bot/assets.py
+# Кэш Telegram file_id: файл, однажды загруженный ботом, дальше отправляется по file_id без повторной заливки.
+# Ключ — «слот#содержимое»:
+#   export:<chat>/<имя>#<sha256> — экспорт: свой слот у каждого чата и имени файла (одинаковые байты у разных
+#                                  игроков не делят file_id — в нём чужое имя файла); CsvGzSpool пишет gzip
+#                                  с mtime=0, так что повторный экспорт той же истории уходит по file_id;
+#   scene://name#<sha-16>        — ассеты эпизодов: картинка поменялась → новый ключ → новая заливка.
+# В слоте живёт одна запись: новая заливка вытесняет прежний file_id слота (в памяти и в БД).
+# В памяти — LRU; промах проверяется в БД (таблица tg_file_ids, своя для каждого бота: file_id не переносятся),
+# после первой заливки file_id записывается туда же.
+import hashlib, os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+
+from metrics import REGISTRY
+
+FILE_CACHE = REGISTRY.counter("tg_file_cache_total", "File sends by file_id cache outcome", ["kind", "result"])
+BYTES_SAVED = REGISTRY.counter("tg_upload_bytes_saved_total", "Upload bytes avoided by reusing file_id", ["kind"])
+
+
+def sha256_file(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def export_key(path: str, chat_id: int, filename: str) -> str:
+    return f"export:{chat_id}/{filename}#{sha256_file(path)}"
+
+
+def slot_of(key: str) -> Optional[str]:
+    """«export:1/a.csv.gz#» для «export:1/a.csv.gz#<sha>»; None — ключ без слота."""
+    head, sep, _ = key.partition("#")
+    return head + sep if sep else None
+
+
+_ASSET_HASHES: Dict[str, Tuple[float, int, str]] = {}  # path -> (mtime, size, sha256)
+
+def asset_key(uri: str, path: str) -> str:
+    """Ключ ассета; хэш файла пересчитывается, только если поменялись mtime/размер."""
+    st = os.stat(path)
+    cached = _ASSET_HASHES.get(path)
+    if cached is None or cached[:2] != (st.st_mtime, st.st_size):
+        cached = _ASSET_HASHES[path] = (st.st_mtime, st.st_size, sha256_file(path))
+    return f"{uri}#{cached[2][:16]}"
+
+
+def file_id_of(msg, kind: str) -> Optional[str]:
+    media = getattr(msg, kind, None)
+    if kind == "photo" and media:
+        media = media[-1]  # самый большой размер
+    return getattr(media, "file_id", None)
+
+
+class FileIdCache:
+    """
+    load(bot_id, key) -> file_id | None, save(bot_id, key, file_id, kind, size), forget(bot_id, key) —
+    хранилище (db.py); без них кэш живёт только в памяти процесса. save() вытесняет прежние ключи слота.
+    """
+
+    def __init__(
+        self,
+        load: Optional[Callable[[int, str], Awaitable[Optional[str]]]] = None,
+        save: Optional[Callable[[int, str, str, str, int], Awaitable[None]]] = None,
+        forget: Optional[Callable[[int, str], Awaitable[None]]] = None,
+        max_size: int = 5000,
+    ):
+        self._load = load
+        self._save = save
+        self._forget = forget
+        self.max_size = max_size
+        self.bot_id = 0  # задаётся в main(): file_id действительны только для своего бота
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def _remember(self, key: str, file_id: str) -> None:
+        slot = slot_of(key)
+        if slot is not None and key not in self._mem:
+            for old in [k for k in self._mem if k.startswith(slot)]:
+                del self._mem[old]
+        self._mem[key] = file_id
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        file_id = self._mem.get(key)
+        if file_id is not None:
+            self._mem.move_to_end(key)
+            return file_id
+        if self._load is None:
+            return None
+        try:
+            file_id = await self._load(self.bot_id, key)
+        except Exception as e:
+            print("file_id load ERROR:", repr(e))
+            return None
+        if file_id:
+            self._remember(key, file_id)
+        return file_id
+
+    async def put(self, key: str, file_id: str, kind: str, size: int = 0) -> None:
+        self._remember(key, file_id)
+        if self._save is not None:
+            try:
+                await self._save(self.bot_id, key, file_id, kind, size)
+            except Exception as e:
+                print("file_id save ERROR:", repr(e))
+
+    async def forget(self, key: str) -> None:
+        self._mem.pop(key, None)
+        if self._forget is not None:
+            try:
+                await self._forget(self.bot_id, key)
+            except Exception as e:
+                print("file_id forget ERROR:", repr(e))
+
+    async def send(self, send: Callable[..., Awaitable], kind: str, key: str, make_input: Callable[[], object],
+                   size: int = 0, **kwargs):
+        """
+        send(media, **kwargs) — msg.answer_document / answer_photo / ...; make_input() — FSInputFile для заливки.
+        Известный file_id уходит без загрузки; отвергнутый Telegram'ом — забываем и заливаем заново.
+        """
+        file_id = await self.get(key)
+        if file_id is not None:
+            try:
+                msg = await send(file_id, **kwargs)
+                FILE_CACHE.inc(kind=kind, result="hit")
+                BYTES_SAVED.inc(size, kind=kind)
+                return msg
+            except TelegramBadRequest as e:
+                print(f"file_id rejected ({key}):", e.message)
+                FILE_CACHE.inc(kind=kind, result="stale")
+                await self.forget(key)
+        msg = await send(make_input(), **kwargs)
+        FILE_CACHE.inc(kind=kind, result="upload")
+        new_id = file_id_of(msg, kind)
+        if new_id:
+            await self.put(key, new_id, kind, size)
+        return msg
@@ -0,0 +1,97 @@
+# bot/banks.py
+# Встроенные банки слов/примеров — последний фолбэк, если нет ни БД, ни бандла.
+# В бандл (scripts/build_bundle.py) попадают вместе с content/*.
+from typing import Dict, List
+
+from models import Example, WordCard
+
+A2_ADJ = [WordCard("big","большой"), WordCard("small","маленький"),
+          WordCard("easy","лёгкий"), WordCard("hard","трудный"),
+          WordCard("busy","занятой")]
+
+B1_ADJ = [
+    WordCard("reliable","надёжный"),
+    WordCard("efficient","эффективный"),
+    WordCard("flexible","гибкий"),
+    WordCard("confident","уверенный"),
+    WordCard("accurate","точный"),
+    WordCard("productive","продуктивный"),
+    WordCard("creative","креативный"),
+]
+
+B2_ADJ = [
+    WordCard("meticulous","дотошный"),
+    WordCard("versatile","разносторонний"),
+    WordCard("robust","надёжный/устойчивый"),
+    WordCard("scalable","масштабируемый"),
+    WordCard("redundant","избыточный"),
+]
+
+C1_ADJ = [
+    WordCard("meticulous","дотошный"),
+    WordCard("versatile","разносторонний"),
+    WordCard("robust","надёжный/устойчивый"),
+    WordCard("scalable","масштабируемый"),
+    WordCard("redundant","избыточный"),
+]
+
+C2_ADJ = [
+    WordCard("meticulous","дотошный"),
+    WordCard("versatile","разносторонний"),
+    WordCard("robust","надёжный/устойчивый"),
+    WordCard("scalable","масштабируемый"),
+    WordCard("redundant","избыточный"),
+]
+
+WORD_BANK: Dict[str, List[WordCard]] = {
+    "A2": A2_ADJ,   
+    "B1": B1_ADJ,
+    "B2": B2_ADJ,
+    "C1": C1_ADJ,
+    "C2": C2_ADJ,
+}
+
+# Утренние (один корректный пример на слово)
+STAGE1_EXAMPLES: Dict[str, Example] = {
+    "reliable":  Example("Our team is reliable and finishes tasks on time.",
+                         "Наша команда надёжная и завершает задачи вовремя.", ["reliable"], True),
+    "efficient": Example("This tool is efficient for our project.",
+                         "Этот инструмент эффективен для нашего проекта.", ["efficient"], True),
+    "flexible":  Example("We need a flexible plan for the week.",
+                         "Нам нужен гибкий план на неделю.", ["flexible"], True),
+    "confident": Example("She is confident about the interview.",
+                         "Она уверена насчёт собеседования.", ["confident"], True),
+    "accurate":  Example("We need accurate data for the report.",
+                         "Нам нужны точные данные для отчёта.", ["accurate"], True),
+    "productive":Example("A short break can make you more productive.",
+                         "Короткий перерыв может сделать вас более продуктивным.", ["productive"], True),
+    "creative":  Example("We need a creative idea for this ad.",
+                         "Нам нужна креативная идея для этой рекламы.", ["creative"], True),
+
+    "meticulous": Example("She is meticulous and checks every detail.",
+                          "Она дотошная и проверяет каждую деталь.", ["meticulous"], True),
+    "versatile":  Example("A versatile employee can do many different tasks.",
+                          "Разносторонний сотрудник может выполнять много разных задач.", ["versatile"], True),
+    "robust":     Example("The system is robust and works under heavy load.",
+                          "Система надёжная и работает под высокой нагрузкой.", ["robust"], True),
+    "scalable":   Example("Our product is scalable and can handle more users.",
+                          "Наш продукт масштабируемый и может выдерживать больше пользователей.", ["scalable"], True),
+    "redundant":  Example("This step is redundant in our process.",
+                          "Этот шаг избыточен в нашем процессе.", ["redundant"], True),
+}
+
+# Вечерние альтернативы (чтобы не повторять утренний пример)
+ALT_OK: Dict[str, List[Example]] = {
+    "reliable":  [Example("A reliable colleague keeps promises.", "Надёжный коллега держит обещания.", ["reliable"], True)],
+    "efficient": [Example("An efficient team saves time and budget.", "Эффективная команда экономит время и бюджет.", ["efficient"], True)],
+    "flexible":  [Example("Flexible policies help employees.", "Гибкие правила помогают сотрудникам.", ["flexible"], True)],
+    "confident": [Example("I feel confident after preparation.", "Я чувствую уверенность после подготовки.", ["confident"], True)],
+    "accurate":  [Example("Accurate numbers are important for decisions.", "Точные цифры важны для принятия решений.", ["accurate"], True)],
+    "productive":[Example("I had a productive day at work.", "У меня был продуктивный день на работе.", ["productive"], True)],
+    "creative":  [Example("She came up with a creative solution.", "Она придумала креативное решение.", ["creative"], True)],
+    "meticulous":[Example("He is meticulous and checks every line.", "Он дотошный и проверяет каждую строчку.", ["meticulous"], True)],
+    "versatile": [Example("A versatile tool is useful in many situations.", "Разносторонний инструмент полезен во многих ситуациях.", ["versatile"], True)],
+    "robust":    [Example("This app is robust and rarely crashes.", "Это приложение надёжно и редко падает.", ["robust"], True)],
+    "scalable":  [Example("The platform is scalable for future growth.", "Платформа масштабируема для будущего роста.", ["scalable"], True)],
+    "redundant": [Example("We removed redundant details from the report.", "Мы убрали избыточные детали из отчёта.", ["redundant"], True)],
+}
@@ -0,0 +1,122 @@
+# bot/breaker.py
+# Предохранитель для БД: после failure_threshold подряд сбоев связи/таймаутов цепь размыкается,
+# и запросы отказывают сразу (CircuitOpenError), не дожидаясь таймаута соединения.
+# Через reset_sec пропускается один пробный запрос (half-open): успех замыкает цепь, сбой — снова open.
+import asyncio, time
+
+import asyncpg
+
+from metrics import REGISTRY
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+CIRCUIT_STATE = REGISTRY.gauge("db_circuit_state", "DB circuit breaker: 0 closed, 1 open, 2 half-open")
+CIRCUIT_REJECTED = REGISTRY.counter("db_circuit_rejected_total", "Calls refused while the DB circuit is open")
+CIRCUIT_OPENED = REGISTRY.counter("db_circuit_opened_total", "Times the DB circuit opened")
+
+# сбои связи с БД — только они размыкают цепь. Ошибки самих запросов (constraint, синтаксис),
+# statement timeout и отмена запроса — ответ живой БД: медленный пересчёт /top не должен уводить
+# записи игроков в журнал. Таймауты подключения и acquire db.py разбирает сам (см. InstrumentedPool).
+UNAVAILABLE = (
+    OSError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+)
+_TIMEOUTS = (asyncio.TimeoutError, TimeoutError)  # TimeoutError — подкласс OSError, отделяем явно
+_QUERY_ABORTS = _TIMEOUTS + (asyncpg.QueryCanceledError,)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """Сбой связи (или цепь уже разомкнута) — не таймаут запроса."""
+    if isinstance(exc, _TIMEOUTS):
+        return False
+    return isinstance(exc, (CircuitOpenError,) + UNAVAILABLE)
+
+
+def is_connection_lost(exc: BaseException, conn) -> bool:
+    """
+    Ошибка внутри acquire(): сбой связи, только если он про соединение — asyncpg сообщил о разрыве
+    или соединение уже закрыто. OSError кода вызывающего (диск, сеть к Telegram) цепь не размыкает.
+    """
+    if isinstance(exc, asyncpg.PostgresConnectionError):
+        return True
+    return isinstance(exc, UNAVAILABLE) and not is_timeout(exc) and conn.is_closed()
+
+
+def is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, _TIMEOUTS)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Стоит повторить позже: связь, таймаут или отменённый запрос (для доигрывания журнала)."""
+    return is_unavailable(exc) or isinstance(exc, _QUERY_ABORTS)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_sec: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe = False  # пробный запрос half-open уже в пути
+        CIRCUIT_STATE.set(0)
+
+    def _set(self, state: str) -> None:
+        if state != self.state:
+            print(f"DB circuit: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUE[state])
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_sec:
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probe:
+            self._probe = True
+            return True
+        CIRCUIT_REJECTED.inc()
+        return False
+
+    def check(self) -> bool:
+        """Пропустить вызов или CircuitOpenError. True — это пробный вызов half-open."""
+        if not self.allow():
+            raise CircuitOpenError(f"DB circuit is {self.state}")
+        return self.state == HALF_OPEN
+
+    def cancelled(self, probe: bool) -> None:
+        """
+        Вызов отменён (wait_for вокруг /healthz и прогрева, отключение клиента): ни success, ни failure
+        не случились. Отменённый пробный вызов считаем сбоем — иначе цепь навсегда застрянет в half-open.
+        """
+        if probe and self._probe and self.state == HALF_OPEN:
+            self.failure()
+
+    def success(self) -> None:
+        self.failures = 0
+        self._probe = False
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probe = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                CIRCUIT_OPENED.inc()
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def stats(self) -> dict:
+        return {"circuit": self.state, "failures": self.failures}
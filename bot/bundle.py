@@ -0,0 +1,191 @@
+# bot/bundle.py
+# Скомпилированный контент-бандл: words.csv + examples.csv + words_en.json + episodes/*.json
+# + встроенные банки (banks.py) в одном файле с готовыми индексами.
+# Бот грузит его на старте и играет без Postgres; собирается scripts/build_bundle.py.
+#
+# Формат: MAGIC + FORMAT (1 байт) + zlib(json). msgpack не тянем — json+zlib в проекте уже есть (models.py).
+import csv, hashlib, json, time, zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from distractors import generate_bad_rows
+
+MAGIC = b"TOBB"
+FORMAT = 1
+DEFAULT_PATH = "content/bundle.bin"
+
+Pair = Tuple[str, str]
+
+
+def _read_csv(path: Path) -> List[dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [r for r in csv.DictReader(f) if any((v or "").strip() for v in r.values())]
+
+
+def _dedup_pairs(pairs) -> List[Pair]:
+    seen, uniq = set(), []
+    for t, r in pairs:
+        key = (t.strip(), r.strip())
+        if key not in seen:
+            seen.add(key); uniq.append(key)
+    return uniq
+
+
+def build_bundle(content_dir: str = "content", bad_per_example: int = 3, seed: int = 0) -> dict:
+    """
+    Собрать payload бандла. id слов — локальные и отрицательные: не пересекаются с id из БД,
+    поэтому word2id из бандла никогда не попадёт в чужое слово после загрузки БД.
+    """
+    from banks import WORD_BANK, STAGE1_EXAMPLES, ALT_OK
+
+    root = Path(content_dir)
+    h = hashlib.sha256()
+    h.update(json.dumps([FORMAT, bad_per_example, seed]).encode())
+
+    # --- слова: (level, pos, word) -> id; первое вхождение побеждает ---
+    words: Dict[Tuple[str, str, str], list] = {}
+
+    def add_word(level, pos, word, translation):
+        key = (level, pos, word)
+        if key not in words:
+            words[key] = [-(len(words) + 1), level, pos, word, translation]
+
+    for r in _read_csv(root / "words.csv"):
+        add_word(r["level"], r["pos"], r["word"], r["translation"])
+    words_en = root / "words_en.json"
+    if words_en.exists():
+        for level, by_pos in json.loads(words_en.read_text(encoding="utf-8")).items():
+            for pos, items in by_pos.items():
+                for it in items:
+                    add_word(level, pos, it["word"], it["translation"])
+    for level, cards in WORD_BANK.items():
+        for c in cards:
+            add_word(level, "adjectives", c.word, c.translation)
+
+    # слово -> id всех его строк (в examples.csv уровень не указан)
+    ids_by_word: Dict[str, List[int]] = {}
+    for wid, _, _, word, _ in words.values():
+        ids_by_word.setdefault(word, []).append(wid)
+
+    # --- примеры ---
+    examples: Dict[int, Dict[str, list]] = {}
+    study: Dict[str, list] = {}
+
+    def add_example(word, kind, en, ru):
+        for wid in ids_by_word.get(word, []):
+            rows = examples.setdefault(wid, {}).setdefault(kind, [])
+            if [en, ru] not in rows:
+                rows.append([en, ru])
+        if kind in ("ok", "alt_ok"):
+            study.setdefault(word, []).append((en, ru))
+
+    for word, e in STAGE1_EXAMPLES.items():
+        add_example(word, "ok", e.text, e.text_ru)
+    for word, alts in ALT_OK.items():
+        for e in alts:
+            add_example(word, "alt_ok", e.text, e.text_ru)
+    for r in _read_csv(root / "examples.csv"):
+        kind = r["kind"]
+        # ручные bad — формат BadRow без ссылки на источник
+        add_example(r["word"], kind, r["en"], r["ru"])
+    for kinds in examples.values():
+        kinds["bad"] = [row + [None, None, None, None] if len(row) == 2 else row for row in kinds.get("bad", [])]
+
+    # сгенерированные bad — тем же генератором, что и сидер
+    by_id = {w[0]: (w[1], w[2], w[3]) for w in words.values()}
+    oks, ok_text = [], {}
+    for wid, kinds in sorted(examples.items()):
+        for en, ru in kinds.get("ok", []) + kinds.get("alt_ok", []):
+            ex_id = len(oks) + 1
+            oks.append((ex_id, wid, en, ru))
+            ok_text[ex_id] = (en, ru)
+    for wid, ex_id, en, ru, repl, highlight in generate_bad_rows(by_id, oks, bad_per_example, seed):
+        src_en, src_ru = ok_text[ex_id]
+        examples[wid].setdefault("bad", []).append([en, ru, repl, highlight, src_en, src_ru])
+
+    episodes = {}
+    for p in sorted((root / "episodes").glob("*.json")) if (root / "episodes").exists() else []:
+        ep = json.loads(p.read_text(encoding="utf-8"))
+        episodes[ep.get("id") or p.stem] = ep
+
+    payload = {
+        "format": FORMAT,
+        "built_at": int(time.time()),
+        "words": sorted(words.values(), key=lambda w: -w[0]),
+        "examples": {str(wid): kinds for wid, kinds in examples.items()},
+        "study_bank": {w: [list(p) for p in _dedup_pairs(pairs)] for w, pairs in study.items()},
+        "episodes": episodes,
+    }
+    h.update(json.dumps([payload["words"], payload["examples"], episodes], ensure_ascii=False, sort_keys=True).encode())
+    payload["hash"] = h.hexdigest()
+    return payload
+
+
+def write_bundle(payload: dict, path: str = DEFAULT_PATH) -> int:
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    blob = MAGIC + bytes([FORMAT]) + zlib.compress(raw, 9)
+    tmp = Path(path).with_suffix(".tmp")
+    tmp.write_bytes(blob)
+    tmp.replace(path)  # атомарно: бот не увидит полузаписанный файл
+    return len(blob)
+
+
+class ContentBundle:
+    """
+    Индексы как у ContentCache (full) + готовые учебные банки:
+      by_level_pos: (level, pos) -> [word_id, ...]
+      words:        word_id -> (word, translation)
+      examples:     word_id -> {kind: [(en, ru), ...]}   ('bad' — BadRow)
+      study_bank:   word -> [(en, ru), ...]              (ok + alt_ok без повторов)
+      episodes:     episode_id -> dict
+    """
+
+    def __init__(self, payload: dict, source: str = "memory"):
+        if payload.get("format") != FORMAT:
+            raise ValueError(f"unsupported bundle format: {payload.get('format')!r}")
+        self.hash: str = payload["hash"]
+        self.built_at: int = payload.get("built_at", 0)
+        self.source = source
+        self.by_level_pos: Dict[Tuple[str, str], List[int]] = {}
+        self.words: Dict[int, Pair] = {}
+        for wid, level, pos, word, translation in payload["words"]:
+            self.words[wid] = (word, translation)
+            self.by_level_pos.setdefault((level, pos), []).append(wid)
+        self.examples: Dict[int, Dict[str, list]] = {
+            int(wid): {kind: [tuple(r) for r in rows] for kind, rows in kinds.items()}
+            for wid, kinds in payload["examples"].items()
+        }
+        self.study_bank: Dict[str, List[Pair]] = {
+            w: [tuple(p) for p in pairs] for w, pairs in payload["study_bank"].items()
+        }
+        self.episodes: Dict[str, dict] = payload.get("episodes", {})
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_PATH) -> "ContentBundle":
+        blob = Path(path).read_bytes()
+        if blob[:4] != MAGIC:
+            raise ValueError(f"{path}: not a content bundle")
+        if blob[4] != FORMAT:
+            raise ValueError(f"{path}: unsupported bundle format {blob[4]}")
+        return cls(json.loads(zlib.decompress(blob[5:]).decode("utf-8")), source=path)
+
+
+def load_bundle(path: str = DEFAULT_PATH, content_dir: str = "content") -> Optional[ContentBundle]:
+    """Бандл с диска; если файла нет или он битый — собираем в памяти из исходников."""
+    try:
+        b = ContentBundle.from_file(path)
+    except FileNotFoundError:
+        b = None
+    except Exception as e:
+        print("content bundle load ERROR:", repr(e))
+        b = None
+    if b is None:
+        try:
+            b = ContentBundle(build_bundle(content_dir))
+        except Exception as e:
+            print("content bundle build ERROR:", repr(e))
+            return None
+    print(f"content bundle ({b.source}): {len(b.words)} words, {len(b.episodes)} episodes, {b.hash[:12]}")
+    return b
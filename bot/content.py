@@ -0,0 +1,301 @@
+# bot/content.py
+# Кэш контента (words/examples) в памяти процесса.
+# Таблицы маленькие и почти read-only: грузим целиком на старте,
+# а дальше игровой день не делает ни одного запроса за контентом.
+#
+# Режимы:
+#   full — words и examples целиком в памяти (по умолчанию);
+#   ids  — в памяти только массивы id по (level, pos), строки берём из БД по PK.
+#          Для словаря на сотни тысяч слов: выборка колоды O(k), без order by random().
+#
+# bundle (см. bundle.py) — стартовые индексы до первой загрузки из БД и на время её недоступности.
+import asyncio, random, time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+CONTENT_CHANNEL = "content_changed"
+
+# подпись содержимого: меняется при любом insert/update/delete
+_VERSION_SQL = """/* content_version */
+select
+  (select count(*) from words) as words,
+  (select coalesce(sum(hashtext(level||'|'||pos||'|'||word||'|'||coalesce(translation,''))::bigint),0) from words) as words_h,
+  (select count(*) from examples) as examples,
+  (select coalesce(sum(hashtext(word_id::text||'|'||kind||'|'||en||'|'||coalesce(ru,''))::bigint),0) from examples) as examples_h
+"""
+
+Pair = Tuple[str, str]
+# kind='bad': (en, ru, replacement, highlight, source_en, source_ru).
+# Сгенерированные сидером строки ссылаются на исходный пример; у ручных последние четыре — None.
+BadRow = Tuple[str, str, Optional[str], Optional[str], Optional[str], Optional[str]]
+
+_EXAMPLES_SQL = """/* content_examples */
+select e.word_id, e.kind, e.en, e.ru, e.replacement, e.highlight, src.en as src_en, src.ru as src_ru
+from examples e
+left join examples src on src.id = e.source_example_id
+"""
+# схема без колонок генерации (сидер ещё не запускался с генерацией)
+_EXAMPLES_SQL_LEGACY = """/* content_examples */
+select e.word_id, e.kind, e.en, e.ru,
+       null::text as replacement, null::text as highlight, null::text as src_en, null::text as src_ru
+from examples e
+"""
+
+
+def _example_row(r):
+    if r["kind"] == "bad":
+        return (r["en"], r["ru"], r["replacement"], r["highlight"], r["src_en"], r["src_ru"])
+    return (r["en"], r["ru"])
+
+
+def sample_distinct(ids: List[int], k: int) -> List[int]:
+    """k различных id равновероятно; стоимость O(k), а не O(len(ids))."""
+    return random.sample(ids, k=min(k, len(ids)))
+
+
+class ContentCache:
+    """
+    Индексы:
+      by_level_pos: (level, pos) -> [word_id, ...]
+      words:        word_id -> (word, translation)          (только full)
+      examples:     word_id -> {kind: [(en, ru), ...]}      (только full; для 'bad' — BadRow)
+    """
+
+    def __init__(
+        self,
+        pool_getter: Callable[[], Awaitable],
+        listener: Optional[Callable] = None,
+        refresh_sec: float = 600.0,
+        retry_sec: float = 30.0,
+        mode: str = "full",
+        bundle=None,
+    ):
+        if mode not in ("full", "ids"):
+            raise ValueError(f"unknown content cache mode: {mode!r}")
+        self.mode = mode
+        self._get_pool = pool_getter
+        self._listener = listener
+        self.refresh_sec = refresh_sec
+        self.retry_sec = retry_sec
+
+        self.by_level_pos: Dict[Tuple[str, str], List[int]] = {}
+        self.words: Dict[int, Pair] = {}
+        self.examples: Dict[int, Dict[str, List[Pair]]] = {}
+        self.version: Optional[tuple] = None
+        self.loaded = False  # индексы из БД
+        self.bundle = bundle
+        self.from_bundle = False
+
+        self._lock = asyncio.Lock()
+        self._last_attempt: Optional[float] = None
+        self._listen_conn = None
+        self._task: Optional[asyncio.Task] = None
+        self._legacy_examples = False
+
+    async def _fetch_examples(self, conn, where: str = "", *args):
+        if not self._legacy_examples:
+            try:
+                async with conn.transaction():  # savepoint: ошибка не рвёт внешнюю транзакцию
+                    return await conn.fetch(_EXAMPLES_SQL + where, *args)
+            except asyncpg.UndefinedColumnError:
+                self._legacy_examples = True
+        return await conn.fetch(_EXAMPLES_SQL_LEGACY + where, *args)
+
+    # --- загрузка ---
+    async def load(self) -> None:
+        async with self._lock:
+            self._last_attempt = time.monotonic()
+            pool = await self._get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    version = tuple(await conn.fetchrow(_VERSION_SQL))
+                    if self.mode == "full":
+                        w_rows = await conn.fetch("/* content_words */ select id, level, pos, word, translation from words")
+                        e_rows = await self._fetch_examples(conn)
+                    else:
+                        w_rows = await conn.fetch("/* content_words */ select id, level, pos from words")
+                        e_rows = []
+
+            by_level_pos: Dict[Tuple[str, str], List[int]] = {}
+            words: Dict[int, Pair] = {}
+            for r in w_rows:
+                if self.mode == "full":
+                    words[r["id"]] = (r["word"], r["translation"])
+                by_level_pos.setdefault((r["level"], r["pos"]), []).append(r["id"])
+
+            examples: Dict[int, Dict[str, List[Pair]]] = {}
+            for r in e_rows:
+                examples.setdefault(r["word_id"], {}).setdefault(r["kind"], []).append(_example_row(r))
+
+            # подменяем индексы целиком — читатели видят либо старую, либо новую версию
+            self.by_level_pos, self.words, self.examples = by_level_pos, words, examples
+            self.version = version
+            self.loaded = True
+            self.from_bundle = False
+            n_words = sum(len(v) for v in by_level_pos.values())
+            print(f"content cache ({self.mode}): {n_words} words, {len(e_rows)} examples")
+
+    def use_bundle(self) -> bool:
+        """Индексы из бандла (всегда как full: всё в памяти). Ids бандла отрицательные — с БД не пересекаются."""
+        if self.bundle is None:
+            return False
+        b = self.bundle
+        self.by_level_pos, self.words, self.examples = b.by_level_pos, b.words, b.examples
+        self.from_bundle = True
+        return True
+
+    @property
+    def _in_memory(self) -> bool:
+        return self.mode == "full" or self.from_bundle
+
+    async def ensure_loaded(self) -> bool:
+        """
+        Ленивая загрузка; при недоступной БД не чаще раза в retry_sec.
+        Пока играем из бандла — в БД отсюда не ходим, перечитывает фоновый цикл.
+        """
+        if self.loaded or self.from_bundle:
+            return True
+        if self._last_attempt is not None and time.monotonic() - self._last_attempt < self.retry_sec:
+            return False
+        try:
+            await self.load()
+        except Exception as e:
+            print("content cache load ERROR:", repr(e))
+        if not self.loaded and self.use_bundle():
+            print("content cache: serving from bundle")
+        return self.loaded or self.from_bundle
+
+    async def check_version(self) -> bool:
+        """Перезагружает кэш, если подпись содержимого изменилась."""
+        pool = await self._get_pool()
+        version = tuple(await pool.fetchrow(_VERSION_SQL))
+        if version != self.version:
+            await self.load()
+            return True
+        return False
+
+    # --- обновление ---
+    def _on_notify(self, *args) -> None:
+        asyncio.get_running_loop().create_task(self._reload_quietly())
+
+    async def _reload_quietly(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            print("content cache reload ERROR:", repr(e))
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            # пока сидим на бандле — пробуем БД чаще
+            await asyncio.sleep(self.refresh_sec if self.loaded else self.retry_sec)
+            try:
+                if self.loaded:
+                    await self.check_version()
+                else:
+                    await self.load()
+            except Exception as e:
+                print("content cache refresh ERROR:", repr(e))
+
+    async def start(self) -> None:
+        # бандл — сразу (играем с первой секунды), БД — следом
+        self.use_bundle()
+        try:
+            await self.load()
+        except Exception as e:
+            print("content cache load ERROR:", repr(e))
+            if self.from_bundle:
+                print("content cache: serving from bundle")
+        if self._listener is not None:
+            # LISTEN не работает через transaction pooler — тогда остаётся периодическая проверка
+            try:
+                self._listen_conn = await self._listener(CONTENT_CHANNEL, self._on_notify)
+            except Exception as e:
+                print("content LISTEN unavailable:", repr(e))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._listen_conn is not None:
+            try:
+                await self._listen_conn.close()
+            except Exception:
+                pass
+            self._listen_conn = None
+
+    # --- выборки (в full-режиме и из бандла — без БД) ---
+    def _bundle_kinds(self, word_id: int) -> Optional[Dict[str, list]]:
+        # id < 0 — слово из бандла (колода набрана из него, пока БД не отдала нужный уровень)
+        if word_id < 0 and self.bundle is not None:
+            return self.bundle.examples.get(word_id) or {}
+        return None
+
+    def sample_ids(self, level: str, pos: str, k: int) -> List[int]:
+        """k случайных word_id уровня из индексов БД (кандидаты в новые слова для review_deck)."""
+        return sample_distinct(self.by_level_pos.get((level, pos)) or [], k) if self.loaded else []
+
+    async def pick_deck(self, level: str, pos: str, k: int) -> List[Tuple[int, str, str]]:
+        picked = sample_distinct(self.by_level_pos.get((level, pos)) or [], k)
+        if not picked and self.bundle is not None and not self.from_bundle:
+            b = self.bundle
+            return [(i, *b.words[i]) for i in sample_distinct(b.by_level_pos.get((level, pos)) or [], k)]
+        return await self.deck_rows(picked)
+
+    async def deck_rows(self, picked: List[int]) -> List[Tuple[int, str, str]]:
+        """(id, word, translation) в порядке picked; в ids-режиме — один запрос по PK."""
+        if self._in_memory or not picked:
+            return [(i, *self.words[i]) for i in picked if i in self.words]
+        pool = await self._get_pool()
+        rows = await pool.fetch(
+            "/* deck_words */ select id, word, translation from words where id = any($1)", picked
+        )
+        by_id = {r["id"]: (r["id"], r["word"], r["translation"]) for r in rows}
+        return [by_id[i] for i in picked if i in by_id]
+
+    async def pick_morning_example(self, word_id: int) -> Optional[Pair]:
+        kinds = self._bundle_kinds(word_id)
+        if kinds is None and self._in_memory:
+            kinds = self.examples.get(word_id) or {}
+        if kinds is not None:
+            pool = kinds.get("ok") or kinds.get("alt_ok")
+            return random.choice(pool) if pool else None
+        pool = await self._get_pool()
+        # examples(word_id, kind) — индекс; сортируются только примеры одного слова
+        row = await pool.fetchrow(
+            """/* morning_example */
+            select en, ru
+            from examples
+            where word_id = $1 and kind in ('ok','alt_ok')
+            order by (case when kind='ok' then 0 else 1 end), random()
+            limit 1
+            """,
+            word_id
+        )
+        return (row["en"], row["ru"]) if row else None
+
+    async def evening_pools_many(self, word_ids: List[int]) -> Dict[int, Tuple[List[Pair], List[BadRow]]]:
+        """word_id -> (ok, bad) для всей колоды; в ids-режиме — один запрос."""
+        out: Dict[int, Tuple[List[Pair], List[BadRow]]] = {wid: ([], []) for wid in word_ids}
+        remote = []
+        for wid in word_ids:
+            kinds = self._bundle_kinds(wid)
+            if kinds is None and self._in_memory:
+                kinds = self.examples.get(wid) or {}
+            if kinds is None:
+                remote.append(wid)
+            else:
+                out[wid] = (kinds.get("ok", []) + kinds.get("alt_ok", []), list(kinds.get("bad", [])))
+        if not remote:
+            return out
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            rows = await self._fetch_examples(
+                conn, " where e.word_id = any($1) and e.kind in ('ok','alt_ok','bad')", remote
+            )
+        for r in rows:
+            ok_rows, bad_rows = out[r["word_id"]]
+            (bad_rows if r["kind"] == "bad" else ok_rows).append(_example_row(r))
+        return out
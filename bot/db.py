@@ -1,14 +1,21 @@
 # bot/db.py
-import os, ssl, certifi, asyncpg
-from typing import Optional
+import os, re, ssl, time, uuid, asyncio, certifi, asyncpg
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Deque, Dict, List, Tuple
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
-_DB_POOL: Optional[asyncpg.Pool] = None
+from breaker import CircuitBreaker, CircuitOpenError, is_connection_lost, is_timeout, is_transient, is_unavailable
+from journal import Journal
+from metrics import REGISTRY
 
+_DB_POOL: Optional["InstrumentedPool"] = None
+_POOL_LOCK = asyncio.Lock()
+
+# На импорте только читаем env: SSL-контекст и DSN строятся при первом подключении,
+# отсутствие DATABASE_URL — ошибка get_pool(), а не импорта.
 DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is missing")
 
 def _ensure_sslmode_verify_full(dsn: str) -> str:
     parts = urlparse(dsn)
@@ -32,66 +39,493 @@ def _make_ssl_ctx() -> ssl.SSLContext:
     ctx.verify_mode = ssl.CERT_REQUIRED
     return ctx
 
-_SSL_CTX = _make_ssl_ctx()
-_DSN_VERIFIED = _ensure_sslmode_verify_full(DATABASE_URL)
+_CONN_ARGS: Optional[tuple] = None
+
+def _conn_args() -> tuple:
+    """(dsn, ssl_ctx) — строятся один раз, при первом подключении."""
+    global _CONN_ARGS
+    if _CONN_ARGS is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL is missing")
+        _CONN_ARGS = (_ensure_sslmode_verify_full(DATABASE_URL), _make_ssl_ctx())
+    return _CONN_ARGS
+
+# --- POOL CONFIG ---
+# DB_POOLER: auto | transaction | session | direct.
+# В transaction-режиме PgBouncer/Supavisor prepared statements ломаются — кэш выключаем;
+# через session pooler и напрямую кэш безопасен, и запросы не парсятся заново.
+# auto узнаёт только Supabase (6543 — transaction, *pooler* — session) и локальный Postgres;
+# любой другой хост может оказаться PgBouncer'ом в transaction-режиме, поэтому он «unknown»
+# и кэш выключен. Свой PgBouncer/прямое подключение — задайте DB_POOLER явно.
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+def _detect_pooler(dsn: str) -> str:
+    forced = os.environ.get("DB_POOLER", "auto").strip().lower()
+    if forced in ("transaction", "session", "direct"):
+        return forced
+    parts = urlparse(dsn)
+    host = (parts.hostname or "").lower()
+    if parts.port == 6543:
+        return "transaction"  # Supabase: 6543 — transaction pooler
+    if "pooler" in host:
+        return "session"      # тот же хост на 5432 — session pooler
+    if host in _LOCAL_HOSTS or (host.startswith("db.") and host.endswith(".supabase.co")):
+        return "direct"
+    return "unknown"
+
+DB_POOLER = _detect_pooler(DATABASE_URL)
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "5"))
+DB_STATEMENT_CACHE_SIZE = (
+    0 if DB_POOLER in ("transaction", "unknown")
+    else int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100"))
+)
+
+# --- DEADLINES / CIRCUIT BREAKER ---
+# Каждый запрос ограничен по времени: command_timeout пула — общий потолок,
+# запросы на пути игрока (пользователь, старт сессии) — короче (DB_FAST_TIMEOUT).
+# Сбои связи/таймауты считает BREAKER; разомкнутая цепь отказывает сразу, а записи уходят в журнал (journal()).
+DB_QUERY_TIMEOUT = float(os.environ.get("DB_QUERY_TIMEOUT", "10"))
+DB_FAST_TIMEOUT = float(os.environ.get("DB_FAST_TIMEOUT", "2"))
+DB_ACQUIRE_TIMEOUT = float(os.environ.get("DB_ACQUIRE_TIMEOUT", "2"))
+DB_CONNECT_TIMEOUT = float(os.environ.get("DB_CONNECT_TIMEOUT", "5"))
+BREAKER = CircuitBreaker(
+    failure_threshold=int(os.environ.get("DB_BREAKER_FAILURES", "3")),
+    reset_sec=float(os.environ.get("DB_BREAKER_RESET_SEC", "10")),
+)
+# пустой DB_JOURNAL_PATH — без журнала (записи при недоступной БД теряются, как раньше)
+DB_JOURNAL_PATH = os.environ.get("DB_JOURNAL_PATH", "db_journal.sqlite3").strip()
+_JOURNAL: Optional[Journal] = None
+
+def journal() -> Optional[Journal]:
+    """
+    Журнал открывается при первой записи/доигрывании (цикл RESULT_WRITER), а не при импорте:
+    скрипты и --profile-startup, импортирующие db, файлов журнала не создают.
+    """
+    global _JOURNAL
+    if _JOURNAL is None and DB_JOURNAL_PATH and DATABASE_URL:
+        _JOURNAL = Journal(DB_JOURNAL_PATH)
+    return _JOURNAL
+
+# --- POOL METRICS ---
+POOL_ACQUIRE_SECONDS = REGISTRY.histogram("db_pool_acquire_seconds", "Wait time for a pool connection")
+POOL_IN_USE = REGISTRY.gauge("db_pool_in_use", "Connections currently checked out")
+POOL_SIZE = REGISTRY.gauge("db_pool_size", "Open connections in the pool")
+QUERY_SECONDS = REGISTRY.histogram("db_query_seconds", "Query duration by statement", ["query"])
+QUERY_ERRORS = REGISTRY.counter("db_query_errors_total", "Failed queries by statement", ["query"])
+
+_WS = re.compile(r"\s+")
+_NAME = re.compile(r"^\s*/\*\s*([\w.-]+)\s*\*/")
+
+def _query_label(sql: str) -> str:
+    # имя из ведущего комментария /* name */, иначе «отпечаток»: первые слова без переносов
+    m = _NAME.match(sql)
+    if m:
+        return m.group(1)
+    return _WS.sub(" ", sql).strip()[:60]
+
+def _log_query(record) -> None:
+    label = _query_label(record.query)
+    QUERY_SECONDS.observe(record.elapsed, query=label)
+    if record.exception is not None:
+        QUERY_ERRORS.inc(query=label)
+
+async def _init_conn(conn: asyncpg.Connection) -> None:
+    conn.add_query_logger(_log_query)
+
 
-async def get_pool() -> asyncpg.Pool:
+class InstrumentedPool:
+    """
+    Обёртка над asyncpg.Pool: меряет ожидание acquire и число занятых соединений.
+    Остальное (get_size, close, ...) проксируется в пул как есть.
+    """
+
+    def __init__(self, pool: asyncpg.Pool):
+        self._pool = pool
+        self.in_use = 0
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        probe = BREAKER.check()
+        t0 = time.perf_counter()
+        try:
+            conn = await self._pool.acquire(timeout=timeout or DB_ACQUIRE_TIMEOUT)
+        except asyncio.CancelledError:
+            BREAKER.cancelled(probe)
+            raise
+        except Exception as e:
+            # таймаут при занятых всех соединениях — перегрузка пула, а не недоступная БД
+            if is_unavailable(e) or (is_timeout(e) and self.in_use < self._pool.get_max_size()):
+                BREAKER.failure()
+            elif probe:  # пробный вызов так и не дошёл до БД — как отменённый
+                BREAKER.cancelled(probe)
+            raise
+        POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - t0)
+        self.in_use += 1
+        POOL_IN_USE.set(self.in_use)
+        try:
+            yield conn
+        except asyncio.CancelledError:
+            BREAKER.cancelled(probe)
+            raise
+        except Exception as e:
+            if is_connection_lost(e, conn):
+                BREAKER.failure()
+            elif probe or not isinstance(e, CircuitOpenError):
+                # соединение живо: ошибка, таймаут или отмена запроса, либо сбой в коде вызывающего
+                # (диск, сеть к Telegram). Отказ вложенного вызова по открытой цепи — не ответ БД,
+                # но пробный вызов его соединением всё равно прошёл.
+                BREAKER.success()
+            raise
+        else:
+            BREAKER.success()
+        finally:
+            self.in_use -= 1
+            POOL_IN_USE.set(self.in_use)
+            await self._pool.release(conn)
+
+    async def execute(self, query: str, *args, timeout: Optional[float] = None):
+        async with self.acquire() as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args, *, timeout: Optional[float] = None):
+        async with self.acquire() as conn:
+            return await conn.executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: Optional[float] = None):
+        async with self.acquire() as conn:
+            return await conn.fetch(query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: Optional[float] = None):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: Optional[float] = None):
+        async with self.acquire() as conn:
+            return await conn.fetchval(query, *args, column=column, timeout=timeout)
+
+    def stats(self) -> dict:
+        POOL_SIZE.set(self._pool.get_size())
+        wait = POOL_ACQUIRE_SECONDS.snapshot()
+        return {
+            "pooler": DB_POOLER,
+            "statement_cache": DB_STATEMENT_CACHE_SIZE,
+            "min_size": self._pool.get_min_size(),
+            "max_size": self._pool.get_max_size(),
+            "size": self._pool.get_size(),
+            "idle": self._pool.get_idle_size(),
+            "in_use": self.in_use,
+            "acquires": int(wait["count"]),
+            "acquire_avg_ms": round(wait["avg"] * 1000, 2),
+            "acquire_p95_ms": round(wait["p95"] * 1000, 2),
+            "acquire_max_ms": round(wait["max"] * 1000, 2),
+        }
+
+
+async def get_pool() -> InstrumentedPool:
     global _DB_POOL
     if _DB_POOL is None:
-        _DB_POOL = await asyncpg.create_pool(
-            _DSN_VERIFIED,
-            min_size=1, max_size=5,
-            ssl=_SSL_CTX,
-            statement_cache_size=0,  # важно из-за PgBouncer
-        )
+        probe = BREAKER.check()  # БД лежит — не ждём connect-таймаут на каждом вызове
+        async with _POOL_LOCK:
+            if _DB_POOL is None:
+                dsn, ssl_ctx = _conn_args()
+                try:
+                    pool = await asyncpg.create_pool(
+                        dsn,
+                        min_size=DB_POOL_MIN, max_size=DB_POOL_MAX,
+                        ssl=ssl_ctx,
+                        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                        init=_init_conn,
+                        timeout=DB_CONNECT_TIMEOUT,
+                        command_timeout=DB_QUERY_TIMEOUT,
+                    )
+                except asyncio.CancelledError:
+                    BREAKER.cancelled(probe)
+                    raise
+                except Exception as e:
+                    if is_unavailable(e) or is_timeout(e):
+                        BREAKER.failure()
+                    raise
+                BREAKER.success()
+                print(f"DB pool: pooler={DB_POOLER}, size={DB_POOL_MIN}..{DB_POOL_MAX}, "
+                      f"statement_cache={DB_STATEMENT_CACHE_SIZE}")
+                pool = InstrumentedPool(pool)
+                try:
+                    await _detect_columns(pool)
+                except BaseException:
+                    # иначе каждый следующий вызов открывает новый пул и держит DB_POOL_MIN соединений
+                    await pool.close()
+                    raise
+                _DB_POOL = pool
     return _DB_POOL
 
+def current_pool() -> Optional[InstrumentedPool]:
+    """Пул, если он уже создан (для метрик: скрейп не должен открывать соединения)."""
+    return _DB_POOL
+
+async def warm_up(timeout: float = 10.0) -> dict:
+    """
+    Явный прогрев до старта polling/webhook: пул (TLS-рукопожатия min_size соединений)
+    и по round-trip на каждом — первый игрок не платит за подключение.
+    """
+    t0 = time.perf_counter()
+    pool = await asyncio.wait_for(get_pool(), timeout)
+    t1 = time.perf_counter()
+
+    async def _ping():
+        async with pool.acquire(timeout=timeout) as conn:
+            await conn.fetchval("/* warm_up */ select 1")
+
+    n = max(DB_POOL_MIN, 1)
+    await asyncio.wait_for(asyncio.gather(*(_ping() for _ in range(n))), timeout)
+    return {
+        "connections": pool.get_size(),
+        "pool_ms": round((t1 - t0) * 1000, 1),
+        "ping_ms": round((time.perf_counter() - t1) * 1000, 1),
+    }
+
+def query_stats(top: int = 10) -> List[dict]:
+    """Самые «дорогие» запросы по суммарному времени."""
+    rows = []
+    for (label,) in QUERY_SECONDS.label_values():
+        st = QUERY_SECONDS.snapshot(query=label)
+        rows.append({"query": label, **st, "total": st["avg"] * st["count"]})
+    rows.sort(key=lambda r: r["total"], reverse=True)
+    return rows[:top]
+
+# --- SCHEMA ---
+# Идемпотентные дополнения к схеме (таблицы создаются в Supabase вручную).
+_SCHEMA_DDL = [
+    # выборка колоды по id-массивам и примеры одного слова — только по индексам
+    "create index if not exists words_level_pos_idx on words(level, pos, id)",
+    "create index if not exists examples_word_kind_idx on examples(word_id, kind)",
+    # сгенерированные сидером kind='bad' (scripts/seed_content.py --bad-per-example)
+    """alter table examples
+         add column if not exists source_example_id bigint references examples(id) on delete cascade,
+         add column if not exists replacement text,
+         add column if not exists highlight text""",
+    # игровое состояние (STATE_BACKEND=postgres): сжатый json, пишется на переходах игры
+    """create table if not exists game_state (
+         telegram_id bigint primary key,
+         data bytea not null,
+         updated_at timestamptz not null default now()
+       )""",
+    # роллап для /stats (заполнить по истории: scripts/backfill_user_stats.py)
+    """create table if not exists user_stats (
+         user_id bigint primary key,
+         total bigint not null default 0,
+         correct bigint not null default 0,
+         sum_delta bigint not null default 0,
+         updated_at timestamptz not null default now()
+       )""",
+    # интервальное повторение: состояние слова у игрока (SM-2), обновляется пачками результатов.
+    # level/pos продублированы из words, чтобы выборка колоды шла по одному индексу
+    """create table if not exists word_mastery (
+         user_id bigint not null,
+         word_id bigint not null,
+         level text not null,
+         pos text not null,
+         reps int not null default 0,
+         ease real not null default 2.5,
+         interval_days int not null default 0,
+         due_at timestamptz not null default now(),
+         last_quality smallint not null default 0,
+         seen bigint not null default 0,
+         correct bigint not null default 0,
+         updated_at timestamptz not null default now(),
+         primary key (user_id, word_id)
+       )""",
+    "create index if not exists word_mastery_due_idx on word_mastery(user_id, level, pos, due_at)",
+    # client_key — идемпотентное доигрывание журнала (journal.py): повтор той же записи ничего не меняет
+    "alter table sessions add column if not exists client_key text",
+    "create unique index if not exists sessions_client_key_key on sessions(client_key) where client_key is not null",
+    "alter table results add column if not exists client_key text",
+    "create unique index if not exists results_client_key_key on results(client_key) where client_key is not null",
+    # file_id уже загруженных файлов (assets.py); file_id привязан к боту — отсюда bot_id в ключе
+    """create table if not exists tg_file_ids (
+         bot_id bigint not null,
+         key text not null,
+         file_id text not null,
+         kind text not null,
+         size bigint not null default 0,
+         created_at timestamptz not null default now(),
+         primary key (bot_id, key)
+       )""",
+    # лидерборд для /top: лучший финальный баланс игрока по уровню и в целом (scope='all').
+    # Ранги считаются при refresh_leaderboard, чтение — только по индексам.
+    """create materialized view if not exists leaderboard as
+       with agg as (
+         select s.user_id,
+                case when grouping(s.level) = 1 then 'all' else s.level end as scope,
+                max(s.balance) as best,
+                count(*) as games
+         from sessions s
+         where s.finished_at is not null and s.balance is not null
+         group by grouping sets ((s.user_id, s.level), (s.user_id))
+       )
+       select user_id, scope, best, games,
+              rank() over (partition by scope order by best desc) as rnk,
+              count(*) over (partition by scope) as players
+       from agg""",
+    # уникальный индекс нужен для refresh ... concurrently
+    "create unique index if not exists leaderboard_user_scope_key on leaderboard(user_id, scope)",
+    "create index if not exists leaderboard_scope_rnk_idx on leaderboard(scope, rnk)",
+]
+
+async def ensure_schema() -> None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        for ddl in _SCHEMA_DDL:
+            try:
+                await conn.execute(ddl)
+            except Exception as e:
+                # нет прав на DDL — работаем на том, что есть
+                print("schema WARN:", ddl.split("(")[0].strip(), repr(e))
+        # уникальность telegram id: закрывает гонку двойной регистрации и включает upsert
+        try:
+            await conn.execute(
+                f"create unique index if not exists users_{_USERS_TG_COL}_key on users({_USERS_TG_COL})"
+            )
+        except Exception as e:
+            print("schema WARN: users unique index", repr(e))
+    await _detect_columns(pool)  # client_key могли только что добавить
+
+async def listen(channel: str, callback) -> asyncpg.Connection:
+    """
+    LISTEN на отдельном соединении (мимо пула: пулер в transaction-режиме
+    не доставляет NOTIFY). Соединение нужно держать открытым.
+    """
+    dsn, ssl_ctx = _conn_args()
+    conn = await asyncpg.connect(dsn, ssl=ssl_ctx, statement_cache_size=DB_STATEMENT_CACHE_SIZE)
+    await conn.add_listener(channel, callback)
+    return conn
+
 # --- USERS ---
+# Колонка с telegram id: 'telegram_id' (новая схема) или 'tg_id' (старая).
+# Определяется один раз при создании пула.
+_USERS_TG_COL = "telegram_id"
+# False — на колонке нет уникального индекса, ON CONFLICT недоступен
+_USERS_UPSERT = True
+
+_USER_IDS: "OrderedDict[int, int]" = OrderedDict()  # telegram_id -> users.id (LRU)
+USER_ID_CACHE_SIZE = int(os.environ.get("USER_ID_CACHE_SIZE", "10000"))
+
+# True — в sessions и results есть client_key (ensure_schema); без него журнал доигрывается без дедупликации
+_CLIENT_KEYS = False
+
+async def _detect_columns(pool: "InstrumentedPool") -> None:
+    global _USERS_TG_COL, _CLIENT_KEYS
+    cols = {(r["table_name"], r["column_name"]) for r in await pool.fetch(
+        """select table_name, column_name from information_schema.columns
+           where table_schema = current_schema() and table_name in ('users', 'sessions', 'results')"""
+    )}
+    if ("users", "telegram_id") not in cols and ("users", "tg_id") in cols:
+        _USERS_TG_COL = "tg_id"
+    _CLIENT_KEYS = ("sessions", "client_key") in cols and ("results", "client_key") in cols
+
+def _remember_user(tg_id: int, uid: int) -> int:
+    _USER_IDS[tg_id] = uid
+    _USER_IDS.move_to_end(tg_id)
+    while len(_USER_IDS) > USER_ID_CACHE_SIZE:
+        _USER_IDS.popitem(last=False)
+    return uid
+
 async def ensure_user(tg_id: int) -> int:
     """
     Возвращает users.id. Работает и с колонкой 'telegram_id', и с 'tg_id'.
-    Не требует уникального индекса: сначала SELECT, потом INSERT.
+    Повторные вызовы отвечают из LRU без БД; иначе — один атомарный upsert.
     """
+    global _USERS_UPSERT
+    uid = _USER_IDS.get(tg_id)
+    if uid:
+        _USER_IDS.move_to_end(tg_id)
+        return uid
+
     pool = await get_pool()
+    col = _USERS_TG_COL
     async with pool.acquire() as conn:
-        # Сначала пытаемся со схемой telegram_id
-        try:
-            uid = await conn.fetchval("select id from users where telegram_id=$1", tg_id)
-            if uid:
-                return uid
-            uid = await conn.fetchval(
-                "insert into users(telegram_id) values($1) returning id",
-                tg_id
-            )
-            return uid
-        except asyncpg.UndefinedColumnError:
-            # Фолбэк на старую схему tg_id
-            uid = await conn.fetchval("select id from users where tg_id=$1", tg_id)
-            if uid:
-                return uid
-            uid = await conn.fetchval(
-                "insert into users(tg_id) values($1) returning id",
-                tg_id
-            )
-            return uid
+        if _USERS_UPSERT:
+            try:
+                # do update (а не do nothing), чтобы returning вернул и существующую строку
+                uid = await conn.fetchval(
+                    f"""/* user_upsert */ insert into users({col}) values($1)
+                        on conflict ({col}) do update set {col} = excluded.{col}
+                        returning id""",
+                    tg_id, timeout=DB_FAST_TIMEOUT
+                )
+                return _remember_user(tg_id, uid)
+            except asyncpg.InvalidColumnReferenceError:
+                # уникального индекса нет (см. ensure_schema) — старый путь
+                _USERS_UPSERT = False
+        uid = await conn.fetchval(f"/* user_select */ select id from users where {col}=$1", tg_id,
+                                  timeout=DB_FAST_TIMEOUT)
+        if not uid:
+            uid = await conn.fetchval(f"/* user_insert */ insert into users({col}) values($1) returning id", tg_id,
+                                      timeout=DB_FAST_TIMEOUT)
+        return _remember_user(tg_id, uid)
 
 # --- SESSIONS ---
-async def start_session(user_id: int, level: str) -> int:
+async def start_session(user_id: int, level: str, client_key: Optional[str] = None,
+                        timeout: Optional[float] = DB_FAST_TIMEOUT) -> int:
     pool = await get_pool()
     async with pool.acquire() as conn:
+        if not (_CLIENT_KEYS and client_key):
+            return await conn.fetchval(
+                "/* session_start */ insert into sessions(user_id, level) values($1,$2) returning id",
+                user_id, level, timeout=timeout
+            )
+        # повтор из журнала: сессия с этим ключом уже могла доехать (ответ потерялся по таймауту)
         sid = await conn.fetchval(
-            "insert into sessions(user_id, level) values($1,$2) returning id",
-            user_id, level
+            """/* session_start */ insert into sessions(user_id, level, client_key) values($1,$2,$3)
+               on conflict (client_key) where client_key is not null do nothing returning id""",
+            user_id, level, client_key, timeout=timeout
         )
+        if sid is None:
+            sid = await conn.fetchval(
+                "/* session_by_key */ select id from sessions where client_key=$1", client_key, timeout=timeout
+            )
         return sid
 
+async def begin_session(tg_id: int, level: str) -> Tuple[int, int]:
+    """
+    (users.id, sessions.id) для start_day. БД недоступна или не уложилась в DB_FAST_TIMEOUT —
+    сессия пишется в журнал: (0, отрицательный локальный id), игра идёт дальше без ожидания.
+    """
+    client_key = uuid.uuid4().hex
+    try:
+        uid = await ensure_user(tg_id)
+        return uid, await start_session(uid, level, client_key)
+    except Exception as e:
+        j = journal()
+        if j is None:
+            raise
+        if not isinstance(e, CircuitOpenError):
+            print("start_session ERROR, journaling:", repr(e))
+        local = j.append("session_start", {"tg_id": tg_id, "level": level, "client_key": client_key})
+        return 0, -local
+
 async def finish_session(session_id: int, final_balance: int) -> None:
-    pool = await get_pool()
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "update sessions set finished_at=now(), balance=$2 where id=$1",
-            session_id, final_balance
-        )
+    # отрицательный id — сессия из журнала (begin_session), значит журнал уже открыт
+    sid = session_id if session_id > 0 else journal().real_sid(session_id)
+    try:
+        if sid is None:
+            raise CircuitOpenError("session is still in the journal")
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute(
+                "/* session_finish */ update sessions set finished_at=now(), balance=$2 where id=$1",
+                sid, final_balance, timeout=DB_FAST_TIMEOUT
+            )
+    except Exception as e:
+        j = journal()
+        if j is None:
+            raise
+        if not isinstance(e, CircuitOpenError):
+            print("finish_session ERROR, journaling:", repr(e))
+        j.append("session_finish", {"session_id": session_id, "balance": final_balance})
 
 # --- RESULTS ---
 async def append_result(
@@ -109,8 +543,446 @@ async def append_result(
     pool = await get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
-            """insert into results
+            """/* result_insert */ insert into results
                (session_id, item_index, sentence_en, sentence_ru, truth, user_choice, employee_card, outcome, delta, balance_after)
                values ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10)""",
             session_id, item_index, sentence_en, sentence_ru, truth, user_choice, employee_card, outcome, delta, balance_after
         )
+
+# --- USER STATS ---
+# Роллап по игроку: обновляется каждой пачкой результатов, /stats читает одну строку.
+async def _rollup_user_stats(conn: asyncpg.Connection, batch: List[tuple]) -> None:
+    per_session = {}
+    for rec in batch:
+        sid, truth, choice, delta = rec[0], rec[4], rec[5], rec[8]
+        agg = per_session.setdefault(sid, [0, 0, 0])
+        agg[0] += 1
+        agg[1] += 1 if truth == choice else 0
+        agg[2] += delta or 0
+    sids = list(per_session)
+    await conn.execute(
+        """/* user_stats_rollup */
+        insert into user_stats(user_id, total, correct, sum_delta, updated_at)
+        select s.user_id, sum(b.n), sum(b.c), sum(b.d), now()
+        from unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::bigint[]) as b(session_id, n, c, d)
+        join sessions s on s.id = b.session_id
+        group by s.user_id
+        on conflict (user_id) do update set
+          total = user_stats.total + excluded.total,
+          correct = user_stats.correct + excluded.correct,
+          sum_delta = user_stats.sum_delta + excluded.sum_delta,
+          updated_at = now()
+        """,
+        sids,
+        [per_session[x][0] for x in sids],
+        [per_session[x][1] for x in sids],
+        [per_session[x][2] for x in sids],
+    )
+
+async def get_user_stats(user_id: int) -> dict:
+    pool = await get_pool()
+    row = await pool.fetchrow(
+        "/* user_stats_get */ select total, correct, sum_delta from user_stats where user_id=$1", user_id
+    )
+    if row is None:
+        return {"total": 0, "correct": 0, "sum_delta": 0}
+    return dict(row)
+
+# --- WORD MASTERY (SM-2) ---
+# Одна оценка на (игрок, слово) за пачку: q=5 — все ответы верны, 3 — большинство, 1 — провал.
+# q < 3 сбрасывает повторения; интервалы 1 → 6 → interval * ease дней.
+_SM2_INTERVAL = """case when excluded.last_quality < 3 or word_mastery.reps = 0 then 1
+                        when word_mastery.reps = 1 then 6
+                        else greatest(1, round(word_mastery.interval_days * word_mastery.ease))::int end"""
+
+_MASTERY_UPSERT = f"""/* word_mastery_rollup */
+with b as (
+  select s.user_id, b.word_id, sum(b.n) as n, sum(b.c) as c
+  from unnest($1::bigint[], $2::bigint[], $3::bigint[], $4::bigint[]) as b(session_id, word_id, n, c)
+  join sessions s on s.id = b.session_id
+  group by s.user_id, b.word_id
+), q as (
+  select b.*, w.level, w.pos,
+         (case when b.c = b.n then 5 when b.c * 2 >= b.n then 3 else 1 end)::smallint as q
+  from b join words w on w.id = b.word_id
+)
+insert into word_mastery(user_id, word_id, level, pos, reps, ease, interval_days, due_at,
+                         last_quality, seen, correct, updated_at)
+select user_id, word_id, level, pos, (q >= 3)::int,
+       greatest(1.3, 2.5 + 0.1 - (5 - q) * (0.08 + (5 - q) * 0.02)),
+       1, now() + interval '1 day', q, n, c, now()
+from q
+on conflict (user_id, word_id) do update set
+  reps = case when excluded.last_quality < 3 then 0 else word_mastery.reps + 1 end,
+  interval_days = {_SM2_INTERVAL},
+  due_at = now() + interval '1 day' * ({_SM2_INTERVAL}),
+  ease = greatest(1.3, word_mastery.ease + 0.1
+                  - (5 - excluded.last_quality) * (0.08 + (5 - excluded.last_quality) * 0.02)),
+  last_quality = excluded.last_quality,
+  seen = word_mastery.seen + excluded.seen,
+  correct = word_mastery.correct + excluded.correct,
+  updated_at = now()
+"""
+
+async def _rollup_word_mastery(conn: asyncpg.Connection, batch: List[tuple]) -> None:
+    # word_id — необязательный 11-й элемент записи (см. log_result); слова бандла (id < 0) не учитываем
+    per_word = {}
+    for rec in batch:
+        wid = rec[10] if len(rec) > 10 else None
+        if not wid or wid < 0:
+            continue
+        agg = per_word.setdefault((rec[0], wid), [0, 0])
+        agg[0] += 1
+        agg[1] += 1 if rec[4] == rec[5] else 0
+    if not per_word:
+        return
+    keys = list(per_word)
+    await conn.execute(
+        _MASTERY_UPSERT,
+        [k[0] for k in keys], [k[1] for k in keys],
+        [per_word[k][0] for k in keys], [per_word[k][1] for k in keys],
+    )
+
+# Колода: сначала слова, которым пора на повторение (давно просроченные — первыми),
+# затем новые из кандидатов (случайная выборка из кэша контента), затем ближайшие по due_at.
+# Все ветки — по индексам word_mastery; история results не читается.
+REVIEW_DECK_SQL = """/* review_deck */
+(select word_id, 0 as pri, due_at from word_mastery
+  where user_id = $1 and level = $2 and pos = $3 and due_at <= now()
+  order by due_at limit $5)
+union all
+(select c.id, 1, null from unnest($4::bigint[]) with ordinality as c(id, ord)
+  where not exists (select 1 from word_mastery m where m.user_id = $1 and m.word_id = c.id)
+  order by c.ord limit $5)
+union all
+(select word_id, 2, due_at from word_mastery
+  where user_id = $1 and level = $2 and pos = $3 and due_at > now()
+  order by due_at limit $5)
+order by pri, due_at nulls last
+limit $5
+"""
+
+async def pick_review_deck(user_id: int, level: str, pos: str, candidates: List[int], k: int) -> List[int]:
+    """k word_id: due → новые (из candidates) → скоро due."""
+    pool = await get_pool()
+    rows = await pool.fetch(REVIEW_DECK_SQL, user_id, level, pos, candidates, k)
+    return [r["word_id"] for r in rows]
+
+# --- TELEGRAM FILE IDS ---
+async def load_file_id(bot_id: int, key: str) -> Optional[str]:
+    pool = await get_pool()
+    return await pool.fetchval(
+        "/* file_id_get */ select file_id from tg_file_ids where bot_id=$1 and key=$2", bot_id, key
+    )
+
+async def save_file_id(bot_id: int, key: str, file_id: str, kind: str, size: int = 0) -> None:
+    """Ключ «слот#содержимое» (см. assets.py) вытесняет прежние ключи того же слота: экспорт не копит строки."""
+    head, sep, _ = key.partition("#")
+    pool = await get_pool()
+    await pool.execute(
+        """/* file_id_put */ with gone as (
+             delete from tg_file_ids where bot_id=$1 and $6::text is not null and starts_with(key, $6) and key <> $2
+           )
+           insert into tg_file_ids(bot_id, key, file_id, kind, size) values ($1,$2,$3,$4,$5)
+           on conflict (bot_id, key) do update set file_id = excluded.file_id, created_at = now()""",
+        bot_id, key, file_id, kind, size, head + sep if sep else None
+    )
+
+async def forget_file_id(bot_id: int, key: str) -> None:
+    pool = await get_pool()
+    await pool.execute("/* file_id_forget */ delete from tg_file_ids where bot_id=$1 and key=$2", bot_id, key)
+
+# --- LEADERBOARD ---
+# Материализованное представление (см. _SCHEMA_DDL) пересчитывается фоном раз в несколько минут:
+# /top не сортирует sessions, а читает готовые ранги по индексу.
+_LEADERBOARD_LOCK = 0x746F70  # advisory-lock: из нескольких инстансов пересчитывает один
+# пересчёт — фоновая тяжёлая работа: свой потолок, а не command_timeout пула (DB_QUERY_TIMEOUT)
+LEADERBOARD_REFRESH_TIMEOUT = float(os.environ.get("LEADERBOARD_REFRESH_TIMEOUT", "300"))
+
+async def refresh_leaderboard(timeout: Optional[float] = None) -> bool:
+    """False — пересчёт уже идёт в другом процессе. timeout=None — LEADERBOARD_REFRESH_TIMEOUT."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            got = await conn.fetchval(
+                "/* leaderboard_lock */ select pg_try_advisory_xact_lock($1)", _LEADERBOARD_LOCK
+            )
+            if not got:
+                return False
+            # concurrently: читатели не блокируются на время пересчёта
+            await conn.execute(
+                "/* leaderboard_refresh */ refresh materialized view concurrently leaderboard",
+                timeout=timeout or LEADERBOARD_REFRESH_TIMEOUT,
+            )
+    return True
+
+async def leaderboard_top(limit: int = 10) -> List[dict]:
+    """Первые места каждого scope (при равных баллах строк может быть больше limit)."""
+    pool = await get_pool()
+    rows = await pool.fetch(
+        """/* leaderboard_top */ select scope, rnk, user_id, best, games, players
+           from leaderboard where rnk <= $1 order by scope, rnk, user_id""",
+        limit
+    )
+    return [dict(r) for r in rows]
+
+async def leaderboard_rank(user_id: int) -> Dict[str, dict]:
+    """scope -> {rnk, best, games, players} для одного игрока."""
+    pool = await get_pool()
+    rows = await pool.fetch(
+        "/* leaderboard_rank */ select scope, rnk, best, games, players from leaderboard where user_id=$1",
+        user_id
+    )
+    return {r["scope"]: dict(r) for r in rows}
+
+# --- RESULTS: write-behind ---
+# Хендлеры кладут запись в очередь и сразу отвечают игроку;
+# фоновая задача сбрасывает пачки через COPY (фолбэк — executemany).
+RESULT_COLUMNS = (
+    "session_id", "item_index", "sentence_en", "sentence_ru", "truth",
+    "user_choice", "employee_card", "outcome", "delta", "balance_after",
+)
+
+class ResultWriter:
+    def __init__(self, batch_size: int = 200, flush_sec: float = 1.0, max_backlog: int = 50_000):
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self.max_backlog = max_backlog
+        self._pending: Deque[tuple] = deque()
+        self._inflight = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    @property
+    def backlog(self) -> int:
+        """Сколько записей ещё не доехало до БД."""
+        return len(self._pending) + self._inflight
+
+    def submit(self, record: tuple) -> None:
+        """Не блокирует. При переполнении выбрасываем самые старые записи."""
+        if len(self._pending) >= self.max_backlog:
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _route(self, batch: List[tuple]) -> List[tuple]:
+        """Локальные (отрицательные) id сессий → настоящие; ещё не доигранные сессии — в журнал."""
+        if all(r[0] > 0 for r in batch):
+            return batch
+        j = journal()
+        ready, waiting = [], []
+        for r in batch:
+            sid = j.real_sid(r[0])
+            if sid is None:
+                waiting.append(r)
+            else:
+                ready.append((sid,) + tuple(r[1:]))
+        if waiting:
+            j.append("results", {"records": waiting})
+        return ready
+
+    async def _write(self, batch: List[tuple]) -> None:
+        cols, rows = _result_rows(batch)  # хвост записи (word_id) — только для роллапов
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            # results и user_stats — в одной транзакции: роллап не разъедется с историей
+            async with conn.transaction():
+                try:
+                    async with conn.transaction():  # savepoint: неудачный COPY не валит транзакцию
+                        await conn.copy_records_to_table("results", records=rows, columns=cols)
+                except (asyncpg.FeatureNotSupportedError, asyncpg.InterfaceError):
+                    # пулер не пропускает COPY — обычная вставка пачкой
+                    await conn.executemany(
+                        f"/* results_batch */ insert into results ({', '.join(cols)}) "
+                        f"values ({', '.join(f'${i + 1}' for i in range(len(cols)))})",
+                        rows
+                    )
+                await _rollup_user_stats(conn, batch)
+                await _rollup_word_mastery(conn, batch)
+
+    async def flush(self) -> int:
+        """Сбросить всё, что накопилось. Возвращает число записанных строк."""
+        total = 0
+        while self._pending:
+            n = min(self.batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(n)]
+            self._inflight += n
+            try:
+                batch = self._route(batch)
+                if batch:
+                    await self._write(batch)
+            except Exception as e:
+                self.failures += 1
+                j = journal()
+                if j is not None:
+                    # пачка уходит на диск, память не копит хвост на время аварии
+                    if not isinstance(e, CircuitOpenError):
+                        print("results flush ERROR, journaling:", repr(e))
+                    j.append("results", {"records": batch})
+                    continue
+                print("results flush ERROR:", repr(e))
+                # вернём пачку в голову очереди, попробуем позже
+                self._pending.extendleft(reversed(batch))
+                raise
+            finally:
+                self._inflight -= n
+            total += n
+            self.written += n
+        return total
+
+    async def _run(self) -> None:
+        delay = self.flush_sec
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                delay = self.flush_sec
+            except Exception:
+                # БД недоступна — откладываем повтор, не долбим пул
+                delay = min(delay * 2, 30.0)
+            j = journal()
+            if j is not None and j.pending:
+                try:
+                    await replay_journal()
+                except Exception as e:
+                    print("journal replay ERROR:", repr(e))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить фоновую задачу и дописать хвост."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            print(f"results: {self.backlog} records lost on shutdown")
+
+RESULT_WRITER = ResultWriter(
+    batch_size=int(os.environ.get("RESULTS_BATCH_SIZE", "200")),
+    flush_sec=float(os.environ.get("RESULTS_FLUSH_SEC", "1.0")),
+)
+
+def log_result(
+    session_id: int,
+    item_index: int,
+    sentence_en: str,
+    sentence_ru: str,
+    truth: bool,
+    user_choice: bool,
+    employee_card: bool,
+    outcome: str,
+    delta: Optional[int],
+    balance_after: Optional[int],
+    word_id: Optional[int] = None,
+) -> None:
+    """
+    То же, что append_result, но без ожидания БД (write-behind); word_id — для word_mastery,
+    client_key — чтобы повтор записи из журнала не задвоил её.
+    """
+    RESULT_WRITER.submit((
+        session_id, item_index, sentence_en, sentence_ru, truth,
+        user_choice, employee_card, outcome, delta, balance_after, word_id, uuid.uuid4().hex,
+    ))
+
+# --- JOURNAL REPLAY ---
+# Записи журнала доигрываются строго по seq, каждая в своей транзакции; после сбоя связи — стоп до
+# следующего захода (цепь снова разомкнута), ошибка самой записи — повтор, потом dead (см. journal.py).
+def _result_rows(batch: List[tuple]) -> Tuple[tuple, List[tuple]]:
+    n = len(RESULT_COLUMNS)
+    if _CLIENT_KEYS:
+        return RESULT_COLUMNS + ("client_key",), [r[:n] + (r[11] if len(r) > 11 else None,) for r in batch]
+    return RESULT_COLUMNS, [r[:n] for r in batch]
+
+_RESULTS_REPLAY_SQL = f"""/* results_replay */
+insert into results ({', '.join(RESULT_COLUMNS)}, client_key)
+select * from unnest($1::bigint[], $2::int[], $3::text[], $4::text[], $5::bool[], $6::bool[], $7::bool[],
+                     $8::text[], $9::int[], $10::int[], $11::text[])
+on conflict (client_key) where client_key is not null do nothing
+returning client_key
+"""
+
+async def _replay_results(conn: asyncpg.Connection, records: List[list]) -> int:
+    batch = []
+    for r in records:
+        sid = journal().real_sid(r[0])
+        if sid is None:
+            raise LookupError(f"session {r[0]} is not replayed yet")
+        batch.append((sid,) + tuple(r[1:]))
+    cols, rows = _result_rows(batch)
+    async with conn.transaction():
+        if _CLIENT_KEYS:
+            inserted = await conn.fetch(_RESULTS_REPLAY_SQL, *[list(c) for c in zip(*rows)])
+            keys = {x["client_key"] for x in inserted}
+            batch = [r for r in batch if r[11] in keys]  # роллапы — только по реально вставленным
+        else:
+            await conn.executemany(
+                f"/* results_replay */ insert into results ({', '.join(cols)}) "
+                f"values ({', '.join(f'${i + 1}' for i in range(len(cols)))})",
+                rows
+            )
+        if batch:
+            await _rollup_user_stats(conn, batch)
+            await _rollup_word_mastery(conn, batch)
+    return len(batch)
+
+async def replay_journal(limit: int = 200) -> int:
+    """Доиграть до limit записей журнала. Возвращает, сколько доехало."""
+    j = journal()
+    if j is None or not j.pending:
+        return 0
+    done = 0
+    for seq, op, p in j.head(limit):
+        try:
+            if op == "session_start":
+                uid = await ensure_user(p["tg_id"])
+                sid = await start_session(uid, p["level"], p["client_key"], timeout=DB_QUERY_TIMEOUT)
+                j.map_sid(-seq, sid)
+            elif op == "session_finish":
+                sid = j.real_sid(p["session_id"])
+                if sid is None:
+                    raise LookupError(f"session {p['session_id']} is not replayed yet")
+                pool = await get_pool()
+                await pool.execute(
+                    "/* session_finish */ update sessions set finished_at=now(), balance=$2 where id=$1",
+                    sid, p["balance"]
+                )
+            elif op == "results":
+                pool = await get_pool()
+                async with pool.acquire() as conn:
+                    await _replay_results(conn, p["records"])
+            else:
+                raise ValueError(f"unknown journal op {op!r}")
+        except Exception as e:
+            if is_transient(e):
+                break  # связь/таймаут — не вина записи, попыткой не считаем
+            print(f"journal replay ERROR (#{seq} {op}):", repr(e))
+            if j.failed(seq):
+                print(f"journal: #{seq} {op} moved to dead after {j.max_attempts} attempts")
+            continue
+        j.done(seq)
+        done += 1
+    if done:
+        print(f"journal: replayed {done}, pending {j.pending}")
+    return done
+
+def db_status() -> dict:
+    """Для /dbping и /healthz: цепь и журнал, без запросов к БД."""
+    j = journal()
+    return {**BREAKER.stats(), **(j.stats() if j is not None else {})}
@@ -0,0 +1,84 @@
+# bot/distractors.py
+# «Подмена ключевого слова»: общая для бота и для генерации контента (scripts/seed_content.py).
+import re, random
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def _preserve_case(src: str, repl: str) -> str:
+    if src.isupper():
+        return repl.upper()
+    if src and src[0].isupper():
+        return repl.capitalize()
+    return repl
+
+
+@lru_cache(maxsize=4096)
+def word_pattern(target: str) -> "re.Pattern[str]":
+    # регэксп на слово компилируется один раз, а не на каждую подмену
+    return re.compile(rf"\b{re.escape(target)}\b", re.IGNORECASE)
+
+
+def swap_word_everywhere(text: str, target: str, replacement: str) -> str:
+    return swap_with_highlight(text, target, replacement)[0]
+
+
+def swap_with_highlight(text: str, target: str, replacement: str) -> Tuple[str, Optional[str]]:
+    """(новый текст, подставленная форма слова — как она выглядит в тексте) либо (text, None)."""
+    used: List[str] = []
+
+    def _f(m: re.Match) -> str:
+        out = _preserve_case(m.group(0), replacement)
+        used.append(out)
+        return out
+
+    swapped = word_pattern(target).sub(_f, text)
+    return swapped, (used[0] if used else None)
+
+
+def generate_bad_variants(
+    text: str,
+    word: str,
+    candidates: Sequence[str],
+    n: int,
+    rng: random.Random,
+) -> List[Tuple[str, str, str]]:
+    """
+    До n неверных вариантов корректного предложения: [(bad_text, replacement, highlight)].
+    replacement — слово из candidates (другое слово того же уровня/части речи).
+    """
+    pool = [c for c in candidates if c.lower() != word.lower()]
+    out: List[Tuple[str, str, str]] = []
+    for repl in rng.sample(pool, k=min(n, len(pool))):
+        bad, highlight = swap_with_highlight(text, word, repl)
+        if highlight is not None and bad != text:
+            out.append((bad, repl, highlight))
+    return out
+
+
+def generate_bad_rows(
+    words: Dict[int, Tuple[str, str, str]],
+    ok_examples: Iterable[Tuple[int, int, str, str]],
+    per_example: int = 3,
+    seed: int = 0,
+) -> List[Tuple[int, int, str, str, str, str]]:
+    """
+    Сгенерировать kind='bad' для всех корректных примеров.
+      words:       word_id -> (level, pos, word)
+      ok_examples: (example_id, word_id, en, ru)
+    Возвращает (word_id, source_example_id, en, ru, replacement, highlight).
+    Детерминировано при одном seed — повторный сид даёт те же строки.
+    """
+    by_group: Dict[Tuple[str, str], List[str]] = {}
+    for level, pos, w in words.values():
+        by_group.setdefault((level, pos), []).append(w)
+
+    rng = random.Random(seed)
+    rows = []
+    for ex_id, word_id, en, ru in sorted(ok_examples):
+        if word_id not in words:
+            continue
+        level, pos, w = words[word_id]
+        for bad, repl, highlight in generate_bad_variants(en, w, by_group[(level, pos)], per_example, rng):
+            rows.append((word_id, ex_id, bad, ru, repl, highlight))
+    return rows
@@ -0,0 +1,186 @@
+# bot/episodes.py
+# Сюжетные эпизоды (content/episodes/*.json, попадают в бандл как есть).
+#
+#   EpisodeLibrary.load(raw)  — на старте только заголовки: id, title, unlock_if (O(эпизодов), без битов);
+#   EpisodeLibrary.get(id)    — граф битов компилируется при первом запуске эпизода и кэшируется;
+#                               повторный load() сохраняет скомпилированные эпизоды, чей исходник не менялся.
+#
+# Граф: биты — кортеж, переходы — индексы (next, у choice — на каждую опцию).
+# Курсор игрока — пара (episode_id, индекс бита) в UserState: O(1) памяти на игрока.
+#
+# Формат эпизода:
+#   {"id": "...", "title": "...", "unlock_if": {"min_level": "A2", "day": 1},
+#    "beats": [{"type": "msg", "actor": "...", "text": "..."},
+#              {"type": "asset", "kind": "photo", "url": "scene://name"},
+#              {"type": "quiz", "words": [...], "mode": "believe"},
+#              {"type": "choice", "options": [{"id": "...", "label": "...", "goto": "<beat id>"}]},
+#              {"type": "result", "effects": {"cash": 100, "unlock": ["ep2"]}}]}
+# У любого бита может быть "id" — цель для goto; без goto переход на следующий бит.
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+
+BEAT_TYPES = ("msg", "asset", "quiz", "choice", "result")
+END = -1  # next у последнего бита
+
+COMPILE_SECONDS = REGISTRY.histogram("episode_compile_seconds", "Episode beat graph compilation")
+
+
+@dataclass(frozen=True)
+class Beat:
+    kind: str
+    next: int = END
+    actor: str = ""
+    text: str = ""
+    asset_kind: str = "photo"
+    url: str = ""
+    words: Tuple[str, ...] = ()
+    mode: str = "believe"
+    options: Tuple[Tuple[str, str, int], ...] = ()  # (id, label, индекс следующего бита)
+    cash: int = 0
+    unlock: Tuple[str, ...] = ()
+
+    def after(self, option: Optional[str] = None) -> int:
+        """Индекс следующего бита; у choice — по id опции (неизвестная опция → -2)."""
+        if self.kind != "choice":
+            return self.next
+        for oid, _, nxt in self.options:
+            if oid == option:
+                return nxt
+        return -2
+
+
+@dataclass(frozen=True)
+class Episode:
+    id: str
+    title: str
+    beats: Tuple[Beat, ...]
+
+
+@dataclass(frozen=True)
+class EpisodeHeader:
+    id: str
+    title: str
+    level_rank: int
+    day: int
+    gated: bool = False  # открывается только эффектом unlock другого эпизода
+
+
+def compile_episode(raw: dict) -> Episode:
+    ep_id = raw.get("id") or "?"
+    beats_raw = raw.get("beats") or []
+    if not beats_raw:
+        raise ValueError(f"episode {ep_id}: no beats")
+    labels = {b["id"]: i for i, b in enumerate(beats_raw) if b.get("id")}
+
+    def target(i: int, goto: Optional[str]) -> int:
+        if goto is None:
+            return i + 1 if i + 1 < len(beats_raw) else END
+        if goto not in labels:
+            raise ValueError(f"episode {ep_id}: beat {i} goes to unknown beat {goto!r}")
+        return labels[goto]
+
+    beats: List[Beat] = []
+    for i, b in enumerate(beats_raw):
+        kind = b.get("type")
+        if kind not in BEAT_TYPES:
+            raise ValueError(f"episode {ep_id}: beat {i} has unknown type {kind!r}")
+        nxt = target(i, b.get("goto"))
+        if kind == "msg":
+            beats.append(Beat(kind, nxt, actor=b.get("actor", ""), text=b.get("text", "")))
+        elif kind == "asset":
+            beats.append(Beat(kind, nxt, asset_kind=b.get("kind", "photo"), url=b.get("url", ""),
+                              text=b.get("caption", "")))
+        elif kind == "quiz":
+            words = tuple(b.get("words") or ())
+            if len(words) < 2:
+                raise ValueError(f"episode {ep_id}: quiz beat {i} needs at least two words")
+            beats.append(Beat(kind, nxt, words=words, mode=b.get("mode", "believe")))
+        elif kind == "choice":
+            opts = tuple((o["id"], o.get("label", o["id"]), target(i, o.get("goto"))) for o in b.get("options") or ())
+            if not opts:
+                raise ValueError(f"episode {ep_id}: choice beat {i} has no options")
+            beats.append(Beat(kind, nxt, text=b.get("text", ""), options=opts))
+        else:
+            eff = b.get("effects") or {}
+            # result завершает эпизод
+            beats.append(Beat(kind, END, cash=int(eff.get("cash", 0)), unlock=tuple(eff.get("unlock") or ())))
+    return Episode(ep_id, raw.get("title") or ep_id, tuple(beats))
+
+
+def scene_path(url: str, root: str = "content/scenes") -> Optional[Path]:
+    """scene://name → content/scenes/name.(jpg|png|webp), если файл есть."""
+    if not url.startswith("scene://"):
+        return None
+    name = url[len("scene://"):]
+    for ext in (".jpg", ".png", ".webp"):
+        p = Path(root) / f"{name}{ext}"
+        if p.exists():
+            return p
+    return None
+
+
+class EpisodeLibrary:
+    def __init__(self, levels: Sequence[str] = ()):
+        self._rank = {lvl: i for i, lvl in enumerate(levels)}
+        self._raw: Dict[str, dict] = {}
+        self._compiled: Dict[str, Episode] = {}
+        # заголовки по (min_level, day): available() останавливается на первом недоступном уровне
+        self.headers: List[EpisodeHeader] = []
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def load(self, raw: Dict[str, dict]) -> int:
+        """Новые/изменённые эпизоды; возвращает, сколько скомпилированных пришлось выбросить."""
+        gated = set()
+        for ep in raw.values():
+            for b in ep.get("beats") or ():
+                if b.get("type") == "result":
+                    gated.update((b.get("effects") or {}).get("unlock") or ())
+        headers = []
+        for ep_id, ep in raw.items():
+            cond = ep.get("unlock_if") or {}
+            headers.append(EpisodeHeader(
+                ep_id, ep.get("title") or ep_id,
+                self._rank.get(cond.get("min_level"), 0), int(cond.get("day", 0)), ep_id in gated,
+            ))
+        headers.sort(key=lambda h: (h.level_rank, h.day, h.id))
+        stale = [k for k in self._compiled if raw.get(k) != self._raw.get(k)]
+        for k in stale:
+            del self._compiled[k]
+        self._raw = dict(raw)
+        self.headers = headers
+        return len(stale)
+
+    def get(self, ep_id: str) -> Optional[Episode]:
+        ep = self._compiled.get(ep_id)
+        if ep is None and ep_id in self._raw:
+            t0 = time.perf_counter()
+            ep = self._compiled[ep_id] = compile_episode({"id": ep_id, **self._raw[ep_id]})
+            COMPILE_SECONDS.observe(time.perf_counter() - t0)
+        return ep
+
+    def compile_all(self) -> Dict[str, Episode]:
+        """Для сборки бандла: ошибки формата — до деплоя, а не у игрока."""
+        return {ep_id: self.get(ep_id) for ep_id in self._raw}
+
+    def available(self, level: str, day: int, done: Iterable[str] = (), unlocked: Iterable[str] = ()) -> List[EpisodeHeader]:
+        rank = self._rank.get(level, 0)
+        done, unlocked = set(done), set(unlocked)
+        out = []
+        for h in self.headers:
+            if h.level_rank > rank:
+                break
+            if h.day <= day and h.id not in done and (not h.gated or h.id in unlocked):
+                out.append(h)
+        return out
+
+    def beat(self, ep_id: str, idx: int) -> Optional[Beat]:
+        ep = self.get(ep_id)
+        if ep is None or not 0 <= idx < len(ep.beats):
+            return None
+        return ep.beats[idx]
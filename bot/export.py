@@ -0,0 +1,63 @@
+# bot/export.py
+# Выгрузка CSV без накопления в памяти: строки сразу пишутся в gzip во временный файл.
+import os, csv, gzip, io, tempfile
+from typing import Sequence
+
+
+class CsvGzSpool:
+    """
+    Временный results_*.csv.gz: write() построчно, finish() -> путь к файлу,
+    cleanup() удаляет файл (вызывается и из __exit__).
+    max_bytes — лимит на размер сжатого файла; после него write() возвращает False.
+    """
+
+    def __init__(self, header: Sequence[str], max_bytes: int = 20 * 1024 * 1024, prefix: str = "results_"):
+        fd, self.path = tempfile.mkstemp(prefix=prefix, suffix=".csv.gz")
+        self._raw = os.fdopen(fd, "wb")
+        # mtime=0: одинаковая история -> одинаковые байты
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0)
+        self._text = io.TextIOWrapper(self._gz, encoding="utf-8", newline="")
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(header)
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.truncated = False
+        self._closed = False
+
+    @property
+    def compressed_bytes(self) -> int:
+        # то, что gzip уже сбросил в файл (хвост буфера ещё в памяти — оценка снизу)
+        return self._raw.tell()
+
+    def write(self, row: Sequence) -> bool:
+        if self.truncated:
+            return False
+        if self.compressed_bytes >= self.max_bytes:
+            self.truncated = True
+            return False
+        self._writer.writerow(row)
+        self.rows += 1
+        return True
+
+    def finish(self) -> str:
+        if not self._closed:
+            self._text.close()  # закрывает gzip (пишет хвост), но не файл под ним
+            self._raw.close()
+            self._closed = True
+        return self.path
+
+    def cleanup(self) -> None:
+        try:
+            self.finish()
+        except Exception:
+            pass
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "CsvGzSpool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
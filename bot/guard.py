@@ -0,0 +1,128 @@
+# bot/guard.py
+# Апдейты одного игрока — строго по очереди, а повторные/устаревшие нажатия — мимо хендлеров.
+#   UserLockMiddleware   — outer-middleware апдейта: asyncio.Lock на пользователя;
+#   CallbackDedupMiddleware — callback с тем же id (повтор доставки) или со старым шагом
+#                            ("believe:True|17", а шаг игрока уже 18) отбрасывается.
+# Шаг — UserState.step: увеличивается при каждой выдаче игровой клавиатуры,
+# так что рабочими остаются только кнопки последнего сообщения.
+#
+# Лок и список виденных callback — в памяти процесса: несколько реплик с общим хранилищем
+# (STATE_BACKEND=postgres) двойные нажатия между собой не упорядочивают. Для реплик нужна
+# маршрутизация апдейтов игрока в одну реплику (или один процесс на polling).
+import asyncio, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, ContextManager, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+
+from metrics import REGISTRY
+
+STEP_SEP = "|"
+
+DROPPED = REGISTRY.counter("bot_callbacks_dropped_total", "Callback queries dropped before the handler", ["reason"])
+LOCK_WAIT_SECONDS = REGISTRY.histogram("bot_user_lock_wait_seconds", "Wait for the per-user update lock")
+
+
+def with_step(data: str, step: int) -> str:
+    return f"{data}{STEP_SEP}{step}"
+
+
+def split_step(data: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    if not data or STEP_SEP not in data:
+        return data, None
+    base, _, tail = data.rpartition(STEP_SEP)
+    return (base, int(tail)) if tail.isdigit() else (data, None)
+
+
+class UserLockMiddleware(BaseMiddleware):
+    """
+    Лок на пользователя — только внутри процесса (см. шапку).
+    scope() — контекст апдейта под локом (StateRegistry.update_scope: состояние читается один раз).
+    """
+
+    def __init__(self, scope: Optional[Callable[[], ContextManager]] = None):
+        # uid -> [lock, сколько апдейтов держат/ждут]; запись удаляется, когда очередь пуста
+        self._locks: Dict[int, list] = {}
+        self.scope = scope
+
+    @property
+    def active(self) -> int:
+        return len(self._locks)
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        t0 = time.perf_counter()
+        try:
+            async with entry[0]:
+                LOCK_WAIT_SECONDS.observe(time.perf_counter() - t0)
+                if self.scope is None:
+                    return await handler(event, data)
+                with self.scope():
+                    return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(user.id, None)
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    """
+    Outer-middleware callback_query (работает уже под локом пользователя).
+    current_step(uid) -> текущий шаг игрока или None (состояния нет — решает хендлер).
+    Хендлеры видят callback без суффикса шага.
+    """
+
+    def __init__(
+        self,
+        current_step: Callable[[int], Awaitable[Optional[int]]],
+        seen_size: int = 10_000,
+        stale_text: str = "Уже учтено 👌",
+    ):
+        self.current_step = current_step
+        self.stale_text = stale_text
+        self.seen_size = seen_size
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.dropped = {"duplicate": 0, "stale": 0}
+
+    def _drop(self, reason: str) -> None:
+        self.dropped[reason] += 1
+        DROPPED.inc(reason=reason)
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        if event.id in self._seen:
+            self._drop("duplicate")
+            return None
+        self._seen[event.id] = None
+        while len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+
+        base, step = split_step(event.data)
+        if step is None:
+            return await handler(event, data)
+        current = await self.current_step(event.from_user.id)
+        if current is not None and current != step:
+            self._drop("stale")
+            try:
+                await event.answer(self.stale_text)
+            except Exception:
+                pass
+            return None
+        return await handler(event.model_copy(update={"data": base}), data)
+
+
+def setup_guard(
+    dp: Dispatcher,
+    current_step: Callable[[int], Awaitable[Optional[int]]],
+    scope: Optional[Callable[[], ContextManager]] = None,
+) -> CallbackDedupMiddleware:
+    """Регистрировать раньше setup_outbox: ответы шага уходят, пока лок игрока ещё держится."""
+    dp.update.outer_middleware(UserLockMiddleware(scope))
+    dedup = CallbackDedupMiddleware(current_step)
+    dp.callback_query.outer_middleware(dedup)
+    return dedup
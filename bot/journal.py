@@ -0,0 +1,87 @@
+# bot/journal.py
+# Локальный журнал записей в БД (SQLite, stdlib): пока Postgres недоступен, старты/финиши сессий
+# и пачки результатов ложатся сюда, а db.replay_journal() потом доигрывает их по порядку.
+# Повтор безопасен: у каждой записи свой client_key (см. db.py), вставки — on conflict do nothing.
+#
+# Локальный id сессии — отрицательный seq её записи в журнале (AUTOINCREMENT: не переиспользуется
+# и после рестарта); после доигрывания sid_map связывает его с настоящим sessions.id.
+import json, sqlite3, time
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+JOURNAL_PENDING = REGISTRY.gauge("db_journal_pending", "Journal entries waiting for replay")
+JOURNAL_APPENDED = REGISTRY.counter("db_journal_appended_total", "Entries written to the local journal", ["op"])
+JOURNAL_DEAD = REGISTRY.counter("db_journal_dead_total", "Journal entries given up after repeated errors")
+
+
+class Journal:
+    def __init__(self, path: str = "db_journal.sqlite3", max_attempts: int = 5):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._db = sqlite3.connect(path, isolation_level=None)  # autocommit: запись = одна транзакция
+        self._db.execute("pragma journal_mode=wal")
+        self._db.execute("pragma synchronous=normal")
+        self._db.execute(
+            """create table if not exists entries (
+                 seq integer primary key autoincrement,
+                 op text not null,
+                 payload text not null,
+                 attempts integer not null default 0,
+                 dead integer not null default 0,
+                 created_at real not null
+               )"""
+        )
+        self._db.execute("create table if not exists sid_map (local integer primary key, real integer not null)")
+        self._sids: Dict[int, int] = dict(self._db.execute("select local, real from sid_map"))
+        self._refresh_pending()
+
+    def _refresh_pending(self) -> None:
+        self.pending = self._db.execute("select count(*) from entries where dead = 0").fetchone()[0]
+        JOURNAL_PENDING.set(self.pending)
+
+    def append(self, op: str, payload: dict) -> int:
+        cur = self._db.execute(
+            "insert into entries(op, payload, created_at) values (?, ?, ?)",
+            (op, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        JOURNAL_APPENDED.inc(op=op)
+        self.pending += 1
+        JOURNAL_PENDING.set(self.pending)
+        return cur.lastrowid
+
+    def head(self, limit: int = 100) -> List[Tuple[int, str, dict]]:
+        rows = self._db.execute(
+            "select seq, op, payload from entries where dead = 0 order by seq limit ?", (limit,)
+        ).fetchall()
+        return [(seq, op, json.loads(payload)) for seq, op, payload in rows]
+
+    def done(self, seq: int) -> None:
+        self._db.execute("delete from entries where seq = ?", (seq,))
+        self._refresh_pending()
+
+    def failed(self, seq: int) -> bool:
+        """Ошибка самой записи (не связи). True — попытки кончились, запись отложена в dead."""
+        self._db.execute("update entries set attempts = attempts + 1 where seq = ?", (seq,))
+        (attempts,) = self._db.execute("select attempts from entries where seq = ?", (seq,)).fetchone()
+        if attempts < self.max_attempts:
+            return False
+        self._db.execute("update entries set dead = 1 where seq = ?", (seq,))
+        JOURNAL_DEAD.inc()
+        self._refresh_pending()
+        return True
+
+    def map_sid(self, local: int, real: int) -> None:
+        self._db.execute("insert or replace into sid_map(local, real) values (?, ?)", (local, real))
+        self._sids[local] = real
+
+    def real_sid(self, sid: int) -> Optional[int]:
+        """sessions.id для локального (отрицательного) id; None — сессия ещё не доиграна."""
+        return sid if sid > 0 else self._sids.get(sid)
+
+    def stats(self) -> dict:
+        dead = self._db.execute("select count(*) from entries where dead = 1").fetchone()[0]
+        return {"journal_pending": self.pending, "journal_dead": dead, "journal_sessions_mapped": len(self._sids)}
+
+    def close(self) -> None:
+        self._db.close()
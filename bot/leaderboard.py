@@ -0,0 +1,88 @@
+# bot/leaderboard.py
+# Лидерборд для /top: ранги считает Postgres (материализованное представление leaderboard, см. db.py),
+# процесс держит в памяти только первые места каждого scope ('all' и уровни).
+# Пересчёт — фоном раз в refresh_sec; запрос игрока — ноль сортировок,
+# своё место — один индексный lookup.
+import asyncio, time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+
+REFRESH_SECONDS = REGISTRY.histogram("leaderboard_refresh_seconds", "Leaderboard view refresh + top reload")
+GLOBAL = "all"
+
+
+class Leaderboard:
+    """
+    top:     scope -> [{rnk, user_id, best, games}, ...] (не длиннее top_n)
+    players: scope -> сколько игроков в рейтинге
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[], Awaitable[bool]],
+        load_top: Callable[[int], Awaitable[List[dict]]],
+        load_rank: Callable[[int], Awaitable[Dict[str, dict]]],
+        refresh_sec: float = 300.0,
+        retry_sec: float = 30.0,
+        top_n: int = 10,
+    ):
+        self._refresh = refresh
+        self._load_top = load_top
+        self._load_rank = load_rank
+        self.refresh_sec = refresh_sec
+        self.retry_sec = retry_sec
+        self.top_n = top_n
+
+        self.top: Dict[str, List[dict]] = {}
+        self.players: Dict[str, int] = {}
+        self.refreshed_at: Optional[float] = None  # time.time() последней загрузки
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at is not None
+
+    async def reload(self) -> None:
+        """Только перечитать первые места (представление не трогаем)."""
+        top: Dict[str, List[dict]] = {}
+        players: Dict[str, int] = {}
+        for r in await self._load_top(self.top_n):
+            rows = top.setdefault(r["scope"], [])
+            if len(rows) < self.top_n:
+                rows.append({k: r[k] for k in ("rnk", "user_id", "best", "games")})
+            players[r["scope"]] = r["players"]
+        self.top, self.players = top, players
+        self.refreshed_at = time.time()
+
+    async def refresh(self) -> None:
+        t0 = time.perf_counter()
+        # пересчитывает другой инстанс — всё равно перечитываем: его результат уже виден или скоро будет
+        await self._refresh()
+        await self.reload()
+        REFRESH_SECONDS.observe(time.perf_counter() - t0)
+
+    async def rank_of(self, user_id: int) -> Dict[str, dict]:
+        return await self._load_rank(user_id)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_sec if self.loaded else self.retry_sec)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print("leaderboard refresh ERROR:", repr(e))
+
+    async def start(self) -> None:
+        # на старте — только чтение готового представления, пересчёт — в фоне
+        try:
+            await self.reload()
+        except Exception as e:
+            print("leaderboard load ERROR:", repr(e))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
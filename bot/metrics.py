@@ -0,0 +1,151 @@
+# bot/metrics.py
+# Минимальные метрики в формате Prometheus (без внешних зависимостей).
+import bisect, threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        out = self.header()
+        for k, v in sorted(self._values.items()):
+            out.append(f"{self.name}{_fmt_labels(self.labelnames, k)} {v}")
+        return out
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетам (+Inf последним), sum, count, max]
+        self._data: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        k = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            d = self._data.get(k)
+            if d is None:
+                d = self._data[k] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            d[0][i] += 1
+            d[1] += value
+            d[2] += 1
+            d[3] = max(d[3], value)
+
+    def snapshot(self, **labels: str) -> Dict[str, float]:
+        """count / avg / max и перцентили, оценённые по бакетам (верхняя граница бакета)."""
+        d = self._data.get(self._key(labels))
+        if not d or not d[2]:
+            return {"count": 0, "avg": 0.0, "max": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+        counts, total, n, mx = d
+        out = {"count": n, "avg": total / n, "max": mx}
+        for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+            need, acc = q * n, 0
+            for i, c in enumerate(counts):
+                acc += c
+                if acc >= need:
+                    out[name] = min(self.buckets[i], mx) if i < len(self.buckets) else mx
+                    break
+        return out
+
+    def label_values(self) -> List[LabelKey]:
+        return sorted(self._data)
+
+    def render(self) -> List[str]:
+        out = self.header()
+        for k, (counts, total, n, _) in sorted(self._data.items()):
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, ('le', repr(b)))} {acc}")
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, ('le', '+Inf'))} {n}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, k)} {total}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, k)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,79 @@
+# bot/models.py
+# Игровые структуры + компактная сериализация состояния (json + zlib).
+import json, zlib
+from dataclasses import dataclass, field, asdict, fields
+from typing import List, Dict, Optional
+
+@dataclass
+class Example:
+    text: str
+    text_ru: str
+    uses: List[str]
+    is_correct: bool
+    employee_proposal: Optional[str] = None
+    employee_proposal_ru: Optional[str] = None
+    error_type: Optional[str] = None
+    error_highlight: List[str] = field(default_factory=list)
+    explanation: Optional[str] = None
+    correct_note: Optional[str] = None
+    # готовые «ошибочные правки» этого корректного примера (kind='bad' из БД)
+    wrong_proposals: List[str] = field(default_factory=list)
+
+@dataclass
+class WordCard:
+    word: str
+    translation: str
+
+@dataclass
+class EveningItem:
+    example: Example
+    employee_card: bool  # True=считает верным, False=считает неверным
+
+@dataclass
+class UserState:
+    stage: str = "idle"
+    level: str = "A2"
+    pos: str = "adjectives"
+    balance: int = 0
+    session_id: int = 0
+    deck: List[WordCard] = field(default_factory=list)
+    word2id: Dict[str, int] = field(default_factory=dict)
+    morning_idx: int = 0
+    evening_idx: int = 0
+    evening_queue: List[EveningItem] = field(default_factory=list)
+    results: List[Dict] = field(default_factory=list)
+    study_bank: Dict[str, List[tuple]] = field(default_factory=dict)
+    # номер последней выданной игровой клавиатуры (см. guard.py): старые кнопки не срабатывают
+    step: int = 0
+    # сюжет (episodes.py): сыгранные дни, курсор (эпизод, бит), пройденные/открытые эпизоды
+    day: int = 0
+    bonus: int = 0  # премия эпизода — стартовый баланс следующего дня
+    episode: str = ""
+    beat: int = 0
+    episodes_done: List[str] = field(default_factory=list)
+    unlocked: List[str] = field(default_factory=list)
+
+
+STATE_FORMAT = 1
+
+def _known(cls, d: dict) -> dict:
+    # лишние/устаревшие ключи игнорируем — формат можно расширять без миграций
+    names = {f.name for f in fields(cls)}
+    return {k: v for k, v in d.items() if k in names}
+
+def dump_state(s: UserState) -> bytes:
+    d = asdict(s)
+    d["_v"] = STATE_FORMAT
+    raw = json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 6)
+
+def load_state(blob: bytes) -> UserState:
+    d = json.loads(zlib.decompress(blob).decode("utf-8"))
+    s = UserState(**_known(UserState, d))
+    s.deck = [WordCard(**_known(WordCard, c)) for c in d.get("deck", [])]
+    s.evening_queue = [
+        EveningItem(Example(**_known(Example, it["example"])), it["employee_card"])
+        for it in d.get("evening_queue", [])
+    ]
+    s.study_bank = {w: [tuple(p) for p in pairs] for w, pairs in d.get("study_bank", {}).items()}
+    return s
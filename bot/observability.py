@@ -0,0 +1,113 @@
+# bot/observability.py
+# Метрики бота: латентность/ошибки хендлеров (middleware диспетчера), латентность Bot API
+# (middleware сессии) и HTTP-эндпоинты /metrics (Prometheus) и /healthz.
+import asyncio, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from metrics import REGISTRY
+
+HANDLER_SECONDS = REGISTRY.histogram("bot_handler_seconds", "Handler duration", ["handler"])
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Handler exceptions", ["handler"])
+TG_API_SECONDS = REGISTRY.histogram("tg_api_seconds", "Telegram Bot API call duration", ["method"])
+TG_API_ERRORS = REGISTRY.counter("tg_api_errors_total", "Failed Telegram Bot API calls", ["method"])
+
+
+def _handler_name(data: Dict[str, Any]) -> str:
+    handler = data.get("handler")
+    cb = getattr(handler, "callback", None)
+    return getattr(cb, "__name__", None) or "unknown"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner-middleware: к этому моменту фильтры отработали и известен конкретный хендлер."""
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        name = _handler_name(data)
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - t0, handler=name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            TG_API_ERRORS.inc(method=name)
+            raise
+        finally:
+            TG_API_SECONDS.observe(time.perf_counter() - t0, method=name)
+
+
+def instrument_dispatcher(dp: Dispatcher) -> None:
+    m = HandlerMetricsMiddleware()
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(m)
+
+
+def instrument_bot(bot) -> None:
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+def handler_stats() -> List[dict]:
+    """Сводка по хендлерам для админ-команд: count/p50/p95/p99/max в мс."""
+    rows = []
+    for (name,) in HANDLER_SECONDS.label_values():
+        st = HANDLER_SECONDS.snapshot(handler=name)
+        rows.append({
+            "handler": name,
+            "count": int(st["count"]),
+            "errors": int(HANDLER_ERRORS.value(handler=name)),
+            **{k: round(st[k] * 1000, 1) for k in ("p50", "p95", "p99", "max")},
+        })
+    rows.sort(key=lambda r: r["p95"], reverse=True)
+    return rows
+
+
+def add_routes(
+    app: web.Application,
+    health: Callable[[], Awaitable[dict]],
+    before_scrape: Optional[Callable[[], None]] = None,
+    health_timeout: float = 3.0,
+) -> web.Application:
+    """
+    /metrics — REGISTRY в текстовом формате Prometheus;
+    /healthz — 200, если health() прошёл за health_timeout, иначе 503 с причиной
+               (health() сам решает, что считать нездоровым: у бота недоступная БД — не повод для рестарта).
+    """
+
+    async def metrics(_request: web.Request) -> web.Response:
+        if before_scrape is not None:
+            before_scrape()
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    async def healthz(_request: web.Request) -> web.Response:
+        try:
+            body = await asyncio.wait_for(health(), health_timeout)
+            return web.json_response({"ok": True, **body})
+        except Exception as e:
+            return web.json_response({"ok": False, "error": repr(e)}, status=503)
+
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/healthz", healthz)
+    return app
+
+
+async def serve(app: web.Application, host: str = "0.0.0.0", port: int = 8080) -> web.AppRunner:
+    """Отдельный HTTP-сервер (polling-режим): в webhook-режиме маршруты живут в его приложении."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics listening on {host}:{port}")
+    return runner
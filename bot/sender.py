@@ -0,0 +1,264 @@
+# bot/sender.py
+# Исходящие сообщения:
+#   Outbox        — за один апдейт (шаг игры) подряд идущие sendMessage в один чат склеиваются в одно;
+#   SendScheduler — все вызовы в чаты идут через token bucket (глобальный + на чат),
+#                   на 429 ждём retry_after и повторяем.
+# Оба — middleware сессии бота, хендлеры по-прежнему зовут msg.answer(...).
+import asyncio, html, time
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.default import Default
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import Message
+
+from metrics import REGISTRY
+
+MAX_TEXT = 4096  # лимит Bot API на текст сообщения
+
+SEND_WAIT_SECONDS = REGISTRY.histogram("tg_send_wait_seconds", "Time a call waited for a rate-limit token")
+RETRY_AFTER = REGISTRY.counter("tg_retry_after_total", "429 responses from Telegram", ["method"])
+MERGED = REGISTRY.counter("tg_messages_merged_total", "sendMessage calls saved by coalescing")
+
+_MERGEABLE = {"chat_id", "text", "parse_mode", "reply_markup"}
+_OUTBOX: ContextVar[Optional["Outbox"]] = ContextVar("outbox", default=None)
+
+
+def _escape(text: str, mode: Optional[str]) -> str:
+    # простой текст внутри размеченного сообщения
+    if mode == "Markdown":
+        # legacy Markdown экранирует только эти символы; обратный слеш сам по себе не экранируется
+        for ch in ("_", "*", "`", "["):
+            text = text.replace(ch, "\\" + ch)
+        return text
+    if mode == "HTML":
+        return html.escape(text, quote=False)
+    return text
+
+
+def _resolve(bot, value):
+    return bot.default[value.name] if isinstance(value, Default) else value
+
+
+class _Group:
+    """Сообщения одного чата, которые уйдут одним sendMessage."""
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.parts: List[tuple] = []  # (text, parse_mode)
+        self.mode: Optional[str] = None
+        self.reply_markup = None
+        self.closed = False
+
+    def _render(self, parts, mode) -> str:
+        return "\n\n".join(t if m == mode else _escape(t, mode) for t, m in parts)
+
+    def accepts(self, text: str, mode: Optional[str]) -> bool:
+        if self.closed:
+            return False
+        if mode and self.mode and mode != self.mode:
+            return False
+        if (mode or self.mode) not in (None, "Markdown", "HTML"):
+            return False  # MarkdownV2 и прочее — без склейки
+        return len(self._render(self.parts + [(text, mode)], mode or self.mode)) <= MAX_TEXT
+
+    def add(self, text: str, mode: Optional[str], reply_markup) -> None:
+        self.parts.append((text, mode))
+        self.mode = self.mode or mode
+        if reply_markup is not None:
+            # клавиатура — под последним текстом: после неё группа закрыта
+            self.reply_markup = reply_markup
+            self.closed = True
+
+    def method(self) -> SendMessage:
+        return SendMessage(
+            chat_id=self.chat_id,
+            text=self._render(self.parts, self.mode),
+            parse_mode=self.mode,
+            reply_markup=self.reply_markup,
+        )
+
+
+class Outbox:
+    """
+    Буфер sendMessage на время обработки одного апдейта.
+    Буферизованный answer() возвращает заглушку Message(message_id=0): хендлеры, которым
+    нужен настоящий message_id, сначала зовут await flush_outbox().
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.groups: List[_Group] = []
+        self.closed = False
+        self.flushing = False
+
+    def _mergeable(self, method) -> bool:
+        if not isinstance(method, SendMessage) or not isinstance(method.text, str):
+            return False
+        for name in type(method).model_fields:
+            if name in _MERGEABLE:
+                continue
+            v = getattr(method, name)
+            if v is not None and not isinstance(v, Default):
+                return False
+        return True
+
+    def offer(self, method) -> Optional[Message]:
+        """Забрать вызов в буфер; None — вызов надо отправить как есть."""
+        if self.closed or not self._mergeable(method):
+            return None
+        mode = _resolve(self.bot, method.parse_mode)
+        last = self.groups[-1] if self.groups else None
+        if last is not None and last.chat_id == method.chat_id and last.accepts(method.text, mode):
+            MERGED.inc()
+        else:
+            last = _Group(method.chat_id)
+            self.groups.append(last)
+        last.add(method.text, mode, method.reply_markup)
+        return Message.model_validate(
+            {"message_id": 0, "date": datetime.now(), "chat": {"id": method.chat_id, "type": "private"},
+             "text": method.text},
+            context={"bot": self.bot},
+        )
+
+    def pending_for(self, chat_id) -> bool:
+        return any(g.chat_id == chat_id for g in self.groups)
+
+    async def flush(self) -> None:
+        groups, self.groups = self.groups, []
+        self.flushing = True  # наши же sendMessage не должны снова попасть в буфер
+        try:
+            for g in groups:
+                await self.bot(g.method())
+        finally:
+            self.flushing = False
+
+
+async def flush_outbox() -> None:
+    box = _OUTBOX.get()
+    if box is not None:
+        await box.flush()
+
+
+class OutboxMiddleware(BaseMiddleware):
+    """Outer-middleware апдейта: открывает Outbox, после хендлера отправляет накопленное."""
+
+    async def __call__(self, handler, event, data: Dict[str, Any]):
+        box = Outbox(data["bot"])
+        token = _OUTBOX.set(box)
+        try:
+            result = await handler(event, data)
+        except Exception:
+            # хендлер упал: то, что он успел сказать, всё же отправляем,
+            # но ошибка отправки не должна подменить исходное исключение
+            box.closed = True
+            try:
+                await box.flush()
+            except Exception as e:
+                print("outbox flush ERROR:", repr(e))
+            raise
+        finally:
+            _OUTBOX.reset(token)
+            box.closed = True
+        await box.flush()
+        return result
+
+
+class OutboxRequestMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        box = _OUTBOX.get()
+        if box is None or box.closed or box.flushing:
+            return await make_request(bot, method)
+        placeholder = box.offer(method)
+        if placeholder is not None:
+            return placeholder
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and box.pending_for(chat_id):
+            await box.flush()  # порядок в чате: документ/фото не обгоняют текст перед ними
+        return await make_request(bot, method)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Занять токен; вернуть, сколько подождать до него (долг допустим — очередь честная)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """
+    Лимиты Bot API: ~30 сообщений/с на бота и ~1/с в один чат (с небольшим burst).
+    Ограничиваются только вызовы с chat_id; answerCallbackQuery и прочее идёт без очереди.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        max_chats: int = 10_000,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        b = self._chats.get(chat_id)
+        if b is None:
+            b = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return b
+
+    async def _wait_turn(self, chat_id) -> None:
+        delay = max(self._chat_bucket(chat_id).reserve(), self.global_bucket.reserve())
+        SEND_WAIT_SECONDS.observe(delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._wait_turn(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                RETRY_AFTER.inc(method=type(method).__name__)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+
+def setup_outbox(dp: Dispatcher) -> None:
+    dp.update.outer_middleware(OutboxMiddleware())
+
+
+def setup_sender(bot, scheduler: Optional[SendScheduler] = None) -> SendScheduler:
+    """Порядок важен: сначала склейка, потом очередь — лимит тратится на уже склеенные сообщения."""
+    scheduler = scheduler or SendScheduler()
+    bot.session.middleware(OutboxRequestMiddleware())
+    bot.session.middleware(scheduler)
+    return scheduler
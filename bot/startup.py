@@ -0,0 +1,47 @@
+# bot/startup.py
+# Профиль холодного старта: время импорта и инициализации по фазам.
+#   python bot/app.py --profile-startup   — пройти инициализацию, напечатать отчёт и выйти
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+from metrics import REGISTRY
+
+STARTUP_SECONDS = REGISTRY.gauge("startup_phase_seconds", "Cold start duration by phase", ["phase"])
+
+
+class StartupProfile:
+    """Фазы подряд: mark(name) закрывает фазу, начатую предыдущей отметкой."""
+
+    def __init__(self):
+        self.t0 = self._last = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> float:
+        now = time.perf_counter()
+        dt = now - self._last
+        self._last = now
+        self.phases.append((name, dt))
+        STARTUP_SECONDS.set(dt, phase=name)
+        return dt
+
+    @contextmanager
+    def phase(self, name: str):
+        self._last = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    @property
+    def total(self) -> float:
+        return sum(dt for _, dt in self.phases)
+
+    def report(self) -> str:
+        width = max((len(n) for n, _ in self.phases), default=5)
+        lines = [f"{n:<{width}}  {dt * 1000:9.1f} ms" for n, dt in self.phases]
+        lines.append(f"{'total':<{width}}  {self.total * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+
+PROFILE = StartupProfile()
@@ -0,0 +1,339 @@
+# bot/state.py
+# Реестр игровых состояний в памяти: ограничен по размеру (LRU) и по времени простоя (TTL).
+# Под ним — подключаемое хранилище (memory / postgres / dbm), чтобы игры переживали
+# рестарт и несколько реплик видели одно и то же состояние.
+import sys, time, dbm
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+S = TypeVar("S")
+
+# uid, уже прочитанные из общего хранилища в текущем апдейте (см. StateRegistry.update_scope)
+_READ_IN_UPDATE: ContextVar[Optional[Set[int]]] = ContextVar("state_read_in_update", default=None)
+
+
+def _deep_size(obj: Any, seen: Optional[set] = None) -> int:
+    """Грубая оценка занимаемой памяти (байты) с обходом контейнеров и dataclass-ов."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_size(x, seen) for x in obj)
+    elif hasattr(obj, "__dict__"):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+# --- хранилища ---
+class MemoryBackend:
+    """Ничего не переживает рестарт; по сути — отключённое хранилище."""
+    name = "memory"
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[int, bytes] = {}
+
+    async def load(self, uid: int) -> Optional[bytes]:
+        return self._data.get(uid)
+
+    async def save(self, uid: int, blob: bytes) -> None:
+        self._data[uid] = blob
+
+    async def delete(self, uid: int) -> None:
+        self._data.pop(uid, None)
+
+
+class DbmBackend:
+    """Локальный key-value файл (stdlib dbm): переживает рестарт одной реплики."""
+    name = "dbm"
+    shared = False
+
+    def __init__(self, path: str):
+        self._db = dbm.open(path, "c")
+
+    async def load(self, uid: int) -> Optional[bytes]:
+        return self._db.get(str(uid).encode())
+
+    async def save(self, uid: int, blob: bytes) -> None:
+        self._db[str(uid).encode()] = blob
+
+    async def delete(self, uid: int) -> None:
+        try:
+            del self._db[str(uid).encode()]
+        except KeyError:
+            pass
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class PostgresBackend:
+    """Таблица game_state (см. db._SCHEMA_DDL): общее состояние для всех реплик."""
+    name = "postgres"
+    shared = True
+
+    def __init__(self, pool_getter: Callable[[], Awaitable]):
+        self._get_pool = pool_getter
+
+    async def load(self, uid: int) -> Optional[bytes]:
+        pool = await self._get_pool()
+        return await pool.fetchval("/* state_load */ select data from game_state where telegram_id=$1", uid)
+
+    async def save(self, uid: int, blob: bytes) -> None:
+        pool = await self._get_pool()
+        await pool.execute(
+            """/* state_save */ insert into game_state(telegram_id, data, updated_at) values($1, $2, now())
+               on conflict (telegram_id) do update set data = excluded.data, updated_at = now()""",
+            uid, blob
+        )
+
+    async def delete(self, uid: int) -> None:
+        pool = await self._get_pool()
+        await pool.execute("/* state_delete */ delete from game_state where telegram_id=$1", uid)
+
+
+def make_backend(kind: str, pool_getter: Optional[Callable[[], Awaitable]] = None, path: str = "game_state.dbm"):
+    kind = (kind or "memory").strip().lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "dbm":
+        return DbmBackend(path)
+    if kind == "postgres":
+        if pool_getter is None:
+            raise RuntimeError("postgres state backend needs a DB pool")
+        return PostgresBackend(pool_getter)
+    raise ValueError(f"unknown STATE_BACKEND: {kind!r}")
+
+
+class StateRegistry(Generic[S]):
+    def __init__(
+        self,
+        factory: Callable[[], S],
+        max_size: int = 10_000,
+        ttl_sec: float = 6 * 3600,
+        backend=None,
+        dumps: Optional[Callable[[S], bytes]] = None,
+        loads: Optional[Callable[[bytes], S]] = None,
+        checkpoint: Optional[Callable[[S], Hashable]] = None,
+    ):
+        """
+        checkpoint(state) — «этап» состояния для локального хранилища (dbm): save() пишет, только когда он
+        поменялся, а между этапами состояние живёт в памяти (dirty) и уходит в хранилище через flush().
+        Общее хранилище (postgres) — всегда write-through: следующий апдейт игрока может прийти в другую
+        реплику, и она должна увидеть последний ход (иначе guard отбросит нажатие как устаревшее).
+        Без checkpoint — write-through на каждый save().
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.backend = backend or MemoryBackend()
+        self.dumps = dumps
+        self.loads = loads
+        self.checkpoint = checkpoint
+        self._persisted: Dict[int, Hashable] = {}  # uid -> checkpoint последней записи в хранилище
+        self._dirty: Set[int] = set()              # в памяти новее, чем в хранилище
+        self._evicted_dirty: List[Tuple[int, S]] = []  # выселены несохранёнными — ждут flush()
+        self._items: "OrderedDict[int, Tuple[S, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.loaded = 0
+        self.saved = 0
+        self.backend_errors = 0
+        self.deferred = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _expired(self, seen_at: float, now: float) -> bool:
+        return self.ttl_sec > 0 and now - seen_at > self.ttl_sec
+
+    def get(self, uid: int) -> Optional[S]:
+        """Состояние игрока или None (не было / выселено). Продлевает TTL."""
+        item = self._items.get(uid)
+        now = time.monotonic()
+        if item is None:
+            self.misses += 1
+            return None
+        if self._expired(item[1], now):
+            del self._items[uid]
+            self._forget(uid, item)
+            self.evicted_idle += 1
+            self.misses += 1
+            return None
+        self._items[uid] = (item[0], now)
+        self._items.move_to_end(uid)
+        self.hits += 1
+        return item[0]
+
+    def put(self, uid: int, state: S) -> S:
+        self._items[uid] = (state, time.monotonic())
+        self._items.move_to_end(uid)
+        while len(self._items) > self.max_size:
+            self._forget(*self._items.popitem(last=False))
+            self.evicted_lru += 1
+        return state
+
+    def _forget(self, uid: int, item: Tuple[S, float]) -> None:
+        self._persisted.pop(uid, None)
+        if uid in self._dirty:
+            self._dirty.discard(uid)
+            self._evicted_dirty.append((uid, item[0]))
+
+    def create(self, uid: int) -> S:
+        """Новое состояние (заменяет старое)."""
+        self.created += 1
+        return self.put(uid, self.factory())
+
+    def get_or_create(self, uid: int) -> S:
+        s = self.get(uid)
+        return s if s is not None else self.create(uid)
+
+    # --- с хранилищем ---
+    @property
+    def _persistent(self) -> bool:
+        return self.dumps is not None and self.loads is not None and not isinstance(self.backend, MemoryBackend)
+
+    @contextmanager
+    def update_scope(self) -> Iterator[None]:
+        """На время апдейта: общее хранилище читается не больше раза на игрока (guard + хендлер)."""
+        token = _READ_IN_UPDATE.set(set())
+        try:
+            yield
+        finally:
+            _READ_IN_UPDATE.reset(token)
+
+    async def fetch(self, uid: int) -> Optional[S]:
+        """
+        Как get(), но при промахе поднимает состояние из хранилища.
+        Общее хранилище (postgres) читаем в начале каждого апдейта: игрок мог прийти через другую реплику;
+        повторно в том же апдейте (guard + хендлер) — из памяти.
+        """
+        if not self._persistent:
+            return self.get(uid)
+        read = _READ_IN_UPDATE.get()
+        if not self.backend.shared or (read is not None and uid in read):
+            s = self.get(uid)
+            if s is not None:
+                return s
+        if read is not None:
+            read.add(uid)
+        try:
+            blob = await self.backend.load(uid)
+        except Exception as e:
+            self.backend_errors += 1
+            print("state load ERROR:", repr(e))
+            return self.get(uid)  # хранилище недоступно — то, что есть в памяти
+        if blob is None:
+            return self.get(uid) if self.backend.shared else None
+        self.loaded += 1
+        state = self.put(uid, self.loads(blob))
+        self._dirty.discard(uid)
+        if self.checkpoint is not None:
+            self._persisted[uid] = self.checkpoint(state)
+        return state
+
+    async def fetch_or_create(self, uid: int) -> S:
+        s = await self.fetch(uid)
+        return s if s is not None else self.create(uid)
+
+    async def save(self, uid: int, state: S) -> None:
+        """
+        Вызывается после каждого хода. Общее хранилище — write-through; локальное пишется на смене
+        этапа (checkpoint), иначе состояние только помечается dirty. Ошибка хранилища игру не ломает.
+        """
+        self.put(uid, state)
+        if not self._persistent:
+            return
+        if self.checkpoint is not None and not self.backend.shared:
+            mark = self.checkpoint(state)
+            if uid in self._persisted and self._persisted[uid] == mark:
+                self._dirty.add(uid)
+                self.deferred += 1
+                return
+        await self._write(uid, state)
+
+    async def _write(self, uid: int, state: S) -> bool:
+        try:
+            await self.backend.save(uid, self.dumps(state))
+        except Exception as e:
+            self.backend_errors += 1
+            print("state save ERROR:", repr(e))
+            if not self.backend.shared:
+                # общее хранилище не дописываем задним числом: другая реплика могла записать ход новее
+                self._dirty.add(uid)
+            return False
+        self.saved += 1
+        self._dirty.discard(uid)
+        if self.checkpoint is not None:
+            self._persisted[uid] = self.checkpoint(state)
+        return True
+
+    async def flush(self) -> int:
+        """Записать dirty-состояния (и выселенные несохранёнными). Зовётся из sweep-цикла и на остановке."""
+        evicted, self._evicted_dirty = self._evicted_dirty, []
+        n = 0
+        for i, (uid, state) in enumerate(evicted):
+            if uid in self._items:
+                continue  # игрок вернулся: в памяти копия новее выселенной
+            try:
+                await self.backend.save(uid, self.dumps(state))
+            except Exception as e:
+                self.backend_errors += 1
+                print("state save ERROR:", repr(e))
+                # хранилище недоступно — остаток в очередь к следующему flush(), игра не теряется
+                self._evicted_dirty[:0] = evicted[i:]
+                break
+            self.saved += 1
+            n += 1
+        for uid in list(self._dirty):
+            item = self._items.get(uid)
+            if item is None:
+                self._dirty.discard(uid)
+            elif await self._write(uid, item[0]):
+                n += 1
+        return n
+
+    def sweep(self) -> int:
+        """Выселить всех простаивающих дольше TTL. Самые старые — в начале OrderedDict."""
+        now = time.monotonic()
+        n = 0
+        while self._items:
+            uid, (_, seen_at) = next(iter(self._items.items()))
+            if not self._expired(seen_at, now):
+                break
+            self._forget(uid, self._items.pop(uid))
+            n += 1
+        self.evicted_idle += n
+        return n
+
+    def stats(self, sample: int = 50) -> Dict[str, Any]:
+        """Метрики; память оценивается по выборке из `sample` последних состояний."""
+        items = list(self._items.values())[-sample:]
+        avg = (sum(_deep_size(st) for st, _ in items) / len(items)) if items else 0
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "ttl_sec": self.ttl_sec,
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+            "approx_bytes": int(avg * len(self._items)),
+            "backend": self.backend.name,
+            "loaded": self.loaded,
+            "saved": self.saved,
+            "backend_errors": self.backend_errors,
+            "deferred": self.deferred,
+            "dirty": len(self._dirty) + len(self._evicted_dirty),
+        }
@@ -0,0 +1,109 @@
+# bot/webhook.py
+# Режим webhook: aiohttp-сервер принимает апдейты от Telegram, сразу отвечает 200,
+# а обработку отдаёт диспетчеру в фоне (не больше max_inflight одновременно).
+import asyncio, hmac
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateFeeder:
+    """Пускает апдейты в диспетчер параллельно, но с ограничением числа одновременных."""
+
+    def __init__(self, bot: Bot, dp: Dispatcher, max_inflight: int = 100):
+        self.bot = bot
+        self.dp = dp
+        self.max_inflight = max_inflight
+        self._sem = asyncio.Semaphore(max_inflight)
+        self._tasks: Set[asyncio.Task] = set()
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, update: Update) -> None:
+        # при переполнении ждём слот: Telegram получит ответ чуть позже — это и есть backpressure
+        await self._sem.acquire()
+        self.received += 1
+        task = asyncio.get_running_loop().create_task(self._run(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            print("update ERROR:", repr(e))
+        finally:
+            self._sem.release()
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+
+def make_app(
+    bot: Bot,
+    dp: Dispatcher,
+    path: str = "/tg/webhook",
+    secret: Optional[str] = None,
+    max_inflight: int = 100,
+    app: Optional[web.Application] = None,
+) -> web.Application:
+    app = app or web.Application()
+    feeder = UpdateFeeder(bot, dp, max_inflight=max_inflight)
+    app["feeder"] = feeder
+
+    async def handle(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": bot})
+        except Exception:
+            return web.Response(status=400)
+        await feeder.submit(update)
+        return web.Response(status=200)
+
+    async def on_shutdown(_app: web.Application) -> None:
+        await feeder.drain()
+
+    app.router.add_post(path, handle)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    base_url: str,
+    path: str = "/tg/webhook",
+    secret: Optional[str] = None,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    max_inflight: int = 100,
+    app: Optional[web.Application] = None,
+) -> None:
+    app = make_app(bot, dp, path=path, secret=secret, max_inflight=max_inflight, app=app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    await bot.set_webhook(
+        base_url.rstrip("/") + path,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"Webhook listening on {host}:{port}{path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
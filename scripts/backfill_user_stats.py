@@ -0,0 +1,53 @@
+# scripts/backfill_user_stats.py
+# Пересчитать роллап user_stats по всей истории results (одноразово после включения роллапа
+# или если он разъехался). Можно запускать на живом боте: таблица блокируется на время пересчёта,
+# а пачки результатов, пришедшие параллельно, доливаются поверх после коммита.
+#
+#   python scripts/backfill_user_stats.py
+import os, asyncio, asyncpg
+from dotenv import load_dotenv
+
+from seed_content import ensure_sslmode, make_ssl_ctx
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+
+async def main():
+    if not DATABASE_URL:
+        raise RuntimeError("DATABASE_URL is not set (env or .env)")
+
+    conn = await asyncpg.connect(ensure_sslmode(DATABASE_URL, "verify-full"), ssl=make_ssl_ctx(), statement_cache_size=0)
+    try:
+        await conn.execute("""
+            create table if not exists user_stats (
+              user_id bigint primary key,
+              total bigint not null default 0,
+              correct bigint not null default 0,
+              sum_delta bigint not null default 0,
+              updated_at timestamptz not null default now()
+            )
+        """)
+        async with conn.transaction():
+            await conn.execute("lock table user_stats in exclusive mode")
+            await conn.execute("truncate user_stats")
+            status = await conn.execute("""
+                insert into user_stats(user_id, total, correct, sum_delta, updated_at)
+                select
+                  s.user_id,
+                  count(*),
+                  count(*) filter (where r.truth = r.user_choice),
+                  coalesce(sum(coalesce(r.delta,0)),0),
+                  now()
+                from results r
+                join sessions s on s.id = r.session_id
+                group by s.user_id
+            """)
+    finally:
+        await conn.close()
+    print("Backfill OK:", status)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+# scripts/bench_content.py
+# Микробенчмарки горячих путей игрового дня: подмена слова, «ошибочные» примеры,
+# подсветка, учебный банк колоды и сборка вечерней очереди (контент — синтетический бандл в памяти,
+# БД — fake_db). Сиды фиксированы, размеры словаря — как у реального контента и больше.
+#
+#   python scripts/bench_content.py                               # 100 / 1000 / 5000 слов
+#   python scripts/bench_content.py --save bench_content.json     # сохранить baseline
+#   python scripts/bench_content.py --compare bench_content.json  # сравнить; exit 1 при регрессии
+import os, sys, json, time, random, asyncio, argparse, platform, statistics
+from pathlib import Path
+
+from mock_telegram import FAKE_TOKEN
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+LEVELS = ["A2", "B1", "B2", "C1", "C2"]
+POS = "adjectives"
+TEMPLATES = [
+    "Our team is {w} and finishes tasks on time.",
+    "This {w} tool saved the project a lot of time.",
+    "She gave a {w} answer during the meeting.",
+    "A {w} approach helps when deadlines are tight.",
+    "The report looked {w}, so we checked every line.",
+]
+DECK_SIZE = 5
+
+
+def fake_word(rng: random.Random) -> str:
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(5, 12)))
+
+
+def synthetic_payload(n_words: int, seed: int) -> dict:
+    """Бандл того же формата, что собирает bundle.build_bundle: n слов, по 2 ok-примера, сгенерированные bad."""
+    from bundle import FORMAT
+    from distractors import generate_bad_rows
+
+    rng = random.Random(seed)
+    vocab, seen = [], set()
+    while len(vocab) < n_words:
+        w = fake_word(rng)
+        if w not in seen:
+            seen.add(w); vocab.append(w)
+    words = [[-(i + 1), LEVELS[i % len(LEVELS)], POS, w, f"перевод {w}"] for i, w in enumerate(vocab)]
+    examples, study, oks = {}, {}, []
+    for wid, _, _, w, _ in words:
+        pairs = [[t.format(w=w), f"Пример с «{w}»."] for t in rng.sample(TEMPLATES, 2)]
+        examples[wid] = {"ok": pairs[:1], "alt_ok": pairs[1:], "bad": []}
+        study[w] = pairs
+        for en, ru in pairs:
+            oks.append((len(oks) + 1, wid, en, ru))
+    by_id = {wid: (level, pos, w) for wid, level, pos, w, _ in words}
+    ok_text = {ex_id: (en, ru) for ex_id, _, en, ru in oks}
+    for wid, ex_id, en, ru, repl, hl in generate_bad_rows(by_id, oks, per_example=3, seed=seed):
+        examples[wid]["bad"].append([en, ru, repl, hl, *ok_text[ex_id]])
+    return {
+        "format": FORMAT, "hash": f"synthetic-{n_words}-{seed}", "words": words,
+        "examples": {str(k): v for k, v in examples.items()}, "study_bank": study, "episodes": {},
+    }
+
+
+def measure(fn, number: int, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return {"us_per_op": round(statistics.median(runs) * 1e6, 3), "min_us": round(min(runs) * 1e6, 3),
+            "number": number, "repeat": repeat}
+
+
+async def measure_async(fn, number: int, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return {"us_per_op": round(statistics.median(runs) * 1e6, 3), "min_us": round(min(runs) * 1e6, 3),
+            "number": number, "repeat": repeat}
+
+
+async def bench_size(app, n_words: int, args) -> dict:
+    from bundle import ContentBundle
+    from models import WordCard
+
+    bundle = ContentBundle(synthetic_payload(n_words, args.seed))
+    app.CONTENT.bundle = bundle
+    app.CONTENT.use_bundle()
+
+    rng = random.Random(args.seed)
+    ids = list(bundle.words)
+    decks = []
+    for _ in range(64):
+        picked = rng.sample(ids, DECK_SIZE)
+        deck = [WordCard(*bundle.words[i]) for i in picked]
+        decks.append((deck, {c.word: i for c, i in zip(deck, picked)}))
+    banks = [app.collect_study_bank(d) for d, _ in decks]
+    swaps = []
+    for _ in range(512):
+        i, j = rng.sample(ids, 2)
+        w, repl = bundle.words[i][0], bundle.words[j][0]
+        swaps.append((rng.choice(bundle.study_bank[w])[0], w, repl))
+    highlights = [(t, [repl]) for t, _, repl in swaps]
+
+    it = {"swap": 0, "deck": 0, "hl": 0}
+
+    def nxt(key, seq) -> int:
+        it[key] = (it[key] + 1) % len(seq)
+        return it[key]
+
+    def swap():
+        t, w, r = swaps[nxt("swap", swaps)]
+        app.swap_word_everywhere(t, w, r)
+
+    def wrong_from_bank():
+        k = nxt("deck", decks)
+        deck, _ = decks[k]
+        app.make_wrong_swapped_from_bank(deck[0].word, [c.word for c in deck], banks[k])
+
+    def highlight():
+        t, hl = highlights[nxt("hl", highlights)]
+        app.format_with_highlights(t, hl)
+
+    def study_bank():
+        app.collect_study_bank(decks[nxt("deck", decks)][0])
+
+    async def evening_queue():
+        k = nxt("deck", decks)
+        deck, word2id = decks[k]
+        await app.build_evening_queue(deck, banks[k], word2id)
+
+    n, r = args.number, args.repeat
+    out = {}
+    for name, fn in (
+        ("swap_word_everywhere", swap),
+        ("make_wrong_swapped_from_bank", wrong_from_bank),
+        ("format_with_highlights", highlight),
+        ("collect_study_bank", study_bank),
+    ):
+        random.seed(args.seed)
+        out[f"{name}[n={n_words}]"] = measure(fn, n, r)
+    random.seed(args.seed)
+    out[f"build_evening_queue[n={n_words}]"] = await measure_async(evening_queue, max(1, n // 10), r)
+    return out
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> int:
+    regressions = 0
+    print(f"\n{'benchmark':<44}{'base us':>11}{'now us':>11}{'ratio':>8}")
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<44}{'—':>11}{cur['us_per_op']:>11}{'new':>8}")
+            continue
+        ratio = cur["us_per_op"] / base["us_per_op"] if base["us_per_op"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:<44}{base['us_per_op']:>11}{cur['us_per_op']:>11}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000], help="размеры словаря")
+    ap.add_argument("--number", type=int, default=2000, help="вызовов в одном замере")
+    ap.add_argument("--repeat", type=int, default=5, help="замеров (берём медиану)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", help="записать результаты как baseline (JSON)")
+    ap.add_argument("--compare", help="сравнить с baseline (JSON)")
+    ap.add_argument("--threshold", type=float, default=1.25, help="во сколько раз медленнее — уже регрессия")
+    args = ap.parse_args()
+
+    sys.path.insert(0, str(BOT_DIR))
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    import fake_db
+    sys.modules["db"] = fake_db
+    import app
+
+    results = {}
+    for n in args.sizes:
+        results.update(await bench_size(app, n, args))
+    for name, r in results.items():
+        print(f"{name:<44}{r['us_per_op']:>11} us/op   (min {r['min_us']})")
+
+    if args.save:
+        doc = {
+            "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                     "seed": args.seed, "created": int(time.time())},
+            "results": results,
+        }
+        Path(args.save).write_text(json.dumps(doc, indent=2), encoding="utf-8")
+        print(f"\nbaseline → {args.save}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["results"]
+        bad = compare(results, baseline, args.threshold)
+        if bad:
+            print(f"\n{bad} regression(s) over x{args.threshold}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
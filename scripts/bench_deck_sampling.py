@@ -0,0 +1,98 @@
+# scripts/bench_deck_sampling.py
+# Сравнение выборки колоды: "order by random() limit k" против id-массивов (CONTENT_CACHE_MODE=ids).
+# Данные — во временной таблице, реальные words/examples не трогаются.
+#
+#   python scripts/bench_deck_sampling.py --sizes 10000 100000 --repeat 200
+import os, time, random, asyncio, argparse, statistics
+import asyncpg
+from dotenv import load_dotenv
+
+from seed_content import ensure_sslmode, make_ssl_ctx
+
+load_dotenv()
+
+LEVELS = ["A2", "B1", "B2", "C1", "C2"]
+POS = "adjectives"
+
+
+def summary(samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"mean {statistics.mean(samples)*1000:8.3f} ms   p95 {p95*1000:8.3f} ms"
+
+
+async def fill(conn, n: int):
+    await conn.execute("drop table if exists bench_words")
+    await conn.execute("""
+        create temp table bench_words (
+            id bigserial primary key,
+            level text not null,
+            pos text not null,
+            word text not null,
+            translation text
+        )
+    """)
+    rows = [(LEVELS[i % len(LEVELS)], POS, f"word{i}", f"слово{i}") for i in range(n)]
+    await conn.copy_records_to_table("bench_words", records=rows, columns=["level", "pos", "word", "translation"])
+    await conn.execute("create index on bench_words(level, pos, id)")
+    await conn.execute("analyze bench_words")
+
+
+async def bench_order_by_random(conn, k: int, repeat: int):
+    out = []
+    for _ in range(repeat):
+        lvl = random.choice(LEVELS)
+        t0 = time.perf_counter()
+        await conn.fetch(
+            "select id, word, translation from bench_words where level=$1 and pos=$2 order by random() limit $3",
+            lvl, POS, k
+        )
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+async def bench_id_arrays(conn, k: int, repeat: int):
+    t0 = time.perf_counter()
+    by_level = {}
+    for r in await conn.fetch("select id, level from bench_words where pos=$1", POS):
+        by_level.setdefault(r["level"], []).append(r["id"])
+    load = time.perf_counter() - t0
+
+    out = []
+    for _ in range(repeat):
+        lvl = random.choice(LEVELS)
+        t0 = time.perf_counter()
+        picked = random.sample(by_level[lvl], k=k)
+        await conn.fetch("select id, word, translation from bench_words where id = any($1)", picked)
+        out.append(time.perf_counter() - t0)
+    return load, out
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL is not set (env or .env)")
+    random.seed(args.seed)
+    conn = await asyncpg.connect(ensure_sslmode(dsn, "verify-full"), ssl=make_ssl_ctx(), statement_cache_size=0)
+    try:
+        for n in args.sizes:
+            await fill(conn, n)
+            print(f"\n== {n} words ({n // len(LEVELS)} per level), k={args.k}, repeat={args.repeat}")
+            rnd = await bench_order_by_random(conn, args.k, args.repeat)
+            print(f"order by random()   {summary(rnd)}")
+            load, ids = await bench_id_arrays(conn, args.k, args.repeat)
+            print(f"id arrays + any($1) {summary(ids)}   (load ids once: {load*1000:.1f} ms)")
+    finally:
+        await conn.execute("drop table if exists bench_words")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+# scripts/bench_review_deck.py
+# Выборка колоды с интервальным повторением: индексный review_deck (word_mastery, как в боте)
+# против вычисления «что повторять» по истории results — для игроков с 1k / 10k / 50k ответов.
+# Всё во временных таблицах (temp-схема перекрывает одноимённые боевые), реальные данные не трогаются.
+#
+#   python scripts/bench_review_deck.py --answers 1000 10000 50000 --repeat 200
+import os, sys, time, random, asyncio, argparse, statistics
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+
+from seed_content import ensure_sslmode, make_ssl_ctx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+from db import REVIEW_DECK_SQL  # noqa: E402  тот же запрос, что выполняет бот
+
+load_dotenv()
+
+LEVELS = ["A2", "B1", "B2", "C1", "C2"]
+POS = "adjectives"
+DAY = 86400
+
+# «без mastery»: агрегировать всю историю игрока при каждом start_day
+HISTORY_SQL = """
+with h as (
+  select word_id, count(*) as n, sum(correct::int) as c, max(answered_at) as last
+  from results_hist where user_id = $1 group by word_id
+)
+select w.id from words w left join h on h.word_id = w.id
+where w.level = $2 and w.pos = $3
+order by (h.word_id is not null), h.c::float / nullif(h.n, 0), h.last
+limit $4
+"""
+
+
+def summary(samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"mean {statistics.mean(samples)*1000:8.3f} ms   p95 {p95*1000:8.3f} ms"
+
+
+async def fill_words(conn, n_words: int) -> dict:
+    await conn.execute("""
+        create temp table words (
+            id bigint primary key, level text not null, pos text not null, word text not null, translation text
+        )
+    """)
+    rows = [(i + 1, LEVELS[i % len(LEVELS)], POS, f"word{i}", f"слово{i}") for i in range(n_words)]
+    await conn.copy_records_to_table("words", records=rows, columns=["id", "level", "pos", "word", "translation"])
+    await conn.execute("create index on words(level, pos, id)")
+    await conn.execute("""
+        create temp table word_mastery (
+            user_id bigint not null, word_id bigint not null, level text not null, pos text not null,
+            reps int not null default 0, ease real not null default 2.5, interval_days int not null default 0,
+            due_at timestamptz not null default now(), last_quality smallint not null default 0,
+            seen bigint not null default 0, correct bigint not null default 0,
+            updated_at timestamptz not null default now(),
+            primary key (user_id, word_id)
+        )
+    """)
+    await conn.execute("create index on word_mastery(user_id, level, pos, due_at)")
+    await conn.execute("""
+        create temp table results_hist (
+            user_id bigint not null, word_id bigint not null, correct boolean not null,
+            answered_at timestamptz not null
+        )
+    """)
+    await conn.execute("create index on results_hist(user_id)")
+    by_level = {}
+    for wid, level, *_ in rows:
+        by_level.setdefault(level, []).append(wid)
+    return by_level
+
+
+async def fill_user(conn, user_id: int, answers: int, by_level: dict, rng: random.Random) -> None:
+    """answers ответов по всем уровням; mastery — тот же итог, что дал бы роллап пачек."""
+    now = time.time()
+    hist, agg = [], {}
+    vocab = [(lvl, wid) for lvl, ids in by_level.items() for wid in ids]
+    for i in range(answers):
+        lvl, wid = rng.choice(vocab)
+        ok = rng.random() < 0.7
+        at = now - (answers - i) * 60
+        hist.append((user_id, wid, ok, at))
+        a = agg.setdefault(wid, [lvl, 0, 0, at])
+        a[1] += 1; a[2] += ok; a[3] = at
+    ts = lambda t: datetime.fromtimestamp(t, timezone.utc)
+    await conn.copy_records_to_table(
+        "results_hist", records=[(u, w, ok, ts(at)) for u, w, ok, at in hist],
+        columns=["user_id", "word_id", "correct", "answered_at"],
+    )
+    mastery = [
+        (user_id, wid, lvl, POS, n, c, ts(last + rng.uniform(-10, 30) * DAY))
+        for wid, (lvl, n, c, last) in agg.items()
+    ]
+    await conn.copy_records_to_table(
+        "word_mastery", records=mastery,
+        columns=["user_id", "word_id", "level", "pos", "seen", "correct", "due_at"],
+    )
+
+
+async def timed(conn, repeat: int, rng: random.Random, query: str, args_for) -> list:
+    out = []
+    for _ in range(repeat):
+        args = args_for(rng)
+        t0 = time.perf_counter()
+        await conn.fetch(query, *args)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--answers", type=int, nargs="+", default=[1_000, 10_000, 50_000], help="ответов у игрока")
+    ap.add_argument("--words", type=int, default=20_000, help="словарь (на все уровни)")
+    ap.add_argument("--users", type=int, default=50, help="игроков с таким числом ответов")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        raise RuntimeError("DATABASE_URL is not set (env or .env)")
+    conn = await asyncpg.connect(ensure_sslmode(dsn, "verify-full"), ssl=make_ssl_ctx(), statement_cache_size=0)
+    try:
+        by_level = await fill_words(conn, args.words)
+        uid = 0
+        for answers in args.answers:
+            rng = random.Random(args.seed)
+            first = uid + 1
+            for _ in range(args.users):
+                uid += 1
+                await fill_user(conn, uid, answers, by_level, rng)
+            await conn.execute("analyze words; analyze word_mastery; analyze results_hist")
+            users = range(first, uid + 1)
+
+            def review_args(r):
+                lvl = r.choice(LEVELS)
+                return r.choice(users), lvl, POS, r.sample(by_level[lvl], args.k * 8), args.k
+
+            def history_args(r):
+                return r.choice(users), r.choice(LEVELS), POS, args.k
+
+            print(f"\n== {answers} answers per user, {args.users} users, {args.words} words, k={args.k}")
+            review = await timed(conn, args.repeat, random.Random(args.seed), REVIEW_DECK_SQL, review_args)
+            print(f"review_deck (word_mastery)  {summary(review)}")
+            history = await timed(conn, args.repeat, random.Random(args.seed), HISTORY_SQL, history_args)
+            print(f"history scan (results)      {summary(history)}")
+            plan = await conn.fetch("explain (analyze, buffers) " + REVIEW_DECK_SQL, *review_args(random.Random(args.seed)))
+            buffers = [r[0].strip() for r in plan if "Buffers" in r[0]]
+            print("review_deck plan:", "no seq scan" if not any("Seq Scan" in r[0] for r in plan) else "HAS SEQ SCAN",
+                  "|", buffers[0] if buffers else "")
+    finally:
+        # только pg_temp: одноимённые боевые таблицы не трогаем
+        await conn.execute("drop table if exists pg_temp.words, pg_temp.word_mastery, pg_temp.results_hist")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+# scripts/build_bundle.py
+# Собрать content/bundle.bin из content/* и встроенных банков (bot/banks.py).
+# Бот грузит бандл на старте (CONTENT_BUNDLE_PATH) и играет на нём, пока БД недоступна.
+#
+#   python scripts/build_bundle.py
+#   python scripts/build_bundle.py --out /tmp/bundle.bin --bad-per-example 3 --seed 0
+import sys, time, argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+from bundle import DEFAULT_PATH, ContentBundle, build_bundle, write_bundle
+from episodes import EpisodeLibrary
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--content", default="content", help="каталог с words.csv/examples.csv/episodes")
+    ap.add_argument("--out", default=DEFAULT_PATH)
+    ap.add_argument("--bad-per-example", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    payload = build_bundle(args.content, bad_per_example=args.bad_per_example, seed=args.seed)
+    # битый эпизод должен ронять сборку, а не игрока посреди сюжета
+    lib = EpisodeLibrary()
+    lib.load(payload["episodes"])
+    beats = sum(len(ep.beats) for ep in lib.compile_all().values())
+    size = write_bundle(payload, args.out)
+    t1 = time.perf_counter()
+    b = ContentBundle.from_file(args.out)
+    t2 = time.perf_counter()
+
+    n_examples = sum(len(rows) for kinds in b.examples.values() for rows in kinds.values())
+    print(f"bundle {args.out}: {size} bytes, hash {b.hash[:12]}")
+    print(f"  words {len(b.words)}, examples {n_examples}, study banks {len(b.study_bank)}, episodes {len(b.episodes)} ({beats} beats)")
+    print(f"  build {(t1 - t0) * 1000:.1f} ms, load {(t2 - t1) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
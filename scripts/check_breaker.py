@@ -0,0 +1,187 @@
+# scripts/check_breaker.py
+# Проверка предохранителя БД (breaker.py) на InstrumentedPool из db.py — без Postgres:
+# под пулом заглушка asyncpg.Pool, которая отвечает, зависает или рвёт соединение по команде.
+#   отменённый пробный вызов half-open (wait_for, отключение клиента) → сбой, цепь не залипает;
+#   после reset_sec новый пробный вызов проходит и замыкает цепь;
+#   statement timeout / отмена запроса и таймаут acquire при занятом пуле цепь не размыкают,
+#   таймаут acquire при свободных слотах (подключение повисло) — размыкает;
+#   OSError кода вызывающего внутри acquire (диск переполнен) при живом соединении цепь не размыкает.
+#
+#   python scripts/check_breaker.py
+import os, sys, asyncio
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bot"))
+os.environ["DATABASE_URL"] = ""  # только логика пула: без подключения и без журнала
+import asyncpg  # noqa: E402
+import db  # noqa: E402
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError  # noqa: E402
+
+FAILED = []
+
+
+def check(ok: bool, what: str) -> None:
+    print(("ok   " if ok else "FAIL ") + what)
+    if not ok:
+        FAILED.append(what)
+
+
+class StubConn:
+    def __init__(self, pool):
+        self.pool = pool
+        self.closed = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    async def fetchval(self, query, *args, **kwargs):
+        if self.pool.mode == "hang":
+            await asyncio.sleep(3600)
+        if self.pool.mode == "down":
+            self.closed = True
+            raise asyncpg.ConnectionDoesNotExistError("connection was closed in the middle of operation")
+        if self.pool.mode == "slow":
+            raise asyncio.TimeoutError()  # command_timeout
+        if self.pool.mode == "canceled":
+            raise asyncpg.QueryCanceledError("canceling statement due to statement timeout")
+        return 1
+
+
+class StubPool:
+    """Минимум asyncpg.Pool, который трогает InstrumentedPool."""
+
+    def __init__(self, max_size: int = 2):
+        self.mode = "ok"
+        self.max_size = max_size
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+    async def acquire(self, timeout=None):
+        if self.mode == "hang_acquire":
+            await asyncio.sleep(3600)
+        if self.mode == "acquire_timeout":
+            raise asyncio.TimeoutError()
+        return StubConn(self)
+
+    async def release(self, conn):
+        pass
+
+
+async def ping(pool) -> int:
+    async with pool.acquire() as conn:
+        return await conn.fetchval("/* check */ select 1")
+
+
+async def open_circuit(pool, stub) -> None:
+    stub.mode = "down"
+    for _ in range(db.BREAKER.failure_threshold):
+        try:
+            await ping(pool)
+        except asyncpg.ConnectionDoesNotExistError:
+            pass
+
+
+async def main():
+    db.BREAKER = CircuitBreaker(failure_threshold=2, reset_sec=0.05)
+    stub = StubPool()
+    pool = db.InstrumentedPool(stub)
+
+    for where in ("hang", "hang_acquire"):  # отмена во время запроса и во время acquire
+        await open_circuit(pool, stub)
+        check(db.BREAKER.state == OPEN, f"[{where}] circuit opens after connection failures")
+        try:
+            await ping(pool)
+            check(False, f"[{where}] open circuit rejects calls")
+        except CircuitOpenError:
+            check(True, f"[{where}] open circuit rejects calls")
+
+        await asyncio.sleep(0.06)
+        stub.mode = where
+        try:
+            await asyncio.wait_for(ping(pool), 0.05)  # как wait_for вокруг /healthz
+        except asyncio.TimeoutError:
+            pass
+        check(db.BREAKER.state == OPEN and not db.BREAKER._probe,
+              f"[{where}] cancelled probe counts as a failure (state {db.BREAKER.state})")
+
+        await asyncio.sleep(0.06)
+        stub.mode = "ok"
+        try:
+            await ping(pool)
+            check(db.BREAKER.state == CLOSED, f"[{where}] next probe after reset closes the circuit")
+        except CircuitOpenError as e:
+            check(False, f"[{where}] next probe after reset closes the circuit ({e})")
+
+    # half-open пропускает ровно один пробный вызов
+    await open_circuit(pool, stub)
+    await asyncio.sleep(0.06)
+    stub.mode = "hang"
+    probe = asyncio.get_running_loop().create_task(ping(pool))
+    await asyncio.sleep(0)
+    try:
+        await ping(pool)
+        check(False, "half-open lets a single probe through")
+    except CircuitOpenError:
+        check(db.BREAKER.state == HALF_OPEN, "half-open lets a single probe through")
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    check(db.BREAKER.state == OPEN, "cancelled task probe reopens the circuit")
+
+    # ошибки, после которых БД всё ещё доступна
+    await asyncio.sleep(0.06)
+    stub.mode = "ok"
+    await ping(pool)
+    for mode in ("slow", "canceled"):
+        stub.mode = mode
+        for _ in range(db.BREAKER.failure_threshold + 1):
+            try:
+                await ping(pool)
+            except (asyncio.TimeoutError, asyncpg.QueryCanceledError):
+                pass
+        check(db.BREAKER.state == CLOSED, f"query {mode} does not open the circuit")
+
+    async def hold():
+        async with pool.acquire():
+            await asyncio.sleep(0.05)
+
+    stub.mode = "ok"
+    holders = [asyncio.get_running_loop().create_task(hold()) for _ in range(stub.max_size)]
+    await asyncio.sleep(0)
+    stub.mode = "acquire_timeout"
+    for _ in range(db.BREAKER.failure_threshold + 1):
+        try:
+            await ping(pool)
+        except asyncio.TimeoutError:
+            pass
+    check(db.BREAKER.state == CLOSED, "acquire timeout on a saturated pool does not open the circuit")
+    stub.mode = "ok"
+    await asyncio.gather(*holders)
+    stub.mode = "acquire_timeout"
+    for _ in range(db.BREAKER.failure_threshold):
+        try:
+            await ping(pool)
+        except asyncio.TimeoutError:
+            pass
+    check(db.BREAKER.state == OPEN, "acquire timeout with free slots opens the circuit")
+
+    # как send_export при полном диске: запрос прошёл, упала запись в файл
+    await asyncio.sleep(0.06)
+    stub.mode = "ok"
+    await ping(pool)
+    for _ in range(db.BREAKER.failure_threshold + 1):
+        try:
+            async with pool.acquire() as conn:
+                await conn.fetchval("/* check */ select 1")
+                raise OSError(28, "No space left on device")
+        except (OSError, CircuitOpenError):
+            pass
+    check(db.BREAKER.state == CLOSED, "caller OSError inside acquire does not open the circuit")
+
+    print("FAILED" if FAILED else "all checks passed")
+    sys.exit(1 if FAILED else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
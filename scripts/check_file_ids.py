@@ -0,0 +1,114 @@
+# scripts/check_file_ids.py
+# Проверка кэша file_id (assets.py) через диспетчер: Telegram — MockSession, БД — fake_db.
+#   повтор того же экспорта           → по file_id, без заливки;
+#   такой же файл у другого игрока    → своя заливка со своим именем (file_id не делятся между чатами);
+#   новый экспорт в том же слоте      → прежний file_id слота вытеснен;
+#   file_id отвергнут Telegram'ом     → забыт и залит заново;
+#   экспорт идёт из БД (не локальный fallback), а сбой отправки не подменяется локальным экспортом.
+#
+#   python scripts/check_file_ids.py
+import os, sys, asyncio, tempfile
+from pathlib import Path
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
+from aiogram.types import Message, Update
+
+from mock_telegram import FAKE_TOKEN, mock_bot, message_update
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bot"))
+os.environ["BOT_TOKEN"] = FAKE_TOKEN
+import fake_db  # noqa: E402
+sys.modules["db"] = fake_db  # до импорта бота: он берёт функции БД из модуля db
+import app  # noqa: E402
+
+FAILED = []
+
+
+def check(ok: bool, what: str) -> None:
+    print(("ok   " if ok else "FAIL ") + what)
+    if not ok:
+        FAILED.append(what)
+
+
+async def main():
+    bot = mock_bot()
+    app.FILE_IDS.bot_id = bot.id
+    sent = []  # (chat_id, заливка?, имя файла)
+    captions = []
+    orig = bot.session.make_request
+
+    async def spy(b, method, timeout=None):
+        media = getattr(method, "document", None) or getattr(method, "photo", None)
+        if media is not None:
+            upload = not isinstance(media, str)
+            sent.append((method.chat_id, upload, media.filename if upload else media))
+            captions.append(getattr(method, "caption", None) or "")
+        return await orig(b, method, timeout)
+
+    bot.session.make_request = spy
+    ids = iter(range(1, 10**6))
+    feed = lambda raw: app.dp.feed_update(bot, Update.model_validate(raw, context={"bot": bot}))
+
+    # одинаковая (пустая) история у двух игроков → байт-в-байт одинаковые файлы
+    for uid in (9, 10):
+        await feed(message_update(next(ids), uid, "/start"))
+    await feed(message_update(next(ids), 9, "/export"))
+    await feed(message_update(next(ids), 9, "/export"))
+    check([u for _, u, _ in sent] == [True, False], "repeat export is sent by file_id")
+
+    sent.clear()
+    await feed(message_update(next(ids), 10, "/export"))
+    check(sent == [(10, True, "results_10.csv.gz")], "identical export of another user is uploaded under its own name")
+
+    # новая история игрока 9 → новый ключ в том же слоте, старый вытеснен
+    _, sid = await fake_db.begin_session(9, "A1")
+    await fake_db.append_result(sid, 0, "x", "x", True, True, True, "match", 0, 0)
+    await feed(message_update(next(ids), 9, "/export"))
+    slot9 = [k for _, k in fake_db.file_ids if k.startswith("export:9/")]
+    check(len(slot9) == 1, f"one stored file_id per export slot (chat 9: {len(slot9)})")
+    check(len(captions) == 4 and all("из БД" in c for c in captions),
+          f"every export comes from the DB, not the local fallback ({captions})")
+
+    # Telegram не принял файл → ошибка уходит наверх, локальный экспорт вдогонку не шлётся
+    async def drop_documents(b, method, timeout=None):
+        if getattr(method, "document", None) is not None:
+            captions.append(method.caption or "")
+            raise TelegramNetworkError(method=method, message="connection reset")
+        return await spy(b, method, timeout)
+
+    bot.session.make_request = drop_documents
+    captions.clear()
+    try:
+        await feed(message_update(next(ids), 10, "/export"))
+        check(False, "failed export send is reported, not swallowed")
+    except TelegramNetworkError:
+        check(True, "failed export send is reported, not swallowed")
+    check(len(captions) == 1, f"no local export after a failed send ({captions})")
+    bot.session.make_request = spy
+
+    # отвергнутый file_id (удалён, другой бот) → забываем и заливаем заново
+    with tempfile.TemporaryDirectory() as tmp:
+        scene = Path(tmp) / "scene.jpg"
+        scene.write_bytes(b"\xff\xd8fakejpeg" * 100)
+        msg = Message.model_validate(message_update(next(ids), 9, "x")["message"], context={"bot": bot})
+        await app.send_scene(msg, "scene://x", scene)
+
+        async def reject(b, method, timeout=None):
+            if isinstance(getattr(method, "photo", None), str):
+                raise TelegramBadRequest(method=method, message="wrong file identifier")
+            return await spy(b, method, timeout)
+
+        bot.session.make_request = reject
+        sent.clear()
+        await app.send_scene(msg, "scene://x", scene)
+        bot.session.make_request = spy
+        await app.send_scene(msg, "scene://x", scene)
+        check([u for _, u, _ in sent] == [True, False], "rejected file_id is re-uploaded, then reused")
+
+    print("FAILED" if FAILED else "all checks passed")
+    sys.exit(1 if FAILED else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
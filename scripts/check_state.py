@@ -0,0 +1,118 @@
+# scripts/check_state.py
+# Проверка реестра состояний (state.py) без Postgres: две «реплики» — два StateRegistry над одним
+# общим хранилищем (как STATE_BACKEND=postgres), у каждой свой checkpoint, как в app.py.
+#   ход в реплике A → следующий апдейт в реплике B видит его (шаг guard'а не отстаёт);
+#   возврат в A после хода в B → A видит ход B, а flush() обеих не откатывает состояние назад;
+#   локальное хранилище (dbm): состояние, выселенное несохранённым, переживает сбой записи при flush().
+#
+#   python scripts/check_state.py
+import sys, asyncio
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bot"))
+from models import UserState, dump_state, load_state  # noqa: E402
+from state import StateRegistry  # noqa: E402
+
+FAILED = []
+UID = 42
+
+
+def check(ok: bool, what: str) -> None:
+    print(("ok   " if ok else "FAIL ") + what)
+    if not ok:
+        FAILED.append(what)
+
+
+class SharedBackend:
+    """Общая «таблица game_state» для нескольких реестров."""
+    name = "postgres"
+    shared = True
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+
+    async def load(self, uid):
+        return self.data.get(uid)
+
+    async def save(self, uid, blob):
+        if self.down:
+            raise OSError("storage is down")
+        self.data[uid] = blob
+
+    async def delete(self, uid):
+        self.data.pop(uid, None)
+
+
+def replica(backend) -> StateRegistry:
+    return StateRegistry(
+        UserState, backend=backend, dumps=dump_state, loads=load_state,
+        checkpoint=lambda s: (s.stage, s.level, s.day, s.episode),
+    )
+
+
+async def move(reg: StateRegistry) -> UserState:
+    """Один апдейт: guard читает шаг, хендлер делает ход внутри этапа (этап не меняется)."""
+    with reg.update_scope():
+        await reg.fetch(UID)  # guard
+        s = await reg.fetch_or_create(UID)
+        s.step += 1
+        s.evening_idx += 1
+        s.balance += 50
+        await reg.save(UID, s)
+        return s
+
+
+async def step_seen_by(reg: StateRegistry) -> int:
+    with reg.update_scope():
+        s = await reg.fetch(UID)
+        return s.step if s is not None else -1
+
+
+async def main():
+    backend = SharedBackend()
+    a, b = replica(backend), replica(backend)
+
+    with a.update_scope():
+        s = await a.fetch_or_create(UID)
+        s.stage = "evening"
+        await a.save(UID, s)
+
+    await move(a)
+    check(await step_seen_by(b) == 1, "replica B sees the move made in A (step 1)")
+
+    await move(b)
+    check(await step_seen_by(a) == 2, "back in A: A sees the move made in B (step 2)")
+    await move(a)
+
+    await a.flush()
+    await b.flush()
+    stored = load_state(backend.data[UID])
+    check((stored.step, stored.evening_idx, stored.balance) == (3, 3, 150),
+          f"flush of both replicas does not roll state back (stored step {stored.step})")
+
+    # dbm: ход внутри этапа отложен, состояние выселено, а хранилище на первом flush() недоступно
+    local = SharedBackend()
+    local.name, local.shared = "dbm", False
+    reg = replica(local)
+    with reg.update_scope():
+        s = await reg.fetch_or_create(UID)
+        s.stage = "evening"
+        await reg.save(UID, s)
+    await move(reg)
+    reg.max_size = 0
+    reg.put(UID + 1, UserState())  # LRU выселяет UID с несохранённым ходом
+    local.down = True
+    await reg.flush()
+    local.down = False
+    await reg.flush()
+    stored = load_state(local.data[UID])
+    check(stored.step == 1, f"evicted dirty state survives a failed flush (stored step {stored.step})")
+
+    print("FAILED" if FAILED else "all checks passed")
+    sys.exit(1 if FAILED else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
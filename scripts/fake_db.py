@@ -0,0 +1,315 @@
+# scripts/fake_db.py
+# In-memory замена bot/db.py для стендов: тот же публичный API, «запросы» — sleep с заданной
+# задержкой под семафором размера пула. Так видно насыщение пула без живого Postgres.
+#
+#   import fake_db; fake_db.configure(pool_size=5, latency=0.005)
+#   sys.modules["db"] = fake_db      # до import app
+import asyncio, itertools, random, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, List, Optional
+
+from metrics import REGISTRY
+
+DATABASE_URL = "stub://in-memory"
+
+POOL_ACQUIRE_SECONDS = REGISTRY.histogram("db_pool_acquire_seconds", "Wait time for a pool connection")
+POOL_IN_USE = REGISTRY.gauge("db_pool_in_use", "Connections currently checked out")
+QUERY_SECONDS = REGISTRY.histogram("db_query_seconds", "Query duration by statement", ["query"])
+
+
+class FakePool:
+    def __init__(self, size: int = 5, latency: float = 0.005, jitter: float = 0.5):
+        self.size = size
+        self.latency = latency
+        self.jitter = jitter
+        self._sem = asyncio.Semaphore(size)
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquires = 0
+        self.waited = 0  # acquire, которым пришлось ждать свободное соединение
+
+    @asynccontextmanager
+    async def acquire(self, timeout: Optional[float] = None):
+        t0 = time.perf_counter()
+        if self._sem.locked():
+            self.waited += 1
+        await self._sem.acquire()
+        POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - t0)
+        self.acquires += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        POOL_IN_USE.set(self.in_use)
+        try:
+            yield self
+        finally:
+            self.in_use -= 1
+            POOL_IN_USE.set(self.in_use)
+            self._sem.release()
+
+    async def query(self, name: str, rows: int = 1) -> None:
+        async with self.acquire():
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.latency * (1 + self.jitter * random.random()) * max(1, rows) ** 0.25)
+            QUERY_SECONDS.observe(time.perf_counter() - t0, query=name)
+
+    async def fetch(self, query: str, *args, timeout: Optional[float] = None) -> List[dict]:
+        """Только выборки, которые бот делает через pool.fetch; имя — из комментария /* name */."""
+        name = query.split("/*", 1)[1].split("*/", 1)[0].strip() if "/*" in query else ""
+        if name != "export_results":
+            raise NotImplementedError(f"fake_db: pool.fetch for {name or query!r}")
+        user_id, _date_from, _date_to, after_id, limit = args  # дат у стаба нет — период не фильтруется
+        page = [
+            dict(zip(EXPORT_COLUMNS, (i, sessions[r[0]][0], sessions[r[0]][1], *r[1:10], None)))
+            for i, r in enumerate(results, 1)
+            if i > after_id and sessions.get(r[0], [None])[0] == user_id
+        ][:limit]
+        await self.query(name, rows=len(page))
+        return page
+
+    def get_size(self) -> int:
+        return self.size
+
+    def stats(self) -> dict:
+        wait = POOL_ACQUIRE_SECONDS.snapshot()
+        return {
+            "pooler": "stub",
+            "max_size": self.size,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "acquires": self.acquires,
+            "waited": self.waited,
+            "acquire_avg_ms": round(wait["avg"] * 1000, 2),
+            "acquire_p95_ms": round(wait["p95"] * 1000, 2),
+            "acquire_max_ms": round(wait["max"] * 1000, 2),
+        }
+
+
+_POOL: Optional[FakePool] = None
+_users = {}
+_ids = itertools.count(1)
+sessions = {}
+results: List[tuple] = []  # как append_result: (session_id, item_index, ..., balance_after[, word_id])
+EXPORT_COLUMNS = ["id", "user_id", "level", "item_index", "sentence_en", "sentence_ru",
+                  "truth", "user_choice", "employee_card", "outcome", "delta", "balance_after", "created_at"]
+
+
+def configure(pool_size: int = 5, latency: float = 0.005) -> FakePool:
+    global _POOL
+    _POOL = FakePool(pool_size, latency)
+    return _POOL
+
+
+async def get_pool() -> FakePool:
+    if _POOL is None:
+        configure()
+    return _POOL
+
+
+def current_pool() -> Optional[FakePool]:
+    return _POOL
+
+
+async def warm_up(timeout: float = 10.0) -> dict:
+    pool = await get_pool()
+    return {"connections": pool.size}
+
+
+async def ensure_schema() -> None:
+    pass
+
+
+listen = None
+
+
+async def ensure_user(tg_id: int) -> int:
+    uid = _users.get(tg_id)
+    if uid is None:
+        await (await get_pool()).query("user_upsert")
+        uid = _users[tg_id] = next(_ids)
+    return uid
+
+
+async def start_session(user_id: int, level: str, client_key=None, timeout=None) -> int:
+    await (await get_pool()).query("session_start")
+    sid = next(_ids)
+    sessions[sid] = [user_id, level, None]
+    return sid
+
+
+async def begin_session(tg_id: int, level: str):
+    uid = await ensure_user(tg_id)
+    return uid, await start_session(uid, level)
+
+
+def db_status() -> dict:
+    return {"circuit": "closed", "failures": 0}
+
+
+async def finish_session(session_id: int, final_balance: int) -> None:
+    await (await get_pool()).query("session_finish")
+    if session_id in sessions:
+        sessions[session_id][2] = final_balance
+
+
+async def append_result(*record) -> None:
+    await (await get_pool()).query("result_insert")
+    results.append(tuple(record))
+
+
+async def get_user_stats(user_id: int) -> dict:
+    await (await get_pool()).query("user_stats_get")
+    mine = [r for r in results if sessions.get(r[0], [None])[0] == user_id]
+    return {
+        "total": len(mine),
+        "correct": sum(1 for r in mine if r[4] == r[5]),
+        "sum_delta": sum(r[8] or 0 for r in mine),
+    }
+
+
+file_ids = {}  # (bot_id, key) -> file_id
+
+
+async def load_file_id(bot_id: int, key: str) -> Optional[str]:
+    await (await get_pool()).query("file_id_get")
+    return file_ids.get((bot_id, key))
+
+
+async def save_file_id(bot_id: int, key: str, file_id: str, kind: str, size: int = 0) -> None:
+    await (await get_pool()).query("file_id_put")
+    head, sep, _ = key.partition("#")
+    if sep:
+        for k in [k for k in file_ids if k[0] == bot_id and k[1].startswith(head + sep) and k[1] != key]:
+            del file_ids[k]
+    file_ids[(bot_id, key)] = file_id
+
+
+async def forget_file_id(bot_id: int, key: str) -> None:
+    await (await get_pool()).query("file_id_forget")
+    file_ids.pop((bot_id, key), None)
+
+
+mastery = {}  # (user_id, word_id) -> [reps, interval_days, due_at]; упрощённый SM-2 без ease
+
+
+def _rollup_mastery(batch) -> None:
+    now = time.time()
+    for rec in batch:
+        wid = rec[10] if len(rec) > 10 else None
+        if not wid or wid < 0 or rec[0] not in sessions:
+            continue
+        m = mastery.setdefault((sessions[rec[0]][0], wid), [0, 0, now])
+        if rec[4] == rec[5]:
+            m[0] += 1
+            m[1] = 1 if m[0] == 1 else (6 if m[0] == 2 else round(m[1] * 2.5))
+        else:
+            m[0], m[1] = 0, 1
+        m[2] = now + m[1] * 86400
+
+
+async def pick_review_deck(user_id: int, level: str, pos: str, candidates: List[int], k: int) -> List[int]:
+    await (await get_pool()).query("review_deck")
+    now = time.time()
+    # уровень слова стаб не знает — «свои» слова берём только среди кандидатов этого уровня
+    mine = sorted((m[2], wid) for (uid, wid), m in mastery.items() if uid == user_id)
+    level_ids = set(candidates)
+    due = [wid for at, wid in mine if at <= now and wid in level_ids]
+    new = [wid for wid in candidates if (user_id, wid) not in mastery]
+    later = [wid for at, wid in mine if at > now and wid in level_ids]
+    return (due + new + later)[:k]
+
+
+_leaderboard: List[dict] = []
+
+
+async def refresh_leaderboard(timeout: Optional[float] = None) -> bool:
+    """То же представление, что в db.py: лучший баланс по уровню и в целом, rank() с пропусками."""
+    global _leaderboard
+    await (await get_pool()).query("leaderboard_refresh", rows=len(sessions))
+    agg = {}
+    for uid, level, balance in sessions.values():
+        if balance is None:
+            continue
+        for scope in ("all", level):
+            a = agg.setdefault((scope, uid), [balance, 0])
+            a[0] = max(a[0], balance)
+            a[1] += 1
+    rows = []
+    for scope in sorted({k[0] for k in agg}):
+        mine = sorted(((v[0], v[1], uid) for (sc, uid), v in agg.items() if sc == scope), key=lambda t: -t[0])
+        for i, (best, games, uid) in enumerate(mine):
+            rnk = i + 1 if i == 0 or best != mine[i - 1][0] else rows[-1]["rnk"]
+            rows.append({"scope": scope, "rnk": rnk, "user_id": uid, "best": best, "games": games, "players": len(mine)})
+    _leaderboard = rows
+    return True
+
+
+async def leaderboard_top(limit: int = 10) -> List[dict]:
+    await (await get_pool()).query("leaderboard_top")
+    return [r for r in _leaderboard if r["rnk"] <= limit]
+
+
+async def leaderboard_rank(user_id: int) -> dict:
+    await (await get_pool()).query("leaderboard_rank")
+    return {r["scope"]: r for r in _leaderboard if r["user_id"] == user_id}
+
+
+def query_stats(top: int = 10) -> List[dict]:
+    rows = []
+    for (label,) in QUERY_SECONDS.label_values():
+        st = QUERY_SECONDS.snapshot(query=label)
+        rows.append({"query": label, **st, "total": st["avg"] * st["count"]})
+    rows.sort(key=lambda r: r["total"], reverse=True)
+    return rows[:top]
+
+
+class FakeResultWriter:
+    """Как db.ResultWriter: очередь + фоновые пачки, только «пишет» в список."""
+
+    def __init__(self, batch_size: int = 200, flush_sec: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self._pending: Deque[tuple] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+
+    @property
+    def backlog(self) -> int:
+        return len(self._pending)
+
+    def submit(self, record: tuple) -> None:
+        self._pending.append(record)
+
+    async def flush(self) -> int:
+        total = 0
+        while self._pending:
+            n = min(self.batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(n)]
+            await (await get_pool()).query("results_batch", rows=n)
+            results.extend(batch)
+            _rollup_mastery(batch)
+            total += n
+        self.written += total
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+RESULT_WRITER = FakeResultWriter()
+
+
+def log_result(*record, word_id: Optional[int] = None) -> None:
+    RESULT_WRITER.submit((*record, word_id))
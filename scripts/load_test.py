@@ -0,0 +1,194 @@
+# scripts/load_test.py
+# Нагрузочный стенд диспетчера: тысячи виртуальных игроков проходят
+# /start → уровень → start_day → утро → вечер (верю/не верю, споры) через dp.feed_update.
+# Telegram подменён MockSession; БД — in-memory заглушка (fake_db.py) или настоящий Postgres.
+#
+#   python scripts/load_test.py --players 2000 --concurrency 500
+#   python scripts/load_test.py --players 500 --db-latency 0.02 --pool-size 5   # где упрёмся в пул
+#   python scripts/load_test.py --db real        # DATABASE_URL из env/.env, схема уже должна быть
+#   python scripts/load_test.py --json out.json  # отчёт машиночитаемо
+import os, sys, json, time, random, asyncio, argparse, statistics
+from collections import defaultdict
+from pathlib import Path
+
+from mock_telegram import FAKE_TOKEN, mock_bot, message_update, callback_update
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+LEVELS = ["A2", "B1", "B2", "C1", "C2"]
+
+
+def pct(samples, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def action_of(update: dict) -> str:
+    # метка для латентности: /команда или callback без аргументов и шага
+    if "message" in update:
+        return update["message"]["text"].split()[0]
+    data = update["callback_query"]["data"].split("|")[0]
+    return data.split(":")[0]
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.ids = iter(range(1, 10**9))
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.updates = 0
+        self.days_done = 0
+
+    async def feed(self, raw: dict) -> None:
+        from aiogram.types import Update
+        upd = Update.model_validate(raw, context={"bot": self.bot})
+        action = action_of(raw)
+        t0 = time.perf_counter()
+        try:
+            await self.app.dp.feed_update(self.bot, upd)
+        except Exception as e:
+            self.errors[action] += 1
+            if self.errors[action] <= 3:
+                print(f"{action} ERROR:", repr(e))
+        self.latency[action].append(time.perf_counter() - t0)
+        self.updates += 1
+
+    async def think(self) -> None:
+        if self.args.think:
+            await asyncio.sleep(random.random() * self.args.think)
+
+    async def player(self, uid: int) -> None:
+        session = self.bot.session
+        cb = lambda data: callback_update(next(self.ids), uid, data)
+        await self.feed(message_update(next(self.ids), uid, "/start"))
+        await self.think()
+        await self.feed(cb(f"set_level:{random.choice(self.args.levels)}"))
+        for _ in range(self.args.days):
+            await self.think()
+            await self.feed(cb("start_day"))
+            # дальше — только кнопки последней клавиатуры, как живой игрок
+            for _step in range(200):
+                buttons = session.buttons(uid)
+                game = [b for b in buttons if b.split("|")[0].split(":")[0] in ("morning_next", "believe", "dispute")]
+                if not game:
+                    break
+                await self.think()
+                await self.feed(cb(random.choice(game)))
+            self.days_done += 1
+
+    async def run(self) -> dict:
+        a = self.args
+        sys.path.insert(0, str(BOT_DIR))
+        os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+        if a.db == "stub":
+            import fake_db
+            fake_db.configure(pool_size=a.pool_size, latency=a.db_latency)
+            sys.modules["db"] = fake_db
+        import app
+        from bundle import load_bundle
+        from sender import SendScheduler, setup_sender
+        from observability import handler_stats, instrument_bot
+
+        self.app = app
+        self.bot = mock_bot(latency=a.api_latency)
+        if a.tg_limits:
+            setup_sender(self.bot)
+        else:
+            setup_sender(self.bot, SendScheduler(global_rate=1e9, chat_rate=1e9, chat_burst=1e9))
+        instrument_bot(self.bot)
+
+        app.CONTENT.bundle = load_bundle(app.CONTENT_BUNDLE_PATH)
+        if a.db == "stub":
+            app.CONTENT.use_bundle()
+        else:
+            await app.CONTENT.start()
+        if app.RESULT_WRITER:
+            app.RESULT_WRITER.start()
+
+        sem = asyncio.Semaphore(a.concurrency)
+
+        async def one(uid):
+            async with sem:
+                await self.player(uid)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(1_000_000 + i) for i in range(a.players)))
+        wall = time.perf_counter() - t0
+
+        if app.RESULT_WRITER:
+            await app.RESULT_WRITER.stop()
+        await app.CONTENT.stop()
+        pool = app.current_pool()
+
+        return {
+            "players": a.players,
+            "days": self.days_done,
+            "updates": self.updates,
+            "wall_s": round(wall, 3),
+            "updates_per_s": round(self.updates / wall, 1) if wall else 0.0,
+            "actions": {
+                k: {
+                    "count": len(v),
+                    "errors": self.errors.get(k, 0),
+                    "p50_ms": round(pct(v, 0.50) * 1000, 2),
+                    "p95_ms": round(pct(v, 0.95) * 1000, 2),
+                    "p99_ms": round(pct(v, 0.99) * 1000, 2),
+                    "max_ms": round(max(v) * 1000, 2),
+                }
+                for k, v in sorted(self.latency.items())
+            },
+            "handlers": handler_stats(),
+            "api_calls": dict(self.bot.session.calls),
+            "pool": pool.stats() if pool is not None else None,
+            "dropped_callbacks": dict(app.GUARD.dropped),
+        }
+
+
+def print_report(r: dict) -> None:
+    print(f"\nplayers {r['players']}, days {r['days']}, updates {r['updates']} in {r['wall_s']} s "
+          f"→ {r['updates_per_s']} upd/s")
+    print("\nper action (exact, end-to-end feed_update):")
+    print(f"  {'action':<14}{'count':>8}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  ms")
+    for k, v in r["actions"].items():
+        print(f"  {k:<14}{v['count']:>8}{v['errors']:>6}{v['p50_ms']:>9}{v['p95_ms']:>9}{v['p99_ms']:>9}{v['max_ms']:>9}")
+    print("\nper handler (middleware histogram, bucket resolution):")
+    for h in r["handlers"]:
+        print(f"  {h['handler']:<14}{h['count']:>8}{h['errors']:>6}{h['p50']:>9}{h['p95']:>9}{h['p99']:>9}{h['max']:>9}")
+    print("\nBot API calls:", r["api_calls"])
+    print("dropped callbacks:", r["dropped_callbacks"])
+    if r["pool"]:
+        print("pool:", ", ".join(f"{k}={v}" for k, v in r["pool"].items()))
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--players", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=200, help="сколько игроков играют одновременно")
+    ap.add_argument("--days", type=int, default=1, help="игровых дней на игрока")
+    ap.add_argument("--levels", nargs="+", default=LEVELS)
+    ap.add_argument("--think", type=float, default=0.0, help="пауза игрока между нажатиями (0..think), сек")
+    ap.add_argument("--api-latency", type=float, default=0.02, help="имитация задержки Bot API, сек")
+    ap.add_argument("--tg-limits", action="store_true", help="включить реальные лимиты отправки (SendScheduler)")
+    ap.add_argument("--db", choices=["stub", "real"], default="stub")
+    ap.add_argument("--pool-size", type=int, default=5, help="размер пула заглушки")
+    ap.add_argument("--db-latency", type=float, default=0.005, help="задержка «запроса» заглушки, сек")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="сохранить отчёт в файл")
+    args = ap.parse_args()
+    random.seed(args.seed)
+
+    if args.db == "real":
+        from dotenv import load_dotenv
+        load_dotenv()
+
+    report = await Harness(args).run()
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nreport → {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+# scripts/mock_telegram.py
+# Поддельная сессия aiogram: Bot API не вызывается, ответы собираются локально.
+# Нужна стендам нагрузки/бенчмаркам, чтобы мерить бота без Telegram.
+import asyncio, time, itertools
+from collections import Counter
+from typing import Any, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message, User
+
+FAKE_TOKEN = "123456:TEST-TOKEN-FOR-LOCAL-HARNESS"
+
+
+class MockSession(BaseSession):
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.uploads = 0
+        # последняя клавиатура в каждом чате — виртуальный игрок «нажимает» её кнопки
+        self.markups: dict = {}
+        self._ids = itertools.count(1)
+
+    async def close(self) -> None:
+        pass
+
+    def buttons(self, chat_id: int) -> list:
+        """callback_data кнопок последней клавиатуры в чате."""
+        markup = self.markups.get(chat_id)
+        rows = getattr(markup, "inline_keyboard", None) or []
+        return [b.callback_data for row in rows for b in row if b.callback_data]
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    def _message(self, bot: Bot, method: TelegramMethod) -> Message:
+        mid = next(self._ids)
+        chat_id = getattr(method, "chat_id", 0) or 0
+        data = {
+            "message_id": mid,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if getattr(method, "text", None) is not None:
+            data["text"] = method.text
+        doc = getattr(method, "document", None)
+        if doc is not None:
+            if not isinstance(doc, str):
+                self.uploads += 1
+            data["document"] = {"file_id": f"file{mid}", "file_unique_id": f"u{mid}"}
+        photo = getattr(method, "photo", None)
+        if photo is not None:
+            if not isinstance(photo, str):
+                self.uploads += 1
+            data["photo"] = [{"file_id": f"file{mid}", "file_unique_id": f"u{mid}", "width": 1, "height": 1}]
+        return Message.model_validate(data, context={"bot": bot})
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and hasattr(method, "reply_markup"):
+            self.markups[chat_id] = method.reply_markup
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = getattr(method, "__returning__", None)
+        if returning is Message:
+            return self._message(bot, method)
+        if returning is User:
+            return User(id=123456, is_bot=True, first_name="MockBot")
+        return True
+
+
+def mock_bot(latency: float = 0.0) -> Bot:
+    return Bot(FAKE_TOKEN, session=MockSession(latency=latency))
+
+
+# --- синтетические апдейты ---
+def user_json(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": f"Player{uid}"}
+
+
+def message_update(update_id: int, uid: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private"},
+            "from": user_json(uid),
+            "text": text,
+        },
+    }
+
+
+def callback_update(update_id: int, uid: int, data: str, message_id: int = 1) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": f"cb{update_id}",
+            "from": user_json(uid),
+            "chat_instance": f"ci{uid}",
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "MockBot"},
+                "text": "…",
+            },
+        },
+    }
@@ -1,13 +1,23 @@
 # scripts/seed_content.py
-import os, csv, asyncio, asyncpg, ssl, certifi
+#   python scripts/seed_content.py                 — bulk: COPY в staging-таблицы + set-based merge
+#   python scripts/seed_content.py --mode rows     — по строке на запрос (старый путь)
+#   python scripts/seed_content.py --force         — сидить, даже если контент не менялся
+import os, sys, csv, json, hashlib, asyncio, asyncpg, ssl, certifi, argparse
 from dotenv import load_dotenv
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bot"))
+from distractors import generate_bad_rows
+
 load_dotenv()  # читает .env, если есть в корне
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+WORDS_CSV = Path("content/words.csv")
+EXAMPLES_CSV = Path("content/examples.csv")
+GENERATOR_VERSION = 1  # поднять при изменении distractors.generate_bad_rows
+
 def ensure_sslmode(dsn: str, mode: str = "verify-full") -> str:
     # добавить/заменить sslmode=verify-full в строке подключения
     parts = urlparse(dsn)
@@ -25,7 +35,177 @@ def make_ssl_ctx() -> ssl.SSLContext:
     # иначе — certifi bundle
     return ssl.create_default_context(cafile=certifi.where())
 
+def content_hash(per_example: int, seed: int) -> str:
+    h = hashlib.sha256()
+    for p in (WORDS_CSV, EXAMPLES_CSV):
+        h.update(p.read_bytes())
+    h.update(json.dumps([GENERATOR_VERSION, per_example, seed]).encode())
+    return h.hexdigest()
+
+def read_csv(path: Path):
+    with open(path, encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+async def ensure_seed_schema(conn) -> None:
+    await conn.execute("""
+        alter table examples
+          add column if not exists source_example_id bigint references examples(id) on delete cascade,
+          add column if not exists replacement text,
+          add column if not exists highlight text
+    """)
+    await conn.execute("""
+        create table if not exists content_meta (
+          key text primary key,
+          value text not null,
+          updated_at timestamptz not null default now()
+        )
+    """)
+
+async def generate_bad_examples(conn, per_example: int = 3, seed: int = 0) -> int:
+    """
+    Этап генерации: для каждого ok/alt_ok примера — до per_example неверных вариантов
+    (ключевое слово подменено на другое слово того же level+pos). Хранятся как kind='bad'
+    со ссылкой на исходный пример; бот вечером только выбирает строки.
+    Ранее сгенерированные строки пересоздаются, ручные kind='bad' (без source) не трогаем.
+    """
+    words = {r["id"]: (r["level"], r["pos"], r["word"])
+             for r in await conn.fetch("select id, level, pos, word from words")}
+    oks = [(r["id"], r["word_id"], r["en"], r["ru"])
+           for r in await conn.fetch("select id, word_id, en, ru from examples where kind in ('ok','alt_ok')")]
+    rows = generate_bad_rows(words, oks, per_example=per_example, seed=seed)
+    async with conn.transaction():
+        await conn.execute("delete from examples where kind='bad' and source_example_id is not null")
+        await conn.execute("""
+            create temp table stage_bad (
+              word_id bigint, source_example_id bigint, en text, ru text, replacement text, highlight text
+            ) on commit drop
+        """)
+        await conn.copy_records_to_table(
+            "stage_bad", records=rows,
+            columns=["word_id", "source_example_id", "en", "ru", "replacement", "highlight"]
+        )
+        await conn.execute("""
+            insert into examples(word_id, kind, en, ru, source_example_id, replacement, highlight)
+            select word_id, 'bad', en, ru, source_example_id, replacement, highlight from stage_bad
+            on conflict do nothing
+        """)
+    return len(rows)
+
+# --- bulk ---
+async def merge_words(conn, rows) -> dict:
+    await conn.execute("""
+        create temp table stage_words (level text, pos text, word text, translation text) on commit drop
+    """)
+    await conn.copy_records_to_table(
+        "stage_words", records=[(r["level"], r["pos"], r["word"], r["translation"]) for r in rows],
+        columns=["level", "pos", "word", "translation"]
+    )
+    row = await conn.fetchrow("""
+        with up as (
+          insert into words(level, pos, word, translation)
+          select distinct on (level, pos, word) level, pos, word, translation
+          from stage_words
+          order by level, pos, word
+          on conflict (level, pos, word) do update
+            set translation = excluded.translation
+            where words.translation is distinct from excluded.translation
+          returning (xmax = 0) as inserted
+        )
+        select
+          count(*) filter (where inserted) as inserted,
+          count(*) filter (where not inserted) as updated,
+          (select count(distinct (level, pos, word)) from stage_words) as total
+        from up
+    """)
+    return {"inserted": row["inserted"], "updated": row["updated"],
+            "unchanged": row["total"] - row["inserted"] - row["updated"]}
+
+async def merge_examples(conn, rows, word_keys) -> dict:
+    # word_keys: слово -> (level, pos) — как в старом пути, побеждает последняя строка words.csv
+    await conn.execute("""
+        create temp table stage_examples (level text, pos text, word text, kind text, en text, ru text) on commit drop
+    """)
+    await conn.copy_records_to_table(
+        "stage_examples",
+        records=[(*word_keys[r["word"]], r["word"], r["kind"], r["en"], r["ru"]) for r in rows],
+        columns=["level", "pos", "word", "kind", "en", "ru"]
+    )
+    await conn.execute("""
+        create temp table stage_examples_ids on commit drop as
+        select distinct on (w.id, se.kind, se.en) w.id as word_id, se.kind, se.en, se.ru
+        from stage_examples se
+        join words w on w.level = se.level and w.pos = se.pos and w.word = se.word
+        order by w.id, se.kind, se.en
+    """)
+    updated = await conn.fetchval("""
+        with u as (
+          update examples e set ru = s.ru
+          from stage_examples_ids s
+          where e.word_id = s.word_id and e.kind = s.kind and e.en = s.en
+            and e.ru is distinct from s.ru
+          returning 1
+        ) select count(*) from u
+    """)
+    inserted = await conn.fetchval("""
+        with i as (
+          insert into examples(word_id, kind, en, ru)
+          select s.word_id, s.kind, s.en, s.ru
+          from stage_examples_ids s
+          where not exists (
+            select 1 from examples e
+            where e.word_id = s.word_id and e.kind = s.kind and e.en = s.en
+          )
+          on conflict do nothing
+          returning 1
+        ) select count(*) from i
+    """)
+    total = await conn.fetchval("select count(*) from stage_examples_ids")
+    return {"inserted": inserted, "updated": updated, "unchanged": total - inserted - updated}
+
+async def seed_bulk(conn, args) -> None:
+    words, examples = read_csv(WORDS_CSV), read_csv(EXAMPLES_CSV)
+    async with conn.transaction():
+        w = await merge_words(conn, words)
+        e = await merge_examples(conn, examples, {r["word"]: (r["level"], r["pos"]) for r in words})
+        print(f"words:    inserted {w['inserted']}, updated {w['updated']}, unchanged {w['unchanged']}")
+        print(f"examples: inserted {e['inserted']}, updated {e['updated']}, unchanged {e['unchanged']}")
+        if args.bad_per_example > 0:
+            n = await generate_bad_examples(conn, per_example=args.bad_per_example, seed=args.seed)
+            print(f"Generated bad examples: {n}")
+
+# --- по строке (старый путь) ---
+async def seed_rows(conn, args) -> None:
+    ids = {}
+    for row in read_csv(WORDS_CSV):
+        w_id = await conn.fetchval("""
+            insert into words(level,pos,word,translation)
+            values($1,$2,$3,$4)
+            on conflict (level,pos,word) do update
+              set translation = excluded.translation
+            returning id
+        """, row['level'], row['pos'], row['word'], row['translation'])
+        ids[row['word']] = w_id
+
+    for row in read_csv(EXAMPLES_CSV):
+        w_id = ids[row['word']]
+        await conn.execute("""
+            insert into examples(word_id, kind, en, ru)
+            values($1,$2,$3,$4)
+            on conflict do nothing
+        """, w_id, row['kind'], row['en'], row['ru'])
+
+    if args.bad_per_example > 0:
+        n = await generate_bad_examples(conn, per_example=args.bad_per_example, seed=args.seed)
+        print(f"Generated bad examples: {n}")
+
 async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["bulk", "rows"], default="bulk")
+    ap.add_argument("--force", action="store_true", help="сидить, даже если хэш контента не изменился")
+    ap.add_argument("--bad-per-example", type=int, default=3, help="сколько неверных вариантов на пример (0 — не генерировать)")
+    ap.add_argument("--seed", type=int, default=0, help="seed генерации (детерминированный результат)")
+    args = ap.parse_args()
+
     if not DATABASE_URL:
         raise RuntimeError("DATABASE_URL is not set (env or .env)")
 
@@ -34,31 +214,29 @@ async def main():
 
     # Если используешь Transaction Pooler (порт 6543) — выключаем prepared statements
     conn = await asyncpg.connect(dsn, ssl=ssl_ctx, statement_cache_size=0)
+    try:
+        await ensure_seed_schema(conn)
 
-    ids = {}
-    with open('content/words.csv', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            w_id = await conn.fetchval("""
-                insert into words(level,pos,word,translation)
-                values($1,$2,$3,$4)
-                on conflict (level,pos,word) do update
-                  set translation = excluded.translation
-                returning id
-            """, row['level'], row['pos'], row['word'], row['translation'])
-            if not w_id:
-                w_id = await conn.fetchval("select id from words where word=$1", row['word'])
-            ids[row['word']] = w_id
-
-    with open('content/examples.csv', encoding='utf-8') as f:
-        for row in csv.DictReader(f):
-            w_id = ids[row['word']]
-            await conn.execute("""
-                insert into examples(word_id, kind, en, ru)
-                values($1,$2,$3,$4)
-                on conflict do nothing
-            """, w_id, row['kind'], row['en'], row['ru'])
-
-    await conn.close()
+        digest = content_hash(args.bad_per_example, args.seed)
+        last = await conn.fetchval("select value from content_meta where key='seed_hash'")
+        if last == digest and not args.force:
+            print(f"Seed skipped: content unchanged ({digest[:12]})")
+            return
+
+        if args.mode == "bulk":
+            await seed_bulk(conn, args)
+        else:
+            await seed_rows(conn, args)
+
+        await conn.execute("""
+            insert into content_meta(key, value, updated_at) values('seed_hash', $1, now())
+            on conflict (key) do update set value = excluded.value, updated_at = now()
+        """, digest)
+
+        # бот держит контент в памяти — просим перечитать
+        await conn.execute("select pg_notify('content_changed', '')")
+    finally:
+        await conn.close()
     print("Seed OK")
 
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+# scripts/webhook_bench.py
+# Нагрузочный стенд для webhook-режима: шлёт синтетические апдейты POST-ом и меряет пропускную способность.
+#
+#   python scripts/webhook_bench.py --updates 5000 --concurrency 200
+#       поднимает webhook-сервер бота в этом же процессе (Telegram подменён MockSession)
+#   python scripts/webhook_bench.py --url http://localhost:8080/tg/webhook --secret ...
+#       бьёт в уже запущенный сервер
+import os, sys, time, asyncio, argparse, statistics
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from mock_telegram import FAKE_TOKEN, mock_bot, message_update, callback_update
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+
+
+def synthetic(n: int, players: int):
+    # у каждого игрока: /start, затем «Какой процесс?» и выбор уровня
+    flow = [
+        lambda i, uid: message_update(i, uid, "/start"),
+        lambda i, uid: callback_update(i, uid, "show_process"),
+        lambda i, uid: callback_update(i, uid, "set_level:B1"),
+    ]
+    for i in range(n):
+        uid = 1_000_000 + i % players
+        yield flow[(i // players) % len(flow)](i + 1, uid)
+
+
+async def start_inprocess(secret: str, max_inflight: int, latency: float):
+    os.environ.setdefault("BOT_TOKEN", FAKE_TOKEN)
+    sys.path.insert(0, str(BOT_DIR))
+    import app as botapp
+    from webhook import make_app
+
+    bot = mock_bot(latency=latency)
+    app = make_app(bot, botapp.dp, path="/tg/webhook", secret=secret, max_inflight=max_inflight)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, app["feeder"], bot, f"http://127.0.0.1:{port}/tg/webhook"
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url")
+    ap.add_argument("--secret", default="bench-secret")
+    ap.add_argument("--updates", type=int, default=2000)
+    ap.add_argument("--players", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--max-inflight", type=int, default=100)
+    ap.add_argument("--api-latency", type=float, default=0.05, help="имитация задержки Bot API, сек")
+    args = ap.parse_args()
+
+    runner = feeder = bot = None
+    url = args.url
+    if not url:
+        runner, feeder, bot, url = await start_inprocess(args.secret, args.max_inflight, args.api_latency)
+
+    updates = list(synthetic(args.updates, args.players))
+    queue: asyncio.Queue = asyncio.Queue()
+    for u in updates:
+        queue.put_nowait(u)
+
+    latencies, statuses = [], {}
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret}
+
+    async def worker(session: aiohttp.ClientSession):
+        while not queue.empty():
+            u = queue.get_nowait()
+            t0 = time.perf_counter()
+            async with session.post(url, json=u, headers=headers) as resp:
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    t_accepted = time.perf_counter() - t_start
+
+    if feeder is not None:
+        await feeder.drain(timeout=300)
+    t_done = time.perf_counter() - t_start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"updates: {len(updates)}  concurrency: {args.concurrency}  statuses: {statuses}")
+    print(f"accepted: {len(updates) / t_accepted:8.1f} upd/s   ({t_accepted:.2f}s)")
+    print(f"HTTP ack: p50 {pct(0.50):.2f} ms  p95 {pct(0.95):.2f} ms  p99 {pct(0.99):.2f} ms  "
+          f"mean {statistics.mean(latencies) * 1000:.2f} ms")
+    if feeder is not None:
+        print(f"processed: {len(updates) / t_done:8.1f} upd/s   ({t_done:.2f}s)  "
+              f"ok={feeder.processed} failed={feeder.failed}")
+        print(f"Bot API calls (mocked): {dict(bot.session.calls)}")
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())